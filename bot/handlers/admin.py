@@ -7,7 +7,8 @@ from aiogram.types import Message
 from loguru import logger
 import aiogram
 
-from .common import register_all_chat_members
+from ..modules import member_sync
+from ..modules.bot_permissions import get_bot_member, is_admin_with_manage_chat
 from ..modules.no_sql.user_db import get_user, get_users_by_chat_id, set_server_owner, remove_server_owner, \
     register_chat_member, update_user, reset_activity_count, get_known_chats
 
@@ -92,8 +93,8 @@ async def list_users_handler(message: Message):
 
     try:
         # Проверяем права бота
-        bot_member = await message.bot.get_chat_member(chat_id=chat_id, user_id=message.bot.id)
-        if bot_member.status != "administrator" or not bot_member.can_manage_chat:
+        bot_member = await get_bot_member(message.bot, chat_id)
+        if not is_admin_with_manage_chat(bot_member):
             await message.answer(
                 "Бот не имеет прав администратора или 'Manage Chat'. Пожалуйста, предоставьте необходимые права.")
             logger.warning(f"Бот не имеет прав администратора или 'Manage Chat' в chat_id={chat_id}")
@@ -106,8 +107,8 @@ async def list_users_handler(message: Message):
             logger.warning(f"Пользователь {user_id} попытался выполнить /list_users без прав, chat_id={chat_id}")
             return
 
-        # Регистрируем всех текущих участников чата
-        await register_all_chat_members(chat_id, message.bot)
+        # Регистрация участников идет в фоне; список строится по уже известным участникам
+        member_sync.start_sync(chat_id, message.bot)
 
         # Получаем список пользователей
         users = await get_users_by_chat_id(chat_id)
@@ -194,7 +195,7 @@ async def check_bot_permissions_handler(message: Message):
         permissions_report = []
         for chat_id in known_chats:
             try:
-                bot_member = await message.bot.get_chat_member(chat_id=chat_id, user_id=message.bot.id)
+                bot_member = await get_bot_member(message.bot, chat_id, refresh=True)
                 status = bot_member.status
                 can_manage_chat = bot_member.can_manage_chat if status == "administrator" else False
                 permissions_report.append(
@@ -5,16 +5,15 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import Message, ChatMemberOwner, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.filters import Command
-from aiogram.exceptions import TelegramRetryAfter, TelegramBadRequest
 from loguru import logger
 import aiogram
+import asyncio
 import time
 import re
-import unicodedata
 from typing import Optional, Dict
-import aiohttp
-import asyncio
+from aiocache import cached
 from ..modules.no_sql.user_db import (
+    User,
     get_user,
     add_warning,
     mute_user,
@@ -25,11 +24,16 @@ from ..modules.no_sql.user_db import (
     OWNER_BOT_ID,
     set_server_owner,
     update_user,
-    ensure_user_exists,
+    get_message_context,
     get_moderation_logs
 )
-from ..modules.no_sql.redis_client import redis_client, get_settings, save_settings, kick_inactive_users, is_spamming, get_ttl, reset_spam_state
-import hashlib
+from ..modules.bot_permissions import get_bot_member
+from ..modules.antispam_rules import get_compiled_rules
+from ..modules.dnsbl import find_listed_domain
+from ..modules.local_counters import reset_state as reset_local_spam_state
+from ..modules import send_queue
+from ..modules.no_sql.redis_client import get_settings, save_settings, kick_inactive_users, start_kick_inactive, \
+    reset_spam_state
 from ..keyboards.antispam import get_main_menu, get_filter_menu, get_filter_settings_menu, get_action_menu
 
 # Проверка версии aiogram
@@ -149,28 +153,13 @@ async def parse_duration(text: str) -> Optional[int]:
         logger.error(f"Ошибка при парсинге длительности '{text}': {str(e)}")
         return None
 
-async def check_dnsbl(domain: str) -> bool:
-    """Проверяет домен против DNSBL (например, zen.spamhaus.org) асинхронно."""
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"http://zen.spamhaus.org/query/dnsbl?domain={domain}") as response:
-                return response.status == 200
-    except Exception as e:
-        logger.error(f"Ошибка при проверке DNSBL для домена {domain}: {str(e)}")
-        return False
-
-async def get_message_hash(text: str) -> str:
-    """Генерирует хэш сообщения для сравнения."""
-    normalized = unicodedata.normalize("NFKC", text.strip().lower())
-    return hashlib.md5(normalized.encode()).hexdigest()
-
 async def initialize_default_settings(chat_id: str) -> Dict:
     """Инициализирует настройки антиспама по умолчанию."""
     default_settings = {
         "enabled": False,
         "repeated_words": {"limit": 5, "action": "warn", "duration": 1800, "enabled": True},
         "repeated_messages": {"limit": 5, "action": "warn", "duration": 1800, "enabled": True},
-        "flood": {"limit": 5, "seconds": 10, "action": "mute", "duration": 1800, "enabled": True},
+        "flood": {"limit": 5, "seconds": 10, "mode": "fixed", "action": "mute", "duration": 1800, "enabled": True},
         "spam_words": {"words": [], "action": "ban", "duration": 86400, "enabled": True},
         "telegram_links": {"enabled": False, "action": "mute", "duration": 1800},
         "external_links": {"enabled": False, "action": "delete", "duration": 0},
@@ -190,37 +179,30 @@ async def initialize_default_settings(chat_id: str) -> Dict:
     await save_settings("antispam", str(chat_id), default_settings)
     return default_settings
 
-async def retry_on_flood_control(func, *args, max_retries=3, initial_delay=1, **kwargs):
-    """Выполняет функцию с повторными попытками при ошибке TooManyRequests."""
-    attempt = 0
-    delay = initial_delay
-    while attempt < max_retries:
-        try:
-            return await func(*args, **kwargs)
-        except TelegramRetryAfter as e:
-            logger.warning(f"TooManyRequests: retry after {e.retry_after} секунд, попытка {attempt + 1}/{max_retries}")
-            await asyncio.sleep(e.retry_after)
-            attempt += 1
-            delay *= 2  # Экспоненциальная задержка
-        except Exception as e:
-            logger.error(f"Ошибка при выполнении {func.__name__}: {str(e)}")
-            raise
-    logger.error(f"Достигнуто максимальное количество попыток ({max_retries}) для {func.__name__}")
-    raise TelegramRetryAfter(f"Max retries reached for {func.__name__}", retry_after=delay)
+async def retry_on_flood_control(func, *args, **kwargs):
+    """
+    Отправляет ответ или правку меню через очередь чата с учетом лимитов Bot API и не ждет отправки.
 
-async def notify_admins(bot: Bot, settings: Dict, user_id: int, chat_id: int, reason: str, action: str, message_text: str):
+    Ожидание после TelegramRetryAfter обрабатывается в send_queue, поэтому обработчик не держит
+    очередь обновлений чата (chat_serializer). Возвращает Future с результатом запроса.
+    """
+    return send_queue.enqueue_call(func, *args, **kwargs)
+
+async def notify_admins(bot: Bot, settings: Dict, user_id: int, chat_id: int, reason: str, action: str, message_text: str, user: Optional[User] = None):
     """Отправляет уведомление администраторам в admin_group, если она задана."""
     admin_group = settings.get("admin_group")
     if admin_group and isinstance(admin_group, str) and admin_group.startswith("-100"):
         try:
             await bot.get_chat(admin_group)
-            user = await get_user(user_id)
+            if user is None:
+                user = await get_user(user_id)
             user_mention = f"@{user.username}" if user.username else user.display_name or f"User {user_id}"
             keyboard = InlineKeyboardMarkup(inline_keyboard=[
                 [InlineKeyboardButton(text="Подтвердить", callback_data=f"spam_confirm_{user_id}_{chat_id}_{action}")],
                 [InlineKeyboardButton(text="Отменить", callback_data=f"spam_cancel_{user_id}_{chat_id}_{action}")]
             ])
-            await retry_on_flood_control(
+            send_queue.enqueue(
+                int(admin_group),
                 bot.send_message,
                 admin_group,
                 TEXTS["admin_notification"].format(
@@ -232,31 +214,37 @@ async def notify_admins(bot: Bot, settings: Dict, user_id: int, chat_id: int, re
                 ),
                 reply_markup=keyboard
             )
-            logger.info(f"Уведомление отправлено в admin_group={admin_group} для user_id={user_id}, chat_id={chat_id}, action={action}")
+            logger.info(f"Уведомление поставлено в очередь для admin_group={admin_group}, user_id={user_id}, chat_id={chat_id}, action={action}")
             return True
         except Exception as e:
             logger.error(f"Ошибка при отправке уведомления в admin_group={admin_group}: {str(e)}")
             return False
 
-async def check_spam(message: Message, bot: Bot) -> bool:
-    """Проверяет сообщения на спам и возвращает True, если спам обнаружен и обработан."""
+async def check_spam(message: Message, bot: Bot, user: Optional[User] = None) -> bool:
+    """
+    Проверяет сообщения на спам и возвращает True, если спам обнаружен и обработан.
+
+    Если передан user (уже загруженный через get_message_context), повторное чтение из MongoDB не выполняется.
+    """
     user_id = message.from_user.id
     chat_id = message.chat.id
     text = message.text or message.caption or ""
     try:
-        await ensure_user_exists(
-            user_id=user_id,
-            chat_id=chat_id,
-            username=message.from_user.username,
-            display_name=message.from_user.full_name,
-            is_bot=message.from_user.is_bot
-        )
+        if user is None:
+            user = await get_message_context(
+                user_id=user_id,
+                chat_id=chat_id,
+                username=message.from_user.username,
+                display_name=message.from_user.full_name,
+                is_bot=message.from_user.is_bot,
+                count_activity=False
+            )
         settings = await get_settings("antispam", str(chat_id)) or await initialize_default_settings(str(chat_id))
-        if not settings.get("enabled", False):
+        rules = get_compiled_rules(chat_id, settings, domain_checker=find_listed_domain)
+        if not rules.enabled:
             logger.debug(f"Антиспам отключен для chat_id={chat_id}")
             return False
-        user = await get_user(user_id, create_if_not_exists=True, chat_id=chat_id)
-        is_exempt = user.get_role_for_chat(chat_id) in ["Владелец сервера", "Владелец бота"] or str(user_id) in settings.get("exceptions", {}).get("users", [])
+        is_exempt = user.get_role_for_chat(chat_id) in ["Владелец сервера", "Владелец бота"] or rules.is_exempt_user(user_id)
         if is_exempt:
             logger.debug(f"Пользователь {user_id} исключен из антиспама в chat_id={chat_id}")
             return False
@@ -264,131 +252,30 @@ async def check_spam(message: Message, bot: Bot) -> bool:
         if message.sender_chat:
             logger.debug(f"Сообщение от канала sender_chat={message.sender_chat.id} в chat_id={chat_id}, антиспам не применяется")
             return False
-        # Проверка Telegram-ссылок
-        if settings.get("telegram_links", {}).get("enabled", False):
-            telegram_pattern = r"(?:https?:\/\/)?(?:t(?:elegram)?\.me|t\.me|tg:\/\/resolve\?domain=|telegram\.me)\/[\w\d_+]+|@[\w\d_]{4,}"
-            matches = re.findall(telegram_pattern, text, re.IGNORECASE)
-            if matches:
-                # Проверка исключений для доменов
-                is_domain_exempt = False
-                for match in matches:
-                    domain = match.lstrip('@').lstrip('https://').lstrip('http://').lstrip('t.me/').lstrip('telegram.me/').lstrip('tg://resolve?domain=')
-                    if domain in settings.get("exceptions", {}).get("domains", []):
-                        is_domain_exempt = True
-                        break
-                if not is_domain_exempt:
-                    # Удаление сообщения перед применением действия
-                    try:
-                        await retry_on_flood_control(message.delete)
-                        logger.info(f"Удалено сообщение с Telegram-ссылкой от user_id={user_id} в chat_id={chat_id}")
-                    except Exception as e:
-                        logger.warning(f"Не удалось удалить сообщение с Telegram-ссылкой: {str(e)}")
-                    logger.info(
-                        f"СПАМ/НАРУШЕНИЕ: user_id={user_id}, username=@{user.username or 'Unknown'}, "
-                        f"chat_id={chat_id}, причина=Telegram-ссылка: {', '.join(matches)}, "
-                        f"действие={settings.get('telegram_links', {}).get('action', settings.get('action', 'mute'))}"
-                    )
-                    await apply_antispam_action(user_id, chat_id, settings, message, bot, f"Telegram-ссылка: {', '.join(matches)}", "telegram_links")
-                    return True
-        # Проверка медиа
-        if settings.get("media_filter", {}).get("enabled", False) and any([
-            message.photo, message.video, message.audio, message.document, message.sticker, message.animation
-        ]):
-            logger.info(
-                f"СПАМ/НАРУШЕНИЕ: user_id={user_id}, username=@{user.username or 'Unknown'}, "
-                f"chat_id={chat_id}, причина=Медиа-контент, "
-                f"действие={settings.get('media_filter', {}).get('action', settings.get('action', 'delete'))}"
-            )
-            await apply_antispam_action(user_id, chat_id, settings, message, bot, "Медиа-контент", "media_filter")
-            return True
-        # Проверка флуда через Redis
-        if settings.get("flood", {}).get("enabled", True):
-            limit = settings.get("flood", {}).get("limit", settings.get("max_messages_per_minute", 10))
-            seconds = settings.get("flood", {}).get("seconds", 10)
-            if await is_spamming(chat_id, user_id, limit, seconds):
-                ttl = await get_ttl(chat_id, user_id)
-                logger.info(
-                    f"СПАМ/НАРУШЕНИЕ: user_id={user_id}, username=@{user.username or 'Unknown'}, "
-                    f"chat_id={chat_id}, причина=Флуд: превышен лимит ({limit}/{seconds} сек), "
-                    f"действие={settings.get('flood', {}).get('action', settings.get('action', 'mute'))}, ttl={ttl} сек"
-                )
-                await apply_antispam_action(user_id, chat_id, settings, message, bot, f"Флуд: превышен лимит ({limit}/{seconds} сек)", "flood")
-                return True
-        # Проверка повторяющихся сообщений
-        if settings.get("repeated_messages", {}).get("enabled", True):
-            async with redis_client() as redis:
-                message_key = f"antispam:{chat_id}:{user_id}:messages"
-                message_hash = await get_message_hash(text)
-                await redis.lpush(message_key, message_hash)
-                await redis.ltrim(message_key, 0, settings.get("repeated_messages", {}).get("limit", 5) - 1)
-                recent_messages = await redis.lrange(message_key, 0, -1)
-                await redis.expire(message_key, 3600)
-                recent_messages = [msg.decode("utf-8") if isinstance(msg, bytes) else msg for msg in recent_messages]
-                if len(recent_messages) >= settings.get("repeated_messages", {}).get("limit", 5):
-                    if all(msg == message_hash for msg in recent_messages):
-                        logger.info(
-                            f"СПАМ/НАРУШЕНИЕ: user_id={user_id}, username=@{user.username or 'Unknown'}, "
-                            f"chat_id={chat_id}, причина=Повторение сообщений: {text[:100]}, "
-                            f"действие={settings.get('repeated_messages', {}).get('action', settings.get('action', 'warn'))}"
-                        )
-                        await apply_antispam_action(user_id, chat_id, settings, message, bot, f"Повторение сообщений: {text[:100]}", "repeated_messages")
-                        await redis.delete(message_key)
-                        return True
-        # Проверка повторяющихся слов
-        if settings.get("repeated_words", {}).get("enabled", True):
-            words = [word for word in text.split() if word.lower() not in settings.get("ignored_words", [])]
-            if len(words) >= settings.get("repeated_words", {}).get("limit", settings.get("repeated_words_limit", 5)):
-                repeated_count = 1
-                prev_word = None
-                for word in words:
-                    current_word = word.lower() if not settings.get("case_sensitive", False) else word
-                    if prev_word and current_word == prev_word:
-                        repeated_count += 1
-                        if repeated_count >= settings.get("repeated_words", {}).get("limit", settings.get("repeated_words_limit", 5)):
-                            logger.info(
-                                f"СПАМ/НАРУШЕНИЕ: user_id={user_id}, username=@{user.username or 'Unknown'}, "
-                                f"chat_id={chat_id}, причина=Повторение слов: {word}, "
-                                f"действие={settings.get('repeated_words', {}).get('action', settings.get('action', 'warn'))}"
-                            )
-                            await apply_antispam_action(user_id, chat_id, settings, message, bot, f"Повторение слов: {word}", "repeated_words")
-                            return True
-                    else:
-                        repeated_count = 1
-                    prev_word = current_word
-        # Проверка запрещенных слов
-        if settings.get("spam_words", {}).get("enabled", True) and settings.get("spam_words", {}).get("words", []):
-            pattern = "|".join([re.escape(word) for word in settings["spam_words"]["words"]])
-            if re.search(pattern, text, re.IGNORECASE if not settings.get("case_sensitive", False) else 0):
-                logger.info(
-                    f"СПАМ/НАРУШЕНИЕ: user_id={user_id}, username=@{user.username or 'Unknown'}, "
-                    f"chat_id={chat_id}, причина=Запрещенные слова: {text[:100]}, "
-                    f"действие={settings.get('spam_words', {}).get('action', settings.get('action', 'ban'))}"
-                )
-                await apply_antispam_action(user_id, chat_id, settings, message, bot, f"Запрещенные слова: {text[:100]}", "spam_words")
-                return True
-        # Проверка внешних ссылок
-        if settings.get("external_links", {}).get("enabled", False):
-            url_pattern = r"https?://([A-Za-z0-9.-]+)"
-            urls = re.findall(url_pattern, text, re.IGNORECASE)
-            for domain in urls:
-                if domain.lower() not in settings.get("exceptions", {}).get("domains", []):
-                    if await check_dnsbl(domain):
-                        logger.info(
-                            f"СПАМ/НАРУШЕНИЕ: user_id={user_id}, username=@{user.username or 'Unknown'}, "
-                            f"chat_id={chat_id}, причина=Спам-ссылка: {domain}, "
-                            f"действие={settings.get('external_links', {}).get('action', settings.get('action', 'delete'))}"
-                        )
-                        await apply_antispam_action(user_id, chat_id, settings, message, bot, f"Спам-ссылка: {domain}", "external_links")
-                        return True
-        return False
+        violation = await rules.run(message, text)
+        if not violation:
+            return False
+        if violation.delete_message:
+            # Удаление сообщения перед применением действия (через очередь, без ожидания)
+            send_queue.enqueue(chat_id, message.delete, kind="action")
+            logger.info(f"Удаление сообщения ({violation.filter_type}) от user_id={user_id} в chat_id={chat_id} поставлено в очередь")
+        logger.info(
+            f"СПАМ/НАРУШЕНИЕ: user_id={user_id}, username=@{user.username or 'Unknown'}, "
+            f"chat_id={chat_id}, причина={violation.reason}, "
+            f"действие={settings.get(violation.filter_type, {}).get('action', settings.get('action', violation.default_action))}"
+            f"{violation.details}"
+        )
+        await apply_antispam_action(user_id, chat_id, settings, message, bot, violation.reason, violation.filter_type, user=user)
+        return True
     except Exception as e:
         logger.error(f"Ошибка при проверке спама для user_id={user_id} в chat_id={chat_id}: {str(e)}")
         return False
 
-async def apply_antispam_action(user_id: int, chat_id: int, settings: Dict, message: Optional[Message], bot: Bot, reason: str, filter_type: str) -> bool:
+async def apply_antispam_action(user_id: int, chat_id: int, settings: Dict, message: Optional[Message], bot: Bot, reason: str, filter_type: str, user: Optional[User] = None) -> bool:
     """Применяет антиспам-действие и уведомляет администраторов."""
     try:
-        user = await get_user(user_id, create_if_not_exists=True, chat_id=chat_id)
+        if user is None:
+            user = await get_user(user_id, create_if_not_exists=True, chat_id=chat_id)
         filter_settings = settings.get(filter_type, settings.get("telegram_links", {}))
         action = filter_settings.get("action", settings.get("action", "warn"))
         duration = filter_settings.get("duration", settings.get("mute_duration", 1800))  # 30 минут по умолчанию
@@ -404,10 +291,10 @@ async def apply_antispam_action(user_id: int, chat_id: int, settings: Dict, mess
         user_mention = f"@{user.username}" if user.username else user.display_name or f"User {user_id}"
 
         # Проверка прав бота
-        bot_member = await bot.get_chat_member(chat_id, bot.id)
-        if not bot_member.can_restrict_members:
+        bot_member = await get_bot_member(bot, chat_id)
+        if not getattr(bot_member, "can_restrict_members", False):
             logger.error(f"Бот не имеет прав ограничивать пользователей в chat_id={chat_id}")
-            await notify_admins(bot, settings, user_id, chat_id, f"Ошибка: бот не имеет прав для ограничения пользователей", "error", message.text or message.caption or "" if message else "Без текста")
+            await notify_admins(bot, settings, user_id, chat_id, f"Ошибка: бот не имеет прав для ограничения пользователей", "error", message.text or message.caption or "" if message else "Без текста", user=user)
             return False
 
         # Проверка текущего статуса пользователя в чате
@@ -429,46 +316,21 @@ async def apply_antispam_action(user_id: int, chat_id: int, settings: Dict, mess
         if action == "delete":
             # Удаление сообщения, если оно не было удалено ранее и message не None
             if not is_message_deleted and message:
-                try:
-                    await retry_on_flood_control(message.delete)
-                    logger.info(f"Удалено сообщение для user_id={user_id} в chat_id={chat_id}: {reason}")
-                    is_message_deleted = True
-                except Exception as e:
-                    logger.warning(f"Не удалось удалить сообщение: {str(e)}")
+                send_queue.enqueue(chat_id, message.delete, kind="action")
+                logger.info(f"Удаление сообщения для user_id={user_id} в chat_id={chat_id} поставлено в очередь: {reason}")
+                is_message_deleted = True
             await log_moderation_action(user_id, chat_id, "delete", reason, bot.id)
-            await notify_admins(bot, settings, user_id, chat_id, reason, "delete", message.text or message.caption or "" if message else "Без текста")
+            await notify_admins(bot, settings, user_id, chat_id, reason, "delete", message.text or message.caption or "" if message else "Без текста", user=user)
             return True
 
         if action == "warn":
             if warning_count < settings.get("warning_threshold", 3):
                 success = await add_warning(user_id, chat_id, reason, bot.id)
                 if success:
-                    if message and not is_message_deleted:
-                        try:
-                            await retry_on_flood_control(
-                                message.reply,
-                                f"⚠️ Пользователь {user_mention} получил предупреждение: {reason}"
-                            )
-                        except TelegramBadRequest as e:
-                            if "message to be replied to is not found" in str(e):
-                                logger.warning(f"Сообщение для ответа не найдено для user_id={user_id} в chat_id={chat_id}, отправка через bot.send_message")
-                                await retry_on_flood_control(
-                                    bot.send_message,
-                                    chat_id,
-                                    f"⚠️ Пользователь {user_mention} получил предупреждение: {reason}"
-                                )
-                            else:
-                                logger.error(f"Ошибка при отправке ответа для user_id={user_id} в chat_id={chat_id}: {str(e)}")
-                                return False
-                    elif not message:
-                        logger.warning(f"Сообщение None, отправка предупреждения через bot.send_message для user_id={user_id} в chat_id={chat_id}")
-                        await retry_on_flood_control(
-                            bot.send_message,
-                            chat_id,
-                            f"⚠️ Пользователь {user_mention} получил предупреждение: {reason}"
-                        )
-                    await log_moderation_action(user_id, chat_id, "warn", reason, bot.id)
-                    await notify_admins(bot, settings, user_id, chat_id, reason, "warn", message.text or message.caption or "" if message else "Без текста")
+                    if message is None or not is_message_deleted:
+                        # Ответ уходит через очередь отправки, обработчик не ждет лимитов Telegram
+                        send_queue.enqueue_reply(bot, chat_id, message, f"⚠️ Пользователь {user_mention} получил предупреждение: {reason}")
+                    await notify_admins(bot, settings, user_id, chat_id, reason, "warn", message.text or message.caption or "" if message else "Без текста", user=user)
                     logger.info(f"Предупреждение выдано пользователю {user_id} в chat_id={chat_id}: {reason}")
                     return True
                 return False
@@ -484,7 +346,8 @@ async def apply_antispam_action(user_id: int, chat_id: int, settings: Dict, mess
                 until_date = int(time.time()) + duration
                 success = await mute_user(user_id, chat_id, duration, reason, bot.id)
                 if success:
-                    await retry_on_flood_control(
+                    send_queue.enqueue(
+                        chat_id,
                         bot.restrict_chat_member,
                         chat_id,
                         user_id,
@@ -494,71 +357,28 @@ async def apply_antispam_action(user_id: int, chat_id: int, settings: Dict, mess
                             "can_send_polls": False,
                             "can_send_other_messages": False
                         },
-                        until_date=until_date
+                        until_date=until_date,
+                        kind="action"
                     )
-                    if message and not is_message_deleted:
-                        try:
-                            await retry_on_flood_control(
-                                message.reply,
-                                f"🔇 Пользователь {user_mention} замучен на {duration // 60} минут: {reason}"
-                            )
-                        except TelegramBadRequest as e:
-                            if "message to be replied to is not found" in str(e):
-                                logger.warning(f"Сообщение для ответа не найдено для user_id={user_id} в chat_id={chat_id}, отправка через bot.send_message")
-                                await retry_on_flood_control(
-                                    bot.send_message,
-                                    chat_id,
-                                    f"🔇 Пользователь {user_mention} замучен на {duration // 60} минут: {reason}"
-                                )
-                            else:
-                                logger.error(f"Ошибка при отправке ответа для user_id={user_id} в chat_id={chat_id}: {str(e)}")
-                                return False
-                    elif not message:
-                        logger.warning(f"Сообщение None, отправка мута через bot.send_message для user_id={user_id} в chat_id={chat_id}")
-                        await retry_on_flood_control(
-                            bot.send_message,
-                            chat_id,
-                            f"🔇 Пользователь {user_mention} замучен на {duration // 60} минут: {reason}"
-                        )
-                    await log_moderation_action(user_id, chat_id, "mute", reason, bot.id)
-                    await notify_admins(bot, settings, user_id, chat_id, reason, "mute", message.text or message.caption or "" if message else "Без текста")
+                    if message is None or not is_message_deleted:
+                        # Ответ уходит через очередь отправки, обработчик не ждет лимитов Telegram
+                        send_queue.enqueue_reply(bot, chat_id, message, f"🔇 Пользователь {user_mention} замучен на {duration // 60} минут: {reason}")
+                    await notify_admins(bot, settings, user_id, chat_id, reason, "mute", message.text or message.caption or "" if message else "Без текста", user=user)
                     logger.info(f"Пользователь {user_id} замучен на {duration} секунд в chat_id={chat_id}: {reason}")
                     return True
                 return False
             except Exception as e:
                 logger.error(f"Ошибка при наложении мута для user_id={user_id} в chat_id={chat_id}: {str(e)}")
-                await notify_admins(bot, settings, user_id, chat_id, f"Ошибка при наложении мута: {str(e)}", "error", message.text or message.caption or "" if message else "Без текста")
+                await notify_admins(bot, settings, user_id, chat_id, f"Ошибка при наложении мута: {str(e)}", "error", message.text or message.caption or "" if message else "Без текста", user=user)
                 return False
 
         if action == "ban":
             success = await ban_user(user_id, chat_id, reason, bot.id, duration)
             if success:
-                if message and not is_message_deleted:
-                    try:
-                        await retry_on_flood_control(
-                            message.reply,
-                            f"🚫 Пользователь {user_mention} забанен на {duration // 3600} часов: {reason}"
-                        )
-                    except TelegramBadRequest as e:
-                        if "message to be replied to is not found" in str(e):
-                            logger.warning(f"Сообщение для ответа не найдено для user_id={user_id} в chat_id={chat_id}, отправка через bot.send_message")
-                            await retry_on_flood_control(
-                                bot.send_message,
-                                chat_id,
-                                f"🚫 Пользователь {user_mention} забанен на {duration // 3600} часов: {reason}"
-                            )
-                        else:
-                            logger.error(f"Ошибка при отправке ответа для user_id={user_id} в chat_id={chat_id}: {str(e)}")
-                            return False
-                elif not message:
-                    logger.warning(f"Сообщение None, отправка бана через bot.send_message для user_id={user_id} в chat_id={chat_id}")
-                    await retry_on_flood_control(
-                        bot.send_message,
-                        chat_id,
-                        f"🚫 Пользователь {user_mention} забанен на {duration // 3600} часов: {reason}"
-                    )
-                await log_moderation_action(user_id, chat_id, "ban", reason, bot.id)
-                await notify_admins(bot, settings, user_id, chat_id, reason, "ban", message.text or message.caption or "" if message else "Без текста")
+                if message is None or not is_message_deleted:
+                    # Ответ уходит через очередь отправки, обработчик не ждет лимитов Telegram
+                    send_queue.enqueue_reply(bot, chat_id, message, f"🚫 Пользователь {user_mention} забанен на {duration // 3600} часов: {reason}")
+                await notify_admins(bot, settings, user_id, chat_id, reason, "ban", message.text or message.caption or "" if message else "Без текста", user=user)
                 logger.info(f"Пользователь {user_id} забанен в chat_id={chat_id}: {reason}")
                 return True
             return False
@@ -898,6 +718,14 @@ async def process_filter_settings(callback: CallbackQuery, state: FSMContext):
         elif callback.data.startswith("set_flood_seconds_"):
             await retry_on_flood_control(callback.message.edit_text, TEXTS["set_flood_seconds"])
             await state.set_state(AntispamStates.set_flood_seconds)
+        elif callback.data.startswith("set_flood_mode_"):
+            chat_id = int(data.get("chat_id"))
+            mode = "sliding" if settings[filter_name].get("mode", "fixed") == "fixed" else "fixed"
+            settings[filter_name]["mode"] = mode
+            await save_settings("antispam", str(chat_id), settings)
+            await state.update_data(settings=settings)
+            await callback.answer(f"Режим окна: {'скользящее' if mode == 'sliding' else 'фиксированное'}")
+            return
         await callback.answer()
     except Exception as e:
         await retry_on_flood_control(callback.message.reply, TEXTS["error"])
@@ -1265,12 +1093,33 @@ async def cmd_kick_inactive(message: Message, bot: Bot):
             return
         args = message.text.split()[1:]
         inactivity_days = 30
+        dry_run = False
         for arg in args:
             if arg.startswith("days=") and arg[len("days="):].isdigit():
                 inactivity_days = int(arg[len("days="):])
-        kicked_count = await kick_inactive_users(chat_id, bot, inactivity_days)
-        await retry_on_flood_control(message.reply, f"✅ Исключено {kicked_count} неактивных пользователей.")
-        logger.info(f"Исключено {kicked_count} пользователей в chat_id={chat_id}")
+            elif arg in ("dry", "dry_run"):
+                dry_run = True
+        if dry_run:
+            candidates = await kick_inactive_users(chat_id, bot, inactivity_days, dry_run=True)
+            await retry_on_flood_control(
+                message.reply, f"🔎 Будет исключено {candidates} пользователей, неактивных более {inactivity_days} дней."
+            )
+            return
+        # Исключение тысяч пользователей идет в фоне: обработчик не держит очередь обновлений чата
+        task, started = start_kick_inactive(chat_id, bot, inactivity_days)
+        if not started:
+            await retry_on_flood_control(message.reply, "⏳ Исключение неактивных пользователей уже выполняется.")
+            return
+        await retry_on_flood_control(message.reply, f"⏳ Исключаю пользователей, неактивных более {inactivity_days} дней...")
+
+        def on_done(done: asyncio.Task) -> None:
+            if done.cancelled():
+                return
+            kicked_count = done.result()
+            send_queue.enqueue_reply(bot, chat_id, message, f"✅ Исключено {kicked_count} неактивных пользователей.")
+            logger.info(f"Исключено {kicked_count} пользователей в chat_id={chat_id}")
+
+        task.add_done_callback(on_done)
     except Exception as e:
         await retry_on_flood_control(message.reply, TEXTS["error"])
         logger.error(f"Ошибка при выполнении /kick_inactive для chat_id={chat_id}: {str(e)}")
@@ -1324,6 +1173,7 @@ async def cmd_reset_spam(message: Message, bot: Bot):
                 return
             target_user_id = target_user.id
 
+        reset_local_spam_state(chat_id, target_user_id)
         await reset_spam_state(chat_id, target_user_id)
         await retry_on_flood_control(message.reply, TEXTS["reset_spam"].format(f"@{target_user.username or 'Unknown'} ({target_user_id})", chat_id))
         logger.info(f"Состояние спама сброшено для user_id={target_user_id} в chat_id={chat_id} пользователем {user_id}")
@@ -1331,6 +1181,37 @@ async def cmd_reset_spam(message: Message, bot: Bot):
         await retry_on_flood_control(message.reply, TEXTS["error"])
         logger.error(f"Ошибка при /reset_spam для user_id={user_id} в chat_id={chat_id}: {str(e)}")
 
+async def check_overflow_message(message: Message, data: Dict) -> None:
+    """
+    Дешевая проверка сообщения, вытесненного из переполненной очереди чата (см. chat_serializer):
+    только правила антиспама, без загрузки пользователя и без мута или бана. Нарушение — удаление
+    сообщения; действие к отправителю применит обработка его последнего сообщения.
+    """
+    chat_id = message.chat.id
+    user_id = message.from_user.id
+    try:
+        settings = await get_settings("antispam", str(chat_id))
+        if not settings:
+            return
+        rules = get_compiled_rules(chat_id, settings, domain_checker=find_listed_domain)
+        if not rules.enabled or rules.is_exempt_user(user_id):
+            return
+        violation = await rules.run(message, message.text or message.caption or "")
+        if violation is not None:
+            send_queue.enqueue(chat_id, message.delete, kind="action")
+            logger.info(f"Удаление вытесненного сообщения ({violation.filter_type}) от user_id={user_id} в chat_id={chat_id} поставлено в очередь")
+    except Exception as e:
+        logger.error(f"Ошибка при проверке вытесненного сообщения user_id={user_id} в chat_id={chat_id}: {str(e)}")
+
+@cached(ttl=300)
+async def is_chat_staff(chat_id: int, user_id: int) -> bool:
+    """Проверяет, входит ли пользователь в администрацию чата (модераторы и выше); результат кэшируется."""
+    try:
+        user = await get_user(user_id, chat_id=chat_id)
+    except ValueError:
+        return False
+    return user.role_level >= 1 or user.get_role_for_chat(chat_id) in ["Владелец сервера", "Владелец бота"]
+
 @router.message(F.text)
 async def check_spam_message(message: Message, bot: Bot):
     """Обработчик всех текстовых сообщений для проверки спама."""
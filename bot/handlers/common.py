@@ -1,12 +1,19 @@
 from aiogram import Router, F
 from aiogram.filters import Command, ChatMemberUpdatedFilter, JOIN_TRANSITION
-from aiogram.types import Message, ChatMemberUpdated, CallbackQuery
+from aiogram.types import Message, ChatMemberUpdated, CallbackQuery, InlineKeyboardMarkup
 from aiogram.exceptions import TelegramBadRequest
 from loguru import logger
 import aiogram
-from ..modules.no_sql.user_db import register_chat_member, get_user, save_chat, OWNER_BOT_ID, get_all_user_ids, \
-    increment_activity_count, get_moderation_logs
+from typing import Optional, Tuple
+from bson import ObjectId
+from ..modules.no_sql.user_db import register_chat_member, get_user, save_chat, OWNER_BOT_ID, \
+    get_message_context, rollback_activity_count, get_moderation_logs_page
+from ..modules import member_sync, send_queue
+from ..modules.name_resolver import resolve_display_names
+from ..keyboards.logs import LOGS_CALLBACK_PREFIX, unpack_logs_callback, parse_log_filters, get_logs_pagination_menu
+from ..modules.bot_permissions import get_bot_member, update_bot_member, is_admin_with_manage_chat
 from .antispam import check_spam
+import asyncio
 import time
 
 # Используем aiogram версии 3.20.0.post0
@@ -66,19 +73,28 @@ async def bot_added_to_chat_handler(update: ChatMemberUpdated):
     chat_id = update.chat.id
     chat_title = update.chat.title
     try:
-        bot_member = await update.bot.get_chat_member(chat_id=chat_id, user_id=update.bot.id)
-        if bot_member.status != "administrator" or not bot_member.can_manage_chat:
+        bot_member = update.new_chat_member
+        update_bot_member(chat_id, bot_member)
+        if not is_admin_with_manage_chat(bot_member):
             logger.warning(f"Бот не имеет прав администратора или 'Manage Chat' в chat_id={chat_id}")
             return
         await save_chat(chat_id, chat_title)
         logger.info(f"Бот добавлен в чат: chat_id={chat_id}, chat_title={chat_title}")
-        await register_all_chat_members(chat_id, update.bot)
-        logger.info(f"Зарегистрированы участники для chat_id={chat_id}")
+        # Синхронизация идет в фоне, чтобы не задерживать обработку обновлений
+        member_sync.start_sync(chat_id, update.bot)
+        logger.info(f"Запущена регистрация участников для chat_id={chat_id}")
     except TelegramBadRequest as e:
         logger.error(f"Ошибка при проверке прав бота в chat_id={chat_id}: {str(e)}")
     except Exception as e:
         logger.error(f"Ошибка при сохранении чата или регистрации участников для chat_id={chat_id}: {str(e)}")
 
+@router.my_chat_member()
+async def bot_rights_changed_handler(update: ChatMemberUpdated):
+    """
+    Обработчик изменения статуса или прав бота в чате. Обновляет кэш прав бота.
+    """
+    update_bot_member(update.chat.id, update.new_chat_member)
+
 @router.message(~Command(commands=["start", "antispam","view_spam_logs", "update_antispam_settings", "reset_spam", "antispam_settings", "set_admin_group", "kick_inactive", "warn", "clear_warnings", "clear", "mute", "unmute", "ban", "unban", "kick", "user_status", "mod_logs", "help_moderation", "register_all", "force_register_all", "spam_stats", "antispam_toggle", "test_antispam"]))
 async def message_handler(message: Message):
     """
@@ -88,32 +104,30 @@ async def message_handler(message: Message):
     user_id = message.from_user.id
     logger.debug(f"Получено сообщение от user_id={user_id}, is_bot={message.from_user.is_bot}, chat_id={chat_id}, message_id={message.message_id}")
     try:
-        bot_member = await message.bot.get_chat_member(chat_id=chat_id, user_id=message.bot.id)
-        if bot_member.status != "administrator" or not bot_member.can_manage_chat:
+        bot_member = await get_bot_member(message.bot, chat_id)
+        if not is_admin_with_manage_chat(bot_member):
             logger.warning(f"Бот не имеет прав администратора или 'Manage Chat' в chat_id={chat_id}, сообщение от user_id={user_id} проигнорировано")
             return
 
-        # Проверка спама
-        is_spam = await check_spam(message, message.bot)
-        if is_spam:
-            logger.info(f"Спам обнаружен для user_id={user_id} в chat_id={chat_id}, обработка сообщения прекращена")
-            return
-
-        # Регистрация и увеличение активности
-        await register_chat_member(
+        # Регистрация и увеличение активности одним запросом; этот User используется до конца обработки
+        user = await get_message_context(
             user_id=user_id,
+            chat_id=chat_id,
             username=message.from_user.username,
             display_name=message.from_user.full_name,
-            chat_id=chat_id,
             is_bot=message.from_user.is_bot
         )
+
+        # Проверка спама
+        is_spam = await check_spam(message, message.bot, user=user)
+        if is_spam:
+            if not message.from_user.is_bot:
+                await rollback_activity_count(user_id, chat_id)
+            logger.info(f"Спам обнаружен для user_id={user_id} в chat_id={chat_id}, обработка сообщения прекращена")
+            return
+
         if not message.from_user.is_bot:
-            success = await increment_activity_count(user_id, chat_id)
-            if success:
-                updated_user = await get_user(user_id, chat_id=chat_id)
-                logger.info(f"Счетчик активности увеличен для user_id={user_id} в chat_id={chat_id}, новый счет: {updated_user.get_activity_count(chat_id)}")
-            else:
-                logger.warning(f"Не удалось увеличить счетчик активности для user_id={user_id} в chat_id={chat_id}")
+            logger.info(f"Счетчик активности увеличен для user_id={user_id} в chat_id={chat_id}, новый счет: {user.get_activity_count(chat_id)}")
         else:
             logger.debug(f"Пропущено увеличение активности для бота: user_id={user_id}, chat_id={chat_id}")
         logger.info(f"Обработано сообщение от user_id={user_id} (is_bot={message.from_user.is_bot}) в chat_id={chat_id}")
@@ -122,53 +136,48 @@ async def message_handler(message: Message):
     except Exception as e:
         logger.error(f"Ошибка при обработке сообщения от user_id={user_id} в chat_id={chat_id}: {str(e)}")
 
-async def register_all_chat_members(chat_id: int, bot):
+def _progress_text(chat_id: int) -> str:
+    progress = member_sync.get_progress(chat_id)
+    return f"проверено {progress.get('checked', 0)} из {progress.get('total', 0)}"
+
+def _sync_summary(chat_id: int) -> str:
+    """Итог синхронизации участников чата по member_sync.get_progress для ответа администратору."""
+    progress = member_sync.get_progress(chat_id)
+    status = progress.get("status")
+    if status == "done":
+        return (f"✅ Регистрация участников завершена: проверено {progress.get('checked', 0)}, "
+                f"зарегистрировано {progress.get('registered', 0)}.")
+    if status == "skipped":
+        return "❌ Регистрация не выполнена: бот не имеет прав администратора или 'Manage Chat'."
+    return "Произошла ошибка при регистрации участников. Проверьте логи или убедитесь, что бот имеет права администратора."
+
+def start_chat_registration(message: Message, probe_all: bool = False) -> bool:
     """
-    Регистрирует всех доступных участников чата в базе данных.
+    Запускает регистрацию участников чата в фоне (member_sync.start_sync), чтобы обработчик
+    не держал очередь обновлений чата на время проверки. Итог отправляется ответом на message.
+
+    Возвращает:
+        bool: True, если регистрация запущена; False — она уже выполняется в этом чате.
     """
-    try:
-        bot_member = await bot.get_chat_member(chat_id=chat_id, user_id=bot.id)
-        if bot_member.status != "administrator" or not bot_member.can_manage_chat:
-            logger.warning(f"Бот не имеет прав администратора или 'Manage Chat' в chat_id={chat_id}")
+    chat_id = message.chat.id
+    bot = message.bot
+    if member_sync.is_running(chat_id):
+        return False
+    task = member_sync.start_sync(chat_id, bot, probe_all=probe_all)
+
+    def on_done(done: asyncio.Task) -> None:
+        if done.cancelled():
             return
-        admins = await bot.get_chat_administrators(chat_id)
-        for admin in admins:
-            await register_chat_member(
-                user_id=admin.user.id,
-                username=admin.user.username,
-                display_name=admin.user.full_name,
-                chat_id=chat_id,
-                is_bot=admin.user.is_bot
-            )
-            logger.info(f"Зарегистрирован администратор {admin.user.id} (is_bot={admin.user.is_bot}) для chat_id={chat_id}")
+        send_queue.enqueue_reply(bot, chat_id, message, _sync_summary(chat_id))
+        logger.info(f"Регистрация участников chat_id={chat_id} завершена: {member_sync.get_progress(chat_id)}")
 
-        all_user_ids = await get_all_user_ids()
-        for user_id in all_user_ids:
-            try:
-                member = await bot.get_chat_member(chat_id=chat_id, user_id=user_id)
-                if member.status not in ("left", "kicked"):
-                    await register_chat_member(
-                        user_id=member.user.id,
-                        username=member.user.username,
-                        display_name=member.user.full_name,
-                        chat_id=chat_id,
-                        is_bot=member.user.is_bot
-                    )
-                    logger.info(f"Зарегистрирован участник {member.user.id} (is_bot={member.user.is_bot}) для chat_id={chat_id} через get_chat_member")
-            except TelegramBadRequest as e:
-                logger.debug(f"Пользователь {user_id} не найден в chat_id={chat_id}: {str(e)}")
-                continue
-    except TelegramBadRequest as e:
-        logger.error(f"Ошибка при получении списка администраторов для chat_id={chat_id}: {str(e)}")
-        raise
-    except Exception as e:
-        logger.error(f"Неизвестная ошибка при регистрации участников для chat_id={chat_id}: {str(e)}")
-        raise
+    task.add_done_callback(on_done)
+    return True
 
 @router.message(Command(commands=["register_all"]))
 async def register_all_handler(message: Message):
     """
-    Обработчик команды /register_all. Регистрирует всех администраторов чата.
+    Обработчик команды /register_all. Регистрирует администраторов и известных боту участников чата.
     """
     user_id = message.from_user.id
     chat_id = message.chat.id
@@ -179,10 +188,13 @@ async def register_all_handler(message: Message):
             logger.warning(f"Пользователь {user_id} попытался выполнить /register_all без прав, chat_id={chat_id}")
             return
         await save_chat(chat_id, message.chat.title)
-        await register_all_chat_members(chat_id, message.bot)
+        if not start_chat_registration(message):
+            await message.answer(f"⏳ Регистрация участников уже выполняется: {_progress_text(chat_id)}.")
+            return
         await message.answer(
-            "Все администраторы чата зарегистрированы. Для регистрации остальных участников они должны быть активны или используйте /force_register_all.")
-        logger.info(f"Команда /register_all выполнена для chat_id={chat_id} пользователем {user_id}")
+            "⏳ Регистрирую администраторов и известных боту участников чата. Остальные должны быть активны, "
+            "или используйте /force_register_all.")
+        logger.info(f"Команда /register_all запущена для chat_id={chat_id} пользователем {user_id}")
     except Exception as e:
         logger.error(f"Ошибка при выполнении /register_all для chat_id={chat_id}: {str(e)}")
         await message.answer(
@@ -202,34 +214,11 @@ async def force_register_all_handler(message: Message):
             logger.warning(f"Пользователь {user_id} попытался выполнить /force_register_all без прав, chat_id={chat_id}")
             return
         await save_chat(chat_id, message.chat.title)
-
-        chat = await message.bot.get_chat(chat_id)
-        member_count = chat.approximate_member_count or 0
-        logger.info(f"Попытка регистрации всех участников для chat_id={chat_id}, общее количество: {member_count}")
-
-        await register_all_chat_members(chat_id, message.bot)
-
-        registered_count = 0
-        all_user_ids = await get_all_user_ids()
-        for user_id in all_user_ids:
-            try:
-                member = await message.bot.get_chat_member(chat_id=chat_id, user_id=user_id)
-                if member.status not in ("left", "kicked"):
-                    await register_chat_member(
-                        user_id=member.user.id,
-                        username=member.user.username,
-                        display_name=member.user.full_name,
-                        chat_id=chat_id,
-                        is_bot=member.user.is_bot
-                    )
-                    registered_count += 1
-                    logger.info(f"Зарегистрирован участник {member.user.id} (is_bot={member.user.is_bot}) для chat_id={chat_id} через /force_register_all")
-            except TelegramBadRequest:
-                continue
-
-        await message.answer(
-            f"Зарегистрировано {registered_count} участников. Если не все участники зарегистрированы, убедитесь, что бот имеет права администратора.")
-        logger.info(f"Команда /force_register_all выполнена для chat_id={chat_id} пользователем {user_id}, зарегистрировано: {registered_count}")
+        if not start_chat_registration(message, probe_all=True):
+            await message.answer(f"⏳ Регистрация участников уже выполняется: {_progress_text(chat_id)}.")
+            return
+        await message.answer("⏳ Проверяю всех известных боту пользователей, итог пришлю по завершении.")
+        logger.info(f"Команда /force_register_all запущена для chat_id={chat_id} пользователем {user_id}")
     except Exception as e:
         logger.error(f"Ошибка при выполнении /force_register_all для chat_id={chat_id}: {str(e)}")
         await message.answer(
@@ -264,30 +253,84 @@ async def handle_moderation_callback(callback: CallbackQuery):
         await callback.message.answer("🚫 Ошибка. Попробуйте позже или свяжитесь с поддержкой.")
         await callback.answer()
 
+# Роли, которым доступен просмотр логов спама
+SPAM_LOGS_ROLES = ["Старший админ", "Заместитель", "Владелец сервера", "Владелец бота"]
+
+async def render_spam_logs_page(chat_id: int, cursor: Optional[ObjectId] = None, direction: str = "older",
+                                action: Optional[str] = None, target_user_id: Optional[int] = None
+                                ) -> Tuple[Optional[str], Optional[InlineKeyboardMarkup]]:
+    """Формирует текст и кнопки навигации страницы /view_spam_logs; текст None, если записей нет."""
+    logs, has_older, has_newer = await get_moderation_logs_page(
+        chat_id, limit=10, cursor=cursor, direction=direction, action=action, user_id=target_user_id
+    )
+    if not logs:
+        return None, None
+    # Имена загружаются одним запросом с общим для /mod_logs кэшем
+    names = await resolve_display_names(
+        [log["user_id"] for log in logs if "user_id" in log] + [log["issued_by"] for log in logs if "issued_by" in log]
+    )
+    log_text = []
+    for log in logs:
+        action_name = log.get("action", "unknown")
+        reason = log.get("reason", "No reason")
+        issued_by = names.get(log.get("issued_by"), log.get("issued_by", 0))
+        issued_at = time.ctime(log.get("issued_at", 0))
+        target = names.get(log.get("user_id"), "Unknown")
+        log_text.append(f"[{issued_at}] User {target}: {action_name} ({reason}) by {issued_by}")
+    return "\n".join(log_text), get_logs_pagination_menu("s", logs, has_older, has_newer, action, target_user_id)
+
 @router.message(Command("view_spam_logs"))
 async def cmd_view_spam_logs(message: Message):
-    """Просматривает последние 10 записей логов спама из MongoDB."""
+    """
+    Просматривает логи спама постранично по 10 записей: /view_spam_logs [действие] [user_id]
+    или ответом на сообщение пользователя.
+    """
     chat_id = message.chat.id
     user_id = message.from_user.id
     try:
         user = await get_user(user_id, create_if_not_exists=True, chat_id=chat_id)
-        if user.get_role_for_chat(chat_id) not in ["Старший админ", "Заместитель", "Владелец сервера", "Владелец бота"]:
+        if user.get_role_for_chat(chat_id) not in SPAM_LOGS_ROLES:
             await message.reply("🚫 У вас нет прав для просмотра логов.")
             return
-        logs = await get_moderation_logs(chat_id, limit=10)
-        if not logs:
+        action, target_user_id = parse_log_filters(message.text.split()[1:])
+        if message.reply_to_message and message.reply_to_message.from_user:
+            target_user_id = message.reply_to_message.from_user.id
+        text, markup = await render_spam_logs_page(chat_id, action=action, target_user_id=target_user_id)
+        if text is None:
             await message.reply("📜 Логи спама пусты.")
             return
-        log_text = []
-        for log in logs:
-            action = log.get("action", "unknown")
-            reason = log.get("reason", "No reason")
-            issued_by = log.get("issued_by", 0)
-            issued_at = time.ctime(log.get("issued_at", 0))
-            user_id = log.get("user_id", "Unknown")
-            log_text.append(f"[{issued_at}] User {user_id}: {action} ({reason}) by {issued_by}")
-        await message.reply("\n".join(log_text))
+        await message.reply(text, reply_markup=markup)
         logger.info(f"Пользователь {user_id} просмотрел логи спама для chat_id={chat_id}")
     except Exception as e:
         await message.reply(f"❌ Ошибка при чтении логов: {str(e)}")
-        logger.error(f"Ошибка при чтении логов для chat_id={chat_id}: {str(e)}")
\ No newline at end of file
+        logger.error(f"Ошибка при чтении логов для chat_id={chat_id}: {str(e)}")
+
+@router.callback_query(F.data.startswith(f"{LOGS_CALLBACK_PREFIX}:s:"))
+async def spam_logs_page_callback(callback: CallbackQuery):
+    """Листание страниц /view_spam_logs."""
+    chat_id = callback.message.chat.id
+    user_id = callback.from_user.id
+    page = unpack_logs_callback(callback.data)
+    if page is None or not ObjectId.is_valid(page["cursor"]):
+        await callback.answer("🚫 Некорректные данные страницы.")
+        return
+    try:
+        user = await get_user(user_id, create_if_not_exists=True, chat_id=chat_id)
+        if user.get_role_for_chat(chat_id) not in SPAM_LOGS_ROLES:
+            await callback.answer("🚫 У вас нет прав для просмотра логов.", show_alert=True)
+            return
+        text, markup = await render_spam_logs_page(
+            chat_id, cursor=ObjectId(page["cursor"]), direction=page["direction"],
+            action=page["action"], target_user_id=page["user_id"]
+        )
+        if text is None:
+            await callback.answer("📜 Больше записей нет.")
+            return
+        await callback.message.edit_text(text, reply_markup=markup)
+        await callback.answer()
+    except TelegramBadRequest as e:
+        logger.debug(f"Страница логов спама не изменилась в chat_id={chat_id}: {str(e)}")
+        await callback.answer()
+    except Exception as e:
+        await callback.answer("❌ Ошибка при чтении логов.")
+        logger.error(f"Ошибка при листании логов для chat_id={chat_id}: {str(e)}")
@@ -2,15 +2,21 @@
 
 from aiogram import Router, F
 from aiogram.filters import Command
-from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
 from loguru import logger
 import aiogram
 import time
 import re
 import unicodedata
+from typing import Optional, Tuple
+from bson import ObjectId
 from ..modules.no_sql.user_db import get_user, add_warning, ban_user, unban_user, mute_user, unmute_user, \
-    clear_warnings, get_moderation_logs, OWNER_BOT_ID, log_moderation_action, ROLE_NAMES
+    clear_warnings, get_moderation_logs_page, OWNER_BOT_ID, log_moderation_action, ROLE_NAMES
+from ..modules.bot_permissions import get_bot_member
+from ..modules.name_resolver import resolve_display_names
+from ..modules.no_sql.moderation_rollups import get_daily_summaries
+from ..keyboards.logs import LOGS_CALLBACK_PREFIX, unpack_logs_callback, parse_log_filters, get_logs_pagination_menu
 from motor.motor_asyncio import AsyncIOMotorCollection
 
 # Используем aiogram версии 3.20.0.post0
@@ -29,7 +35,7 @@ async def check_permissions(message: Message, user, required_role: int, chat_id:
 async def check_bot_permissions(message: Message, required_permissions: dict) -> bool:
     """Проверяет, имеет ли бот необходимые права администратора."""
     try:
-        bot_member = await message.bot.get_chat_member(chat_id=message.chat.id, user_id=message.bot.id)
+        bot_member = await get_bot_member(message.bot, message.chat.id)
         has_permissions = bot_member.status == "administrator" and all(
             getattr(bot_member, perm, False) for perm in required_permissions
         )
@@ -788,25 +794,20 @@ async def user_status_handler(message: Message):
     await message.answer(response)
     logger.info(f"Пользователь {user_id} запросил статус {target_user_id} в chat_id={chat_id}")
 
-@router.message(Command(commands=["mod_logs"]))
-async def mod_logs_handler(message: Message):
-    user_id = message.from_user.id
-    chat_id = message.chat.id
-    logger.debug(f"Обработка команды /mod_logs от user_id={user_id}, chat_id={chat_id}, текст: {message.text}")
-    user = await get_user(user_id, create_if_not_exists=True, chat_id=chat_id)
-    if not await check_permissions(message, user, 2, chat_id, "/mod_logs"):
-        return
-
-    logs = await get_moderation_logs(chat_id, limit=10)
+async def render_mod_logs_page(chat_id: int, cursor: Optional[ObjectId] = None, direction: str = "older",
+                               action: Optional[str] = None, target_user_id: Optional[int] = None
+                               ) -> Tuple[Optional[str], Optional[InlineKeyboardMarkup]]:
+    """Формирует текст и кнопки навигации страницы /mod_logs; текст None, если записей нет."""
+    logs, has_older, has_newer = await get_moderation_logs_page(
+        chat_id, limit=10, cursor=cursor, direction=direction, action=action, user_id=target_user_id
+    )
     if not logs:
-        await message.answer("📜 Логи модерации отсутствуют.")
-        logger.info(f"Логи модерации для chat_id={chat_id} пусты")
-        return
-
-    response = "📜 **Последние действия модерации**:\n\n"
+        return None, None
+    # Имена участников и выдавших действие загружаются одним запросом (с кэшем)
+    names = await resolve_display_names([log["user_id"] for log in logs] + [log["issued_by"] for log in logs])
+    filters = ", ".join(item for item in (action, str(target_user_id) if target_user_id else None) if item)
+    response = f"📜 **Действия модерации**{f' ({filters})' if filters else ''}:\n\n"
     for log in logs:
-        target_user = await get_user(log["user_id"], create_if_not_exists=False)
-        issued_by_user = await get_user(log["issued_by"], create_if_not_exists=False)
         action_text = {
             "warn": "⚠️ Предупреждение",
             "clear_warnings": "🧹 Очистка предупреждений",
@@ -818,13 +819,83 @@ async def mod_logs_handler(message: Message):
         }.get(log["action"], log["action"])
         response += (
             f"🔸 **{action_text}**\n"
-            f"👤 Пользователь: {target_user.display_name or log['user_id']}\n"
+            f"👤 Пользователь: {names[log['user_id']]}\n"
             f"📝 Причина: {log['reason']}\n"
-            f"🕒 Выдано: {issued_by_user.display_name or log['issued_by']} в {time.ctime(log['issued_at'])}\n\n"
+            f"🕒 Выдано: {names[log['issued_by']]} в {time.ctime(log['issued_at'])}\n\n"
         )
-    await message.answer(response)
+    return response, get_logs_pagination_menu("m", logs, has_older, has_newer, action, target_user_id)
+
+# Сколько последних дней показывает /mod_logs summary
+MOD_LOGS_SUMMARY_DAYS = 30
+
+async def render_mod_logs_summary(chat_id: int, days: int = MOD_LOGS_SUMMARY_DAYS) -> Optional[str]:
+    """Формирует текст дневных сводок модерации (moderation_rollups) за days дней; None, если сводок нет."""
+    summaries = await get_daily_summaries(chat_id, days)
+    if not summaries:
+        return None
+    response = f"📊 **Сводка модерации за {days} дн.** (завершившиеся дни):\n\n"
+    for summary in summaries:
+        actions = ", ".join(f"{action}: {count}" for action, count in sorted(summary.get("actions", {}).items()))
+        response += f"🔸 {summary['day']} — {summary.get('total', 0)} действий, пользователей: {summary.get('users', 0)} ({actions})\n"
+    return response
+
+@router.message(Command(commands=["mod_logs"]))
+async def mod_logs_handler(message: Message):
+    """
+    Показывает логи модерации постранично: /mod_logs [действие] [user_id] или ответом на сообщение
+    пользователя; листание — кнопками «Новее»/«Старше». /mod_logs summary — дневные сводки.
+    """
+    user_id = message.from_user.id
+    chat_id = message.chat.id
+    logger.debug(f"Обработка команды /mod_logs от user_id={user_id}, chat_id={chat_id}, текст: {message.text}")
+    user = await get_user(user_id, create_if_not_exists=True, chat_id=chat_id)
+    if not await check_permissions(message, user, 2, chat_id, "/mod_logs"):
+        return
+
+    args = message.text.split()[1:]
+    if args and args[0].lower() == "summary":
+        response = await render_mod_logs_summary(chat_id)
+        await message.answer(response or "📊 Дневных сводок модерации пока нет: они строятся по завершившимся дням.")
+        logger.info(f"Пользователь {user_id} запросил сводку модерации для chat_id={chat_id}")
+        return
+    action, target_user_id = parse_log_filters(args)
+    if message.reply_to_message and message.reply_to_message.from_user:
+        target_user_id = message.reply_to_message.from_user.id
+    response, markup = await render_mod_logs_page(chat_id, action=action, target_user_id=target_user_id)
+    if response is None:
+        await message.answer("📜 Логи модерации отсутствуют.")
+        logger.info(f"Логи модерации для chat_id={chat_id} пусты")
+        return
+    await message.answer(response, reply_markup=markup)
     logger.info(f"Пользователь {user_id} запросил логи модерации для chat_id={chat_id}")
 
+@router.callback_query(F.data.startswith(f"{LOGS_CALLBACK_PREFIX}:m:"))
+async def mod_logs_page_callback(callback: CallbackQuery):
+    """Листание страниц /mod_logs."""
+    user_id = callback.from_user.id
+    chat_id = callback.message.chat.id
+    page = unpack_logs_callback(callback.data)
+    if page is None or not ObjectId.is_valid(page["cursor"]):
+        await callback.answer("🚫 Некорректные данные страницы.")
+        return
+    user = await get_user(user_id, create_if_not_exists=True, chat_id=chat_id)
+    if user.role_level < 2 and user.user_id != OWNER_BOT_ID and chat_id not in user.server_owner_chat_ids:
+        await callback.answer(f"🚫 Требуется роль {ROLE_NAMES[2]} или выше.", show_alert=True)
+        logger.warning(f"Пользователь {user_id} попытался листать /mod_logs без прав, chat_id={chat_id}")
+        return
+    response, markup = await render_mod_logs_page(
+        chat_id, cursor=ObjectId(page["cursor"]), direction=page["direction"],
+        action=page["action"], target_user_id=page["user_id"]
+    )
+    if response is None:
+        await callback.answer("📜 Больше записей нет.")
+        return
+    try:
+        await callback.message.edit_text(response, reply_markup=markup)
+    except TelegramBadRequest as e:
+        logger.debug(f"Страница /mod_logs не изменилась в chat_id={chat_id}: {str(e)}")
+    await callback.answer()
+
 @router.message(Command(commands=["list_users"]))
 async def list_users_handler(message: Message):
     user_id = message.from_user.id
@@ -876,8 +947,9 @@ async def help_moderation_handler(message: Message):
         "  📋 Пример: `/kick @Username спам`, `/kick 🦈⃤ҔᴀнЧᴀнk нарушил правила`\n\n"
         f"🔸 **/user_status <user_id | @username | имя>** — Показать статус пользователя (роль: **{ROLE_NAMES[3]}**).\n"
         "  📋 Пример: `/user_status @Username`, `/user_status 🦈⃤ҔᴀнЧᴀнk`\n\n"
-        f"🔸 **/mod_logs** — Показать последние действия модерации (роль: **{ROLE_NAMES[2]}**).\n"
-        "  📋 Пример: `/mod_logs`\n\n"
+        f"🔸 **/mod_logs** — Показать действия модерации постранично (роль: **{ROLE_NAMES[2]}**).\n"
+        "  📋 Пример: `/mod_logs`, `/mod_logs mute`, `/mod_logs ban 123456789` или ответом на сообщение\n"
+        "  📊 `/mod_logs summary` — сводка по дням за последние 30 дней\n\n"
         f"🔸 **/list_users** — Показать список пользователей чата (роль: **{ROLE_NAMES[1]}**).\n"
         "  📋 Пример: `/list_users`\n\n"
         "📌 Укажите пользователя через user_id, @username, имя или ответьте на сообщение."
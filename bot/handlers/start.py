@@ -5,7 +5,7 @@ from aiogram.filters import Command
 from aiogram.types import Message
 from aiogram.exceptions import TelegramBadRequest
 from bot.modules.no_sql.user_db import User, get_user, set_server_owner, OWNER_BOT_ID, ROLE_NAMES
-from bot.handlers.common import register_all_chat_members
+from bot.modules import member_sync
 from loguru import logger
 import time
 from typing import Optional
@@ -129,9 +129,9 @@ async def start_handler(message: Message) -> None:
                             user = await get_user(user_id, create_if_not_exists=False, chat_id=chat_id)
                             logger.info(f"Пользователь {user_id} определен как владелец чата {chat_id} через API")
 
-                # Регистрируем всех участников чата
-                await register_all_chat_members(chat_id, message.bot)
-                logger.info(f"Успешная регистрация участников для chat_id={chat_id}")
+                # Регистрация участников идет в фоне, чтобы не держать очередь обновлений чата
+                member_sync.start_sync(chat_id, message.bot)
+                logger.info(f"Запущена регистрация участников для chat_id={chat_id}")
             except TelegramBadRequest as e:
                 logger.warning(f"Не удалось зарегистрировать участников чата {chat_id}: {str(e)}")
                 if user.role_level >= 6:
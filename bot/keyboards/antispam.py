@@ -38,6 +38,7 @@ def get_filter_settings_menu(filter_name: str) -> InlineKeyboardMarkup:
     ]
     if filter_name == "flood":
         buttons.append([InlineKeyboardButton(text="Период (сек)", callback_data=f"set_flood_seconds_{filter_name}")])
+        buttons.append([InlineKeyboardButton(text="Режим окна (фиксированное/скользящее)", callback_data=f"set_flood_mode_{filter_name}")])
     buttons.append([InlineKeyboardButton(text="Назад", callback_data="select_filter")])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
@@ -0,0 +1,65 @@
+# Путь файла: bot/keyboards/logs.py
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from typing import Dict, List, Optional, Tuple
+
+# Префикс callback_data навигации по логам; вид: m — /mod_logs, s — /view_spam_logs
+LOGS_CALLBACK_PREFIX = "mlog"
+LOG_VIEWS = ("m", "s")
+# Действия, по которым можно фильтровать логи (совпадают с VALID_MODERATION_ACTIONS в user_db)
+LOG_ACTIONS = ("warn", "ban", "mute", "unban", "unmute", "kick", "clear_warnings", "delete")
+
+def pack_logs_callback(view: str, direction: str, cursor: str, action: Optional[str] = None,
+                       user_id: Optional[int] = None) -> str:
+    """
+    Упаковывает состояние страницы логов в callback_data (не длиннее 64 байт):
+    mlog:<вид>:<o|n>:<_id записи>:<действие|->:<user_id|->.
+    """
+    return f"{LOGS_CALLBACK_PREFIX}:{view}:{direction}:{cursor}:{action or '-'}:{user_id or '-'}"
+
+def unpack_logs_callback(data: str) -> Optional[Dict]:
+    """Разбирает callback_data навигации по логам; возвращает None для чужих или поврежденных данных."""
+    parts = data.split(":")
+    if len(parts) != 6 or parts[0] != LOGS_CALLBACK_PREFIX or parts[1] not in LOG_VIEWS or parts[2] not in ("o", "n"):
+        return None
+    action = None if parts[4] == "-" else parts[4]
+    if action is not None and action not in LOG_ACTIONS:
+        return None
+    try:
+        user_id = None if parts[5] == "-" else int(parts[5])
+    except ValueError:
+        return None
+    return {
+        "view": parts[1],
+        "direction": "older" if parts[2] == "o" else "newer",
+        "cursor": parts[3],
+        "action": action,
+        "user_id": user_id
+    }
+
+def parse_log_filters(args: List[str]) -> Tuple[Optional[str], Optional[int]]:
+    """Извлекает фильтры из аргументов команды: тип действия и ID пользователя."""
+    action = None
+    user_id = None
+    for arg in args:
+        if arg.lower() in LOG_ACTIONS:
+            action = arg.lower()
+        elif arg.isdigit():
+            user_id = int(arg)
+    return action, user_id
+
+def get_logs_pagination_menu(view: str, logs: List[Dict], has_older: bool, has_newer: bool,
+                             action: Optional[str] = None, user_id: Optional[int] = None) -> Optional[InlineKeyboardMarkup]:
+    """Создает кнопки «Новее»/«Старше» для страницы логов (записи новые первыми)."""
+    if not logs:
+        return None
+    row = []
+    if has_newer:
+        row.append(InlineKeyboardButton(
+            text="⬅️ Новее", callback_data=pack_logs_callback(view, "n", str(logs[0]["_id"]), action, user_id)
+        ))
+    if has_older:
+        row.append(InlineKeyboardButton(
+            text="Старше ➡️", callback_data=pack_logs_callback(view, "o", str(logs[-1]["_id"]), action, user_id)
+        ))
+    return InlineKeyboardMarkup(inline_keyboard=[row]) if row else None
@@ -1,5 +1,9 @@
 # Путь файла: bot/main.py
 
+import time
+# Момент запуска процесса для метрик startup: записывается до импорта тяжелых зависимостей
+PROCESS_STARTED_AT = time.monotonic()
+
 import os
 import sys
 import asyncio
@@ -10,7 +14,6 @@ from aiogram import __version__ as aiogram_version
 from dotenv import load_dotenv
 from loguru import logger
 from contextlib import asynccontextmanager
-from aiogram.exceptions import TelegramAPIError
 
 # Проверка версии Python
 MIN_PYTHON_VERSION = (3, 8)
@@ -42,10 +45,17 @@ logger.debug(f"Updated sys.path: {sys.path}")
 # Импорты
 try:
     logger.debug("Importing MongoClient and handlers...")
-    from bot.modules.no_sql.user_db import init_user_collection, init_moderation_logs_collection, get_known_chats
-    from bot.modules.no_sql.redis_client import redis_client
+    from bot.modules import startup
+    startup.set_process_start(PROCESS_STARTED_AT)
+    from bot.modules.no_sql.user_db import init_user_collection, init_moderation_logs_collection, get_known_chats, \
+        start_user_repairs, stop_user_repairs, start_moderation_logs, stop_moderation_logs
+    from bot.modules.no_sql.redis_client import start_redis, close_redis, stop_kick_inactive
+    from bot.modules.no_sql import memberships, migrations, moderation_rollups
+    from bot.modules.dnsbl import close_session as close_dnsbl_session
+    from bot.modules import local_counters, send_queue, member_sync, sharding, chat_serializer
+    from bot.modules.bot_permissions import get_bot_member
+    from bot.modules.webhook_server import run_webhook
     from bot.handlers import start, admin, common, moderation, antispam
-    from bot.handlers.common import register_all_chat_members
     logger.debug("Imports successful")
 except ImportError as e:
     logger.error(f"Import error: {e}")
@@ -62,6 +72,8 @@ logger.debug("Loading environment variables from .env...")
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', 'config', '.env'))
 
 API_TOKEN = os.getenv("BOT_TOKEN")
+# Режим получения обновлений: 'polling' (по умолчанию) или 'webhook' (см. bot/modules/webhook_server.py)
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
 MONGO_URI = os.getenv("MONGO_URI")
 if not API_TOKEN:
     logger.error("BOT_TOKEN не найден в переменных окружения!")
@@ -77,6 +89,7 @@ logger.debug("Initializing Bot and Dispatcher...")
 try:
     bot = Bot(token=API_TOKEN)
     dp = Dispatcher()
+    dp.update.outer_middleware(startup.FirstUpdateMiddleware())
     logger.debug("Bot and Dispatcher initialized successfully")
 except Exception as e:
     logger.error(f"Error initializing Bot or Dispatcher: {e}")
@@ -95,51 +108,147 @@ except AttributeError as e:
     logger.error(f"Ошибка при регистрации маршрутизаторов: {e}")
     sys.exit(1)
 
+async def init_storage():
+    """Обязательная стадия: индексы MongoDB, проверка версии схемы и подключение к Redis."""
+    await init_user_collection()
+    await init_moderation_logs_collection()
+    await memberships.init_memberships_collection()
+    await moderation_rollups.init_rollups_collection()
+    # При запуске только проверяется версия схемы; сами миграции выполняются в фоне
+    await migrations.check_schema_version()
+    logger.info("MongoDB collections initialized: users, moderation_logs, memberships, moderation_logs_daily")
+    await start_redis()
+
+async def sync_known_chats():
+    """Фоновая стадия: регистрация участников известных чатов."""
+    known_chats = await get_known_chats()
+    logger.info(f"Found {len(known_chats)} known chats: {known_chats}")
+    # В режиме рабочих процессов каждый процесс синхронизирует только свои чаты; при повторе
+    # стадии уже синхронизированные чаты пропускаются
+    chat_ids = [
+        chat_id for chat_id in known_chats
+        if sharding.owns_chat(chat_id) and member_sync.get_progress(chat_id).get("status") not in ("done", "skipped")
+    ]
+    results = await asyncio.gather(*(member_sync.start_sync(chat_id, bot) for chat_id in chat_ids), return_exceptions=True)
+    failed = {chat_id: result for chat_id, result in zip(chat_ids, results) if isinstance(result, Exception)}
+    if failed:
+        # Ошибка передается supervise, чтобы стадия повторилась или была отмечена failed
+        raise RuntimeError(f"Не удалось синхронизировать участников {len(failed)} чатов: {failed}")
+    logger.info(f"Auto-registration of chat members completed: {member_sync.get_progress()}")
+
+async def warm_up_bot_rights():
+    """Фоновая стадия: загрузка прав бота в известных чатах, чтобы первые сообщения не ждали Telegram."""
+    for chat_id in await get_known_chats():
+        if not sharding.owns_chat(chat_id):
+            continue
+        try:
+            await get_bot_member(bot, chat_id)
+        except Exception as e:
+            logger.warning(f"Не удалось загрузить права бота для chat_id={chat_id}: {str(e)}")
+
 @asynccontextmanager
 async def lifespan():
+    """
+    Поэтапный запуск: обязательные стадии (индексы, Redis) выполняются до поллинга, а регистрация
+    участников, прогрев кэшей и миграции — в фоне под наблюдением startup после его старта.
+    """
     logger.info("Инициализация бота...")
     try:
-        # Инициализация MongoDB
-        logger.debug("Starting MongoClient initialization...")
-        await init_user_collection()
-        await init_moderation_logs_collection()
-        logger.info("MongoDB collections initialized: users, moderation_logs")
-        # Проверка работы бота
-        logger.debug("Checking bot availability with get_me...")
-        bot_info = await bot.get_me()
-        logger.info(f"Bot is active: {bot_info.username}")
-
-        # Регистрация всех участников известных чатов
-        logger.debug("Starting auto-registration of chat members...")
-        known_chats = await get_known_chats()
-        logger.info(f"Found {len(known_chats)} known chats: {known_chats}")
-        for chat_id in known_chats:
-            try:
-                await register_all_chat_members(chat_id, bot)
-                logger.info(f"Зарегистрированы участники для chat_id={chat_id}")
-            except TelegramAPIError as e:
-                logger.error(f"Ошибка при регистрации участников для chat_id={chat_id}: {str(e)}")
-                logger.warning(f"Пропущена регистрация для chat_id={chat_id}. Используйте /force_register_all для ручной регистрации.")
-            except Exception as e:
-                logger.error(f"Неизвестная ошибка при регистрации участников для chat_id={chat_id}: {str(e)}")
-                logger.warning(f"Пропущена регистрация для chat_id={chat_id}. Проверьте конфигурацию.")
-        logger.info("Auto-registration of chat members completed")
+        await startup.run_stage("storage", init_storage)
+        await local_counters.start()
+        start_user_repairs()
+        start_moderation_logs()
+        memberships.start()
+        startup.mark_ready()
+        startup.supervise("member_sync", sync_known_chats)
+        startup.supervise("bot_rights_warmup", warm_up_bot_rights)
+        startup.supervise("migrations", migrations.run_pending)
+        # Сводки общие для всех чатов, поэтому в режиме рабочих процессов их строит только процесс 0
+        if sharding.WORKER_INDEX in (None, 0):
+            startup.supervise("moderation_rollups", moderation_rollups.run_forever)
         yield
     except Exception as e:
         logger.error(f"Ошибка при инициализации: {e}")
         raise
     finally:
         logger.info("Завершение работы бота...")
+        await startup.stop()
+        await member_sync.stop_all()
+        await stop_kick_inactive()
+        await send_queue.drain()
         await bot.session.close()
         logger.debug("Bot session closed")
+        await close_dnsbl_session()
+        await local_counters.stop()
+        await stop_user_repairs()
+        await stop_moderation_logs()
+        await memberships.stop()
+        await close_redis()
         logger.info("Все соединения закрыты")
 
+def use_chat_serializer():
+    """
+    Обновления одного чата — по очереди, разных чатов — параллельно (см. chat_serializer).
+    Регистрируется только там, где обновления обрабатываются: в одиночном режиме и в рабочем
+    процессе, владеющем чатом. Фронтальный процесс пересылает обновления без объединения.
+    """
+    dp.update.outer_middleware(chat_serializer.ChatSerializerMiddleware(
+        overflow_handler=antispam.check_overflow_message, is_privileged=antispam.is_chat_staff
+    ))
+
+async def receive_updates(**polling_kwargs):
+    """Получает обновления в выбранном режиме: поллинг или вебхук."""
+    if BOT_MODE == "webhook":
+        logger.info("Запуск бота в режиме вебхука...")
+        await run_webhook(dp, bot)
+    else:
+        logger.info("Запуск поллинга бота...")
+        await dp.start_polling(bot, polling_timeout=30, **polling_kwargs)
+        logger.info("Поллинг завершён")
+
+async def worker_main(queue):
+    """Рабочий процесс: полный запуск бота, обновления приходят из очереди фронтального процесса."""
+    use_chat_serializer()
+    async with lifespan():
+        handled = await sharding.consume(
+            queue, lambda update: dp.feed_raw_update(bot, update), max_in_flight=sharding.WORKER_CONCURRENCY
+        )
+        logger.info(f"Рабочий процесс {sharding.WORKER_INDEX} обработал обновлений: {handled}")
+
+def run_worker(index, queue, workers):
+    """Точка входа рабочего процесса (multiprocessing, spawn)."""
+    # Остановкой управляет фронтальный процесс через сигнал в очереди
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    sharding.set_worker(index, workers)
+    # Лимит Bot API общий для бота, поэтому делится между процессами
+    send_queue.set_global_rate(send_queue.GLOBAL_RATE / workers)
+    asyncio.run(worker_main(queue))
+
+async def run_front():
+    """
+    Фронтальный процесс: принимает обновления (поллинг или вебхук) и распределяет их по
+    рабочим процессам по chat_id, не обрабатывая на месте.
+    """
+    router = sharding.ShardRouter(sharding.BOT_WORKERS)
+    router.start(run_worker)
+    dp.update.outer_middleware(sharding.ForwardingMiddleware(router))
+    startup.mark_ready()
+    try:
+        # Обновления передаются по одному, чтобы порядок в очереди совпадал с порядком получения
+        await receive_updates(handle_as_tasks=False)
+    finally:
+        await asyncio.get_running_loop().run_in_executor(None, router.stop)
+        await bot.session.close()
+
 async def main():
+    if sharding.BOT_WORKERS > 1:
+        logger.info(f"Запуск в режиме рабочих процессов: {sharding.BOT_WORKERS}")
+        await run_front()
+        return
+    use_chat_serializer()
     async with lifespan():
         try:
-            logger.info("Запуск поллинга бота...")
-            await dp.start_polling(bot, polling_timeout=30)
-            logger.info("Поллинг завершён")
+            await receive_updates()
         except Exception as e:
             logger.error(f"Ошибка во время поллинга: {e}")
             raise
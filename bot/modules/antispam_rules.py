@@ -0,0 +1,181 @@
+# Путь файла: bot/modules/antispam_rules.py
+
+import re
+from typing import Awaitable, Callable, Dict, List, Optional
+from aiogram.types import Message
+from loguru import logger
+from .spam_words import SpamWordsMatcher, get_message_hash
+from . import local_counters
+from .no_sql.redis_client import check_flood, count_repeated_messages, get_settings_version
+
+# Регулярные выражения, общие для всех чатов
+TELEGRAM_LINK_PATTERN = re.compile(
+    r"(?:https?:\/\/)?(?:t(?:elegram)?\.me|t\.me|tg:\/\/resolve\?domain=|telegram\.me)\/[\w\d_+]+|@[\w\d_]{4,}",
+    re.IGNORECASE
+)
+TELEGRAM_LINK_PREFIX = re.compile(r"^(?:@|https?://|tg://resolve\?domain=|(?:t|telegram)\.me/)+", re.IGNORECASE)
+URL_DOMAIN_PATTERN = re.compile(r"https?://([A-Za-z0-9.-]+)", re.IGNORECASE)
+
+class Violation:
+    """Результат срабатывания антиспам-фильтра."""
+    __slots__ = ("filter_type", "reason", "default_action", "delete_message", "details")
+
+    def __init__(self, filter_type: str, reason: str, default_action: str,
+                 delete_message: bool = False, details: str = ""):
+        self.filter_type = filter_type
+        self.reason = reason
+        self.default_action = default_action
+        self.delete_message = delete_message
+        self.details = details
+
+class CompiledAntispamRules:
+    """
+    Скомпилированные правила антиспама для одного чата.
+
+    Собирается один раз на версию настроек: регулярные выражения компилируются заранее,
+    списки исключений и игнорируемых слов превращаются в frozenset, а в self.filters
+    попадают только включенные фильтры в порядке проверки.
+    """
+
+    def __init__(self, settings: Dict, version: int = 0,
+                 domain_checker: Optional[Callable[[List[str]], Awaitable[Optional[str]]]] = None):
+        self.source = settings
+        self.version = version
+        self.domain_checker = domain_checker
+        self.enabled = settings.get("enabled", False)
+        self.case_sensitive = settings.get("case_sensitive", False)
+
+        exceptions = settings.get("exceptions", {})
+        self.exempt_users = frozenset(str(user) for user in exceptions.get("users", []))
+        self.exempt_domains = frozenset(domain.lower() for domain in exceptions.get("domains", []))
+        self.ignored_words = frozenset(settings.get("ignored_words", []))
+
+        flood = settings.get("flood", {})
+        self.flood_limit = flood.get("limit", settings.get("max_messages_per_minute", 10))
+        self.flood_seconds = flood.get("seconds", 10)
+        self.flood_mode = flood.get("mode", "fixed")
+        self.repeated_messages_limit = settings.get("repeated_messages", {}).get("limit", 5)
+        self.repeated_words_limit = settings.get("repeated_words", {}).get(
+            "limit", settings.get("repeated_words_limit", 5))
+
+        spam_words = settings.get("spam_words", {}).get("words", [])
+        self.spam_words_matcher = SpamWordsMatcher(spam_words, self.case_sensitive) if spam_words else None
+
+        # Порядок фильтров совпадает с исторической последовательностью проверок в check_spam
+        self.filters: List[Callable[[Message, str], Awaitable[Optional[Violation]]]] = []
+        if settings.get("telegram_links", {}).get("enabled", False):
+            self.filters.append(self._check_telegram_links)
+        if settings.get("media_filter", {}).get("enabled", False):
+            self.filters.append(self._check_media)
+        if flood.get("enabled", True):
+            self.filters.append(self._check_flood)
+        if settings.get("repeated_messages", {}).get("enabled", True):
+            self.filters.append(self._check_repeated_messages)
+        if settings.get("repeated_words", {}).get("enabled", True):
+            self.filters.append(self._check_repeated_words)
+        if settings.get("spam_words", {}).get("enabled", True) and self.spam_words_matcher:
+            self.filters.append(self._check_spam_words)
+        if settings.get("external_links", {}).get("enabled", False) and domain_checker is not None:
+            self.filters.append(self._check_external_links)
+
+    def is_exempt_user(self, user_id: int) -> bool:
+        """Проверяет, находится ли пользователь в исключениях чата."""
+        return str(user_id) in self.exempt_users
+
+    async def run(self, message: Message, text: str) -> Optional[Violation]:
+        """Прогоняет сообщение через включенные фильтры и возвращает первое нарушение."""
+        for check in self.filters:
+            violation = await check(message, text)
+            if violation:
+                return violation
+        return None
+
+    async def _check_telegram_links(self, message: Message, text: str) -> Optional[Violation]:
+        matches = TELEGRAM_LINK_PATTERN.findall(text)
+        if not matches:
+            return None
+        for match in matches:
+            if TELEGRAM_LINK_PREFIX.sub("", match).lower() in self.exempt_domains:
+                return None
+        return Violation("telegram_links", f"Telegram-ссылка: {', '.join(matches)}", "mute", delete_message=True)
+
+    async def _check_media(self, message: Message, text: str) -> Optional[Violation]:
+        if any([message.photo, message.video, message.audio, message.document, message.sticker, message.animation]):
+            return Violation("media_filter", "Медиа-контент", "delete")
+        return None
+
+    async def _check_flood(self, message: Message, text: str) -> Optional[Violation]:
+        chat_id = message.chat.id
+        user_id = message.from_user.id
+        flood_checker = local_counters.check_flood if local_counters.is_local_engine() else check_flood
+        flooding, ttl = await flood_checker(chat_id, user_id, self.flood_limit, self.flood_seconds, self.flood_mode)
+        if flooding:
+            return Violation(
+                "flood", f"Флуд: превышен лимит ({self.flood_limit}/{self.flood_seconds} сек)", "mute",
+                details=f", ttl={ttl} сек"
+            )
+        return None
+
+    async def _check_repeated_messages(self, message: Message, text: str) -> Optional[Violation]:
+        limit = self.repeated_messages_limit
+        if local_counters.is_local_engine():
+            if await local_counters.check_repeated_message(message.chat.id, message.from_user.id, get_message_hash(text), limit):
+                return Violation("repeated_messages", f"Повторение сообщений: {text[:100]}", "warn")
+            return None
+        repeats = await count_repeated_messages(message.chat.id, message.from_user.id, get_message_hash(text), limit)
+        if repeats >= limit:
+            return Violation("repeated_messages", f"Повторение сообщений: {text[:100]}", "warn")
+        return None
+
+    async def _check_repeated_words(self, message: Message, text: str) -> Optional[Violation]:
+        limit = self.repeated_words_limit
+        words = [word for word in text.split() if word.lower() not in self.ignored_words]
+        if len(words) < limit:
+            return None
+        repeated_count = 1
+        prev_word = None
+        for word in words:
+            current_word = word if self.case_sensitive else word.lower()
+            if prev_word and current_word == prev_word:
+                repeated_count += 1
+                if repeated_count >= limit:
+                    return Violation("repeated_words", f"Повторение слов: {word}", "warn")
+            else:
+                repeated_count = 1
+            prev_word = current_word
+        return None
+
+    async def _check_spam_words(self, message: Message, text: str) -> Optional[Violation]:
+        matched = self.spam_words_matcher.find_all(text)
+        if matched:
+            return Violation("spam_words", f"Запрещенные слова: {', '.join(matched[:10])}", "ban")
+        return None
+
+    async def _check_external_links(self, message: Message, text: str) -> Optional[Violation]:
+        domains = [domain for domain in URL_DOMAIN_PATTERN.findall(text) if domain.lower() not in self.exempt_domains]
+        if not domains:
+            return None
+        listed = await self.domain_checker(domains)
+        if listed:
+            return Violation("external_links", f"Спам-ссылка: {listed}", "delete")
+        return None
+
+# Скомпилированные правила по чатам: str(chat_id) -> CompiledAntispamRules
+_compiled_rules: Dict[str, CompiledAntispamRules] = {}
+
+def get_compiled_rules(chat_id, settings: Dict,
+                       domain_checker: Optional[Callable[[List[str]], Awaitable[Optional[str]]]] = None) -> CompiledAntispamRules:
+    """
+    Возвращает скомпилированные правила антиспама для чата.
+
+    Правила пересобираются только если save_settings изменил версию настроек
+    или кэш get_settings вернул другой объект настроек.
+    """
+    key = str(chat_id)
+    version = get_settings_version("antispam", key)
+    rules = _compiled_rules.get(key)
+    if rules is None or rules.version != version or rules.source is not settings:
+        rules = CompiledAntispamRules(settings, version, domain_checker)
+        _compiled_rules[key] = rules
+        logger.debug(f"Скомпилированы правила антиспама для chat_id={key}, версия {version}, фильтров: {len(rules.filters)}")
+    return rules
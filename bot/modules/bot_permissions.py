@@ -0,0 +1,49 @@
+# Путь файла: bot/modules/bot_permissions.py
+
+import time
+from typing import Dict, Optional, Tuple
+from aiogram import Bot
+from aiogram.types import ChatMember
+from loguru import logger
+
+# Кэш прав бота по чатам: chat_id -> (ChatMember бота, время получения)
+_bot_rights: Dict[int, Tuple[ChatMember, float]] = {}
+
+# Страховочный TTL на случай пропущенного обновления my_chat_member
+BOT_RIGHTS_TTL = 3600
+
+async def get_bot_member(bot: Bot, chat_id: int, refresh: bool = False) -> ChatMember:
+    """
+    Возвращает ChatMember бота в указанном чате из кэша, запрашивая Telegram только при промахе.
+
+    Args:
+        bot: Экземпляр бота aiogram.
+        chat_id: ID чата.
+        refresh: Принудительно обновить запись из Telegram.
+
+    Возвращает:
+        ChatMember: Статус и права бота в чате.
+    """
+    cached = _bot_rights.get(chat_id)
+    if cached and not refresh and time.time() - cached[1] < BOT_RIGHTS_TTL:
+        return cached[0]
+    member = await bot.get_chat_member(chat_id=chat_id, user_id=bot.id)
+    _bot_rights[chat_id] = (member, time.time())
+    logger.debug(f"Права бота загружены из Telegram для chat_id={chat_id}: status={member.status}")
+    return member
+
+def update_bot_member(chat_id: int, member: ChatMember) -> None:
+    """Обновляет кэш прав бота из обновления my_chat_member."""
+    _bot_rights[chat_id] = (member, time.time())
+    logger.info(f"Права бота обновлены из my_chat_member для chat_id={chat_id}: status={member.status}")
+
+def invalidate_bot_member(chat_id: Optional[int] = None) -> None:
+    """Сбрасывает кэш прав бота для чата или целиком."""
+    if chat_id is None:
+        _bot_rights.clear()
+    else:
+        _bot_rights.pop(chat_id, None)
+
+def is_admin_with_manage_chat(member: ChatMember) -> bool:
+    """Проверяет, что бот является администратором с правом 'Manage Chat'."""
+    return member.status == "administrator" and bool(getattr(member, "can_manage_chat", False))
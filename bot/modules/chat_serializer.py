@@ -0,0 +1,132 @@
+# Путь файла: bot/modules/chat_serializer.py
+
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional
+from aiogram import BaseMiddleware
+from aiogram.types import Message, TelegramObject, Update
+from loguru import logger
+
+# Сколько обновлений одного чата может ждать обработки, прежде чем сообщения начнут объединяться
+CHAT_QUEUE_LIMIT = int(os.getenv("CHAT_QUEUE_LIMIT", "20"))
+
+class _ChatState:
+    """Очередь обработки одного чата."""
+    __slots__ = ("lock", "waiting", "overflow")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()  # Будит ожидающих в порядке поступления (FIFO)
+        self.waiting = 0
+        # Ожидающее сообщение сверх лимита от каждого отправителя: user_id -> событие «заменено более новым»
+        self.overflow: Dict[int, asyncio.Event] = {}
+
+class ChatSerializerMiddleware(BaseMiddleware):
+    """
+    Внешний middleware обновлений: обновления одного чата обрабатываются строго по очереди,
+    разных чатов — параллельно.
+
+    Это убирает гонки проверка-действие в check_spam и apply_antispam_action для одного чата.
+    Если в очереди чата уже queue_limit обновлений (флуд или рейд), обычные сообщения объединяются:
+    от каждого отправителя в очереди остается только последнее, а вытесненные передаются
+    в overflow_handler — дешевую проверку без полной цепочки обработчиков (например, удаление спама).
+    Не объединяются и всегда ставятся в очередь обновления без сообщения (callback_query,
+    my_chat_member и т. п.), команды, сообщения от имени чата или канала и сообщения
+    отправителей, для которых is_privileged возвращает True (администрация чата).
+    """
+
+    def __init__(self, queue_limit: int = CHAT_QUEUE_LIMIT,
+                 overflow_handler: Optional[Callable[[Message, Dict[str, Any]], Awaitable[Any]]] = None,
+                 is_privileged: Optional[Callable[[int, int], Awaitable[bool]]] = None):
+        self.queue_limit = queue_limit
+        self.overflow_handler = overflow_handler
+        self.is_privileged = is_privileged
+        self._chats: Dict[int, _ChatState] = {}
+        self.stats = {"merged": 0, "max_waiting": 0}
+
+    async def _mergeable_sender(self, chat_id: int, event: TelegramObject) -> Optional[int]:
+        """user_id отправителя, если сообщение можно объединять при переполнении, иначе None."""
+        message = event.message if isinstance(event, Update) else None
+        if message is None or message.from_user is None or message.sender_chat is not None:
+            return None
+        if (message.text or "").startswith("/"):
+            return None
+        if self.is_privileged is not None:
+            try:
+                if await self.is_privileged(chat_id, message.from_user.id):
+                    return None
+            except Exception as e:
+                logger.error(f"Ошибка при проверке прав отправителя {message.from_user.id} в chat_id={chat_id}: {str(e)}")
+                return None
+        return message.from_user.id
+
+    @staticmethod
+    async def _acquire_unless(lock: asyncio.Lock, superseded: asyncio.Event) -> bool:
+        """Ждет очереди чата, пока сообщение не вытеснено; True — блокировка захвачена."""
+        acquire = asyncio.ensure_future(lock.acquire())
+        replaced = asyncio.ensure_future(superseded.wait())
+        try:
+            await asyncio.wait({acquire, replaced}, return_when=asyncio.FIRST_COMPLETED)
+        except BaseException:
+            replaced.cancel()
+            acquire.cancel()
+            if acquire.done() and not acquire.cancelled():
+                lock.release()
+            raise
+        replaced.cancel()
+        if not acquire.done():
+            acquire.cancel()
+            try:
+                await acquire
+            except asyncio.CancelledError:
+                pass
+        # Если блокировка успела захватиться, сообщение обрабатывается полностью
+        return not acquire.cancelled()
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        chat = data.get("event_chat")
+        if chat is None:
+            return await handler(event, data)
+        state = self._chats.get(chat.id)
+        if state is None:
+            state = self._chats[chat.id] = _ChatState()
+        sender = None
+        superseded = None
+        if state.waiting >= self.queue_limit:
+            sender = await self._mergeable_sender(chat.id, event)
+            if sender is not None:
+                previous = state.overflow.get(sender)
+                if previous is not None:
+                    previous.set()
+                superseded = state.overflow[sender] = asyncio.Event()
+        state.waiting += 1
+        self.stats["max_waiting"] = max(self.stats["max_waiting"], state.waiting)
+        try:
+            if superseded is None:
+                await state.lock.acquire()
+                acquired = True
+            else:
+                acquired = await self._acquire_unless(state.lock, superseded)
+        finally:
+            state.waiting -= 1
+            if superseded is not None and state.overflow.get(sender) is superseded:
+                del state.overflow[sender]
+            if superseded is not None and state.waiting == 0 and not state.lock.locked() and self._chats.get(chat.id) is state:
+                del self._chats[chat.id]
+        if not acquired:
+            # Пока сообщение ждало, этот отправитель прислал новое: полностью обработается последнее
+            self.stats["merged"] += 1
+            logger.debug(f"Сообщение update_id={event.update_id} в chat_id={chat.id} вытеснено более новым от user_id={sender}")
+            if self.overflow_handler is not None:
+                return await self.overflow_handler(event.message, data)
+            return None
+        try:
+            return await handler(event, data)
+        finally:
+            state.lock.release()
+            if state.waiting == 0 and not state.lock.locked() and self._chats.get(chat.id) is state:
+                del self._chats[chat.id]
+
+    def backlog(self) -> Dict[int, int]:
+        """Количество ожидающих обновлений по чатам."""
+        return {chat_id: state.waiting for chat_id, state in self._chats.items() if state.waiting}
@@ -0,0 +1,163 @@
+# Путь файла: bot/modules/dnsbl.py
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+import aiohttp
+from loguru import logger
+
+# Адрес сервиса проверки доменов; переопределяется через окружение (например, на локальный стаб в тестах)
+DNSBL_URL = os.getenv("DNSBL_URL", "http://zen.spamhaus.org/query/dnsbl")
+# Таймаут одного HTTP-запроса и общий бюджет ожидания на сообщение (секунды)
+DNSBL_REQUEST_TIMEOUT = float(os.getenv("DNSBL_REQUEST_TIMEOUT", "3"))
+DNSBL_LATENCY_BUDGET = float(os.getenv("DNSBL_LATENCY_BUDGET", "0.3"))
+# TTL вердиктов: домен в списке / чистый домен
+DNSBL_POSITIVE_TTL = int(os.getenv("DNSBL_POSITIVE_TTL", "86400"))
+DNSBL_NEGATIVE_TTL = int(os.getenv("DNSBL_NEGATIVE_TTL", "3600"))
+DNSBL_CACHE_SIZE = int(os.getenv("DNSBL_CACHE_SIZE", "10000"))
+# Дополнительно хранить вердикты в Redis (общий кэш для нескольких процессов)
+DNSBL_REDIS_CACHE = os.getenv("DNSBL_REDIS_CACHE", "false").lower() in ("1", "true", "yes")
+
+# Общая HTTP-сессия с пулом соединений
+_session: Optional[aiohttp.ClientSession] = None
+# Локальный кэш вердиктов: domain -> (в списке, время истечения)
+_verdicts: "OrderedDict[str, Tuple[bool, float]]" = OrderedDict()
+# Незавершенные проверки, чтобы один домен не запрашивался параллельно несколько раз
+_pending: Dict[str, asyncio.Task] = {}
+
+def get_session() -> aiohttp.ClientSession:
+    """Возвращает общую HTTP-сессию, создавая ее при первом обращении."""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=DNSBL_REQUEST_TIMEOUT),
+            connector=aiohttp.TCPConnector(limit=50, ttl_dns_cache=300)
+        )
+        logger.debug("Создана общая HTTP-сессия для DNSBL")
+    return _session
+
+async def close_session() -> None:
+    """Закрывает общую HTTP-сессию и отменяет незавершенные проверки."""
+    global _session
+    for task in list(_pending.values()):
+        task.cancel()
+    _pending.clear()
+    if _session is not None and not _session.closed:
+        await _session.close()
+        logger.debug("HTTP-сессия DNSBL закрыта")
+    _session = None
+
+def clear_cache() -> None:
+    """Очищает локальный кэш вердиктов."""
+    _verdicts.clear()
+
+def _get_cached(domain: str) -> Optional[bool]:
+    cached = _verdicts.get(domain)
+    if cached is None:
+        return None
+    if cached[1] < time.monotonic():
+        del _verdicts[domain]
+        return None
+    _verdicts.move_to_end(domain)
+    return cached[0]
+
+def _store(domain: str, listed: bool) -> None:
+    ttl = DNSBL_POSITIVE_TTL if listed else DNSBL_NEGATIVE_TTL
+    _verdicts[domain] = (listed, time.monotonic() + ttl)
+    _verdicts.move_to_end(domain)
+    while len(_verdicts) > DNSBL_CACHE_SIZE:
+        _verdicts.popitem(last=False)
+
+async def _get_redis_verdict(domain: str) -> Optional[bool]:
+    # Импорт здесь, чтобы модуль не требовал конфигурации Redis/MongoDB, когда кэш в Redis выключен
+    from .no_sql.redis_client import get_redis
+    try:
+        value = await get_redis().get(f"dnsbl:{domain}")
+        return None if value is None else value == "1"
+    except Exception as e:
+        logger.warning(f"Не удалось прочитать вердикт DNSBL из Redis для {domain}: {str(e)}")
+        return None
+
+async def _set_redis_verdict(domain: str, listed: bool) -> None:
+    from .no_sql.redis_client import get_redis
+    try:
+        await get_redis().setex(f"dnsbl:{domain}", DNSBL_POSITIVE_TTL if listed else DNSBL_NEGATIVE_TTL, "1" if listed else "0")
+    except Exception as e:
+        logger.warning(f"Не удалось сохранить вердикт DNSBL в Redis для {domain}: {str(e)}")
+
+async def _lookup(domain: str) -> bool:
+    """Запрашивает вердикт по домену и сохраняет его в кэш."""
+    try:
+        if DNSBL_REDIS_CACHE:
+            listed = await _get_redis_verdict(domain)
+            if listed is not None:
+                _store(domain, listed)
+                return listed
+        async with get_session().get(DNSBL_URL, params={"domain": domain}) as response:
+            listed = response.status == 200
+        _store(domain, listed)
+        if DNSBL_REDIS_CACHE:
+            await _set_redis_verdict(domain, listed)
+        logger.debug(f"DNSBL: домен {domain} {'в списке' if listed else 'чистый'}")
+        return listed
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        # Ошибки не кэшируются: следующий запрос повторит проверку
+        logger.error(f"Ошибка при проверке DNSBL для домена {domain}: {str(e)}")
+        return False
+    finally:
+        _pending.pop(domain, None)
+
+def _get_task(domain: str) -> asyncio.Task:
+    task = _pending.get(domain)
+    if task is None:
+        task = asyncio.create_task(_lookup(domain))
+        _pending[domain] = task
+    return task
+
+async def check_domain(domain: str) -> bool:
+    """Проверяет один домен, ожидая ответа без ограничения бюджетом."""
+    domain = domain.lower()
+    cached = _get_cached(domain)
+    if cached is not None:
+        return cached
+    return await asyncio.shield(_get_task(domain))
+
+async def find_listed_domain(domains: Iterable[str], budget: Optional[float] = None) -> Optional[str]:
+    """
+    Проверяет все домены сообщения параллельно и возвращает первый домен из списка DNSBL.
+
+    Ожидание ограничено бюджетом задержки: если ответ не успел прийти, проверка
+    считается пройденной (fail open), а запрос продолжает выполняться в фоне и
+    заполнит кэш для следующих сообщений.
+
+    Args:
+        domains: Домены из сообщения.
+        budget: Бюджет ожидания в секундах (по умолчанию DNSBL_LATENCY_BUDGET).
+
+    Возвращает:
+        Optional[str]: Домен из списка или None.
+    """
+    ordered = list(dict.fromkeys(domain.lower() for domain in domains))
+    tasks: Dict[str, asyncio.Task] = {}
+    for domain in ordered:
+        cached = _get_cached(domain)
+        if cached:
+            return domain
+        if cached is None:
+            tasks[domain] = _get_task(domain)
+    if not tasks:
+        return None
+    done, _ = await asyncio.wait(
+        tasks.values(),
+        timeout=DNSBL_LATENCY_BUDGET if budget is None else budget
+    )
+    if len(done) < len(tasks):
+        logger.warning(f"DNSBL: бюджет ожидания исчерпан, не проверено доменов: {len(tasks) - len(done)}")
+    for domain, task in tasks.items():
+        if task in done and not task.cancelled() and task.result():
+            return domain
+    return None
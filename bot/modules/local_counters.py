@@ -0,0 +1,218 @@
+# Путь файла: bot/modules/local_counters.py
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+from loguru import logger
+
+# Движок счетчиков антиспама: 'redis' — каждая проверка идет в Redis, 'local' — счетчики в памяти процесса
+ANTISPAM_ENGINE = os.getenv("ANTISPAM_ENGINE", "redis").lower()
+# Период сброса измененных счетчиков в Redis (секунды)
+LOCAL_COUNTERS_FLUSH_INTERVAL = float(os.getenv("LOCAL_COUNTERS_FLUSH_INTERVAL", "5"))
+# Через сколько секунд простоя состояние пользователя выгружается из памяти
+LOCAL_COUNTERS_IDLE_TTL = int(os.getenv("LOCAL_COUNTERS_IDLE_TTL", "3600"))
+
+class _CounterState:
+    """Счетчики одного пользователя в одном чате."""
+    __slots__ = ("count", "window_end", "timestamps", "hashes", "block_until", "last_seen", "dirty")
+
+    def __init__(self):
+        self.count = 0  # Счетчик фиксированного окна
+        self.window_end = 0.0
+        self.timestamps: Deque[float] = deque()  # Метки времени для скользящего окна
+        self.hashes: Deque[str] = deque()  # Хэши последних сообщений, новые справа
+        self.block_until = 0.0
+        self.last_seen = 0.0
+        self.dirty = False
+
+# Состояния по (chat_id, user_id)
+_states: Dict[Tuple[int, int], _CounterState] = {}
+_flush_task: Optional[asyncio.Task] = None
+
+def is_local_engine() -> bool:
+    """Проверяет, выбран ли локальный движок счетчиков."""
+    return ANTISPAM_ENGINE == "local"
+
+def _redis_client():
+    """Модуль redis_client; импорт отложен, чтобы модуль счетчиков не требовал конфигурации бота при импорте."""
+    from .no_sql import redis_client
+    return redis_client
+
+def _keys(chat_id: int, user_id: int) -> Tuple[str, str, str, str]:
+    return (
+        f"spam:{chat_id}:{user_id}",
+        f"spam:sliding:{chat_id}:{user_id}",
+        f"block:{chat_id}:{user_id}",
+        f"antispam:{chat_id}:{user_id}:messages",
+    )
+
+async def _load_state(chat_id: int, user_id: int) -> _CounterState:
+    """Восстанавливает состояние из Redis при первом обращении (после перезапуска или из другого процесса)."""
+    state = _CounterState()
+    fixed_key, sliding_key, block_key, messages_key = _keys(chat_id, user_id)
+    try:
+        pipeline = _redis_client().get_redis().pipeline(transaction=False)
+        pipeline.get(fixed_key)
+        pipeline.pttl(fixed_key)
+        pipeline.zrange(sliding_key, 0, -1, withscores=True)
+        pipeline.pttl(block_key)
+        pipeline.lrange(messages_key, 0, -1)
+        count, count_ttl, sliding, block_ttl, hashes = await pipeline.execute()
+        now = time.time()
+        if count and count_ttl and count_ttl > 0:
+            state.count = int(count)
+            state.window_end = now + count_ttl / 1000
+        state.timestamps.extend(score / 1000 for _, score in sliding)
+        if block_ttl and block_ttl > 0:
+            state.block_until = now + block_ttl / 1000
+        # В Redis новые хэши хранятся слева (LPUSH)
+        state.hashes.extend(reversed(hashes))
+    except Exception as e:
+        logger.warning(f"Не удалось загрузить счетчики антиспама из Redis для user_id={user_id} в chat_id={chat_id}: {str(e)}")
+    return state
+
+async def _get_state(chat_id: int, user_id: int) -> _CounterState:
+    key = (chat_id, user_id)
+    state = _states.get(key)
+    if state is None:
+        loaded = await _load_state(chat_id, user_id)
+        # Пока шла загрузка, состояние могло появиться из параллельного обработчика
+        state = _states.setdefault(key, loaded)
+    state.last_seen = time.time()
+    return state
+
+async def check_flood(chat_id: int, user_id: int, limit: int = 5, seconds: int = 10, mode: str = "fixed",
+                      block_duration: Optional[int] = None) -> Tuple[bool, int]:
+    """
+    Локальная проверка флуда с той же семантикой, что и redis_client.check_flood
+    (block_duration по умолчанию — redis_client.FLOOD_BLOCK_DURATION).
+
+    Возвращает:
+        Tuple[bool, int]: (превышен ли лимит, оставшееся время блокировки в секундах).
+    """
+    if block_duration is None:
+        block_duration = _redis_client().FLOOD_BLOCK_DURATION
+    state = await _get_state(chat_id, user_id)
+    now = state.last_seen
+    state.dirty = True
+    if mode == "sliding":
+        timestamps = state.timestamps
+        while timestamps and timestamps[0] <= now - seconds:
+            timestamps.popleft()
+        timestamps.append(now)
+        # Для решения достаточно последних limit + 1 меток
+        while len(timestamps) > limit + 1:
+            timestamps.popleft()
+        count = len(timestamps)
+    else:
+        if now >= state.window_end:
+            state.count = 0
+            state.window_end = now + seconds
+        state.count += 1
+        count = state.count
+    if count > limit:
+        state.block_until = now + block_duration
+        logger.info(f"Пользователь {user_id} в chat_id={chat_id} помечен как спамер (сообщений: {count}, режим: {mode}, локально)")
+        return True, block_duration
+    return False, 0
+
+async def check_repeated_message(chat_id: int, user_id: int, message_hash: str, limit: int) -> bool:
+    """
+    Локальная проверка повторов: True, если последние limit сообщений совпадают.
+    При срабатывании история очищается, как и в Redis-движке.
+    """
+    state = await _get_state(chat_id, user_id)
+    hashes = state.hashes
+    hashes.append(message_hash)
+    while len(hashes) > limit:
+        hashes.popleft()
+    state.dirty = True
+    if len(hashes) >= limit and all(value == message_hash for value in hashes):
+        hashes.clear()
+        return True
+    return False
+
+def reset_state(chat_id: int, user_id: int) -> None:
+    """Удаляет локальное состояние пользователя (Redis-ключи очищает reset_spam_state)."""
+    _states.pop((chat_id, user_id), None)
+
+async def flush() -> int:
+    """
+    Сбрасывает измененные счетчики в Redis одним конвейером.
+
+    Возвращает:
+        int: Количество записанных состояний.
+    """
+    dirty = [(key, state) for key, state in _states.items() if state.dirty]
+    if not dirty:
+        return 0
+    now = time.time()
+    redis_client = _redis_client()
+    pipeline = redis_client.get_redis().pipeline(transaction=False)
+    for (chat_id, user_id), state in dirty:
+        fixed_key, sliding_key, block_key, messages_key = _keys(chat_id, user_id)
+        if state.count and state.window_end > now:
+            pipeline.set(fixed_key, state.count, px=int((state.window_end - now) * 1000) or 1)
+        else:
+            pipeline.delete(fixed_key)
+        pipeline.delete(sliding_key)
+        if state.timestamps:
+            pipeline.zadd(sliding_key, {f"{int(ts * 1000)}-{index}": int(ts * 1000) for index, ts in enumerate(state.timestamps)})
+            # Устаревшие метки отсекаются при следующей проверке, TTL нужен только для очистки
+            pipeline.expire(sliding_key, max(1, int(now - state.timestamps[0]) + 60))
+        if state.block_until > now:
+            pipeline.set(block_key, "1", px=int((state.block_until - now) * 1000) or 1)
+        pipeline.delete(messages_key)
+        if state.hashes:
+            pipeline.lpush(messages_key, *state.hashes)
+            pipeline.expire(messages_key, redis_client.REPEATED_MESSAGES_TTL)
+        state.dirty = False
+    try:
+        await pipeline.execute()
+    except Exception as e:
+        for _, state in dirty:
+            state.dirty = True
+        logger.error(f"Не удалось сбросить счетчики антиспама в Redis: {str(e)}")
+        return 0
+    logger.debug(f"Счетчики антиспама сброшены в Redis: {len(dirty)}")
+    return len(dirty)
+
+def evict_idle() -> int:
+    """Выгружает из памяти состояния без активности дольше LOCAL_COUNTERS_IDLE_TTL (только уже сброшенные)."""
+    threshold = time.time() - LOCAL_COUNTERS_IDLE_TTL
+    idle = [key for key, state in _states.items() if not state.dirty and state.last_seen < threshold]
+    for key in idle:
+        del _states[key]
+    if idle:
+        logger.debug(f"Выгружено неактивных состояний антиспама: {len(idle)}")
+    return len(idle)
+
+async def _flush_loop() -> None:
+    while True:
+        await asyncio.sleep(LOCAL_COUNTERS_FLUSH_INTERVAL)
+        await flush()
+        evict_idle()
+
+async def start() -> None:
+    """Запускает фоновый сброс счетчиков, если выбран локальный движок."""
+    global _flush_task
+    if not is_local_engine():
+        return
+    if _flush_task is None or _flush_task.done():
+        _flush_task = asyncio.create_task(_flush_loop())
+    logger.info(f"Локальный движок счетчиков антиспама запущен (сброс в Redis каждые {LOCAL_COUNTERS_FLUSH_INTERVAL} сек)")
+
+async def stop() -> None:
+    """Останавливает фоновый сброс и записывает оставшиеся изменения в Redis."""
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        try:
+            await _flush_task
+        except asyncio.CancelledError:
+            pass
+        _flush_task = None
+    if _states:
+        await flush()
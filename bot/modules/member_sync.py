@@ -0,0 +1,164 @@
+# Путь файла: bot/modules/member_sync.py
+
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional, Set, Tuple
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from loguru import logger
+from . import send_queue
+from .bot_permissions import get_bot_member, is_admin_with_manage_chat
+from .no_sql.user_db import get_user_collection, get_all_user_ids, bulk_register_chat_members
+from .no_sql.memberships import get_memberships_collection
+
+# Сколько запросов get_chat_member выполняется одновременно (общий лимит бота соблюдает send_queue)
+MEMBER_SYNC_CONCURRENCY = int(os.getenv("MEMBER_SYNC_CONCURRENCY", "5"))
+# Размер пакета записи в MongoDB
+MEMBER_SYNC_BATCH_SIZE = 200
+# Как часто писать прогресс в лог (в проверенных пользователях)
+MEMBER_SYNC_PROGRESS_EVERY = 100
+
+Member = Tuple[int, Optional[str], Optional[str], bool]
+
+# Прогресс синхронизации по чатам: chat_id -> {"status", "total", "checked", "registered", "started_at", "finished_at"}
+_progress: Dict[int, Dict] = {}
+# Выполняющиеся синхронизации, чтобы один чат не синхронизировался параллельно
+_tasks: Dict[int, asyncio.Task] = {}
+
+def get_progress(chat_id: Optional[int] = None) -> Dict:
+    """Возвращает прогресс синхронизации чата или всех чатов."""
+    if chat_id is None:
+        return {key: dict(value) for key, value in _progress.items()}
+    return dict(_progress.get(chat_id, {}))
+
+async def _candidate_user_ids(chat_id: int, probe_all: bool) -> List[int]:
+    """
+    Пользователи, которые вероятно состоят в чате: уже связаны с ним в users или memberships.
+    При probe_all проверяются все известные боту пользователи (как раньше).
+    """
+    if probe_all:
+        return await get_all_user_ids()
+    user_ids: Set[int] = set()
+    users = await get_user_collection()
+    async for doc in users.find({"group_ids": chat_id}, {"_id": 0, "user_id": 1}):
+        user_ids.add(doc["user_id"])
+    chat_memberships = await get_memberships_collection()
+    async for doc in chat_memberships.find({"chat_id": chat_id, "in_chat": {"$ne": False}}, {"_id": 0, "user_id": 1}):
+        user_ids.add(doc["user_id"])
+    return sorted(user_ids)
+
+async def sync_chat_members(chat_id: int, bot: Bot, probe_all: bool = False) -> Dict:
+    """
+    Синхронизирует участников чата: регистрирует администраторов и проверяет кандидатов через
+    get_chat_member с ограниченной параллельностью, записывая результат пакетными upsert.
+
+    Args:
+        chat_id: ID чата.
+        bot: Экземпляр бота.
+        probe_all: Проверять всех известных пользователей, а не только связанных с чатом.
+
+    Возвращает:
+        Dict: Итоговый прогресс (total, checked, registered, status).
+    """
+    progress = _progress[chat_id] = {
+        "status": "running", "total": 0, "checked": 0, "registered": 0,
+        "started_at": time.time(), "finished_at": None
+    }
+    try:
+        bot_member = await get_bot_member(bot, chat_id)
+        if not is_admin_with_manage_chat(bot_member):
+            logger.warning(f"Бот не имеет прав администратора или 'Manage Chat' в chat_id={chat_id}")
+            progress["status"] = "skipped"
+            return dict(progress)
+
+        admins = await send_queue.call(bot.get_chat_administrators, chat_id)
+        found: List[Member] = [
+            (admin.user.id, admin.user.username, admin.user.full_name, admin.user.is_bot) for admin in admins
+        ]
+        admin_ids = {member[0] for member in found}
+        candidates = [user_id for user_id in await _candidate_user_ids(chat_id, probe_all) if user_id not in admin_ids]
+        progress["total"] = len(candidates) + len(found)
+        progress["checked"] = len(found)
+
+        pending = iter(candidates)
+        write_lock = asyncio.Lock()
+
+        async def write_batch(force: bool = False) -> None:
+            nonlocal found
+            async with write_lock:
+                if found and (force or len(found) >= MEMBER_SYNC_BATCH_SIZE):
+                    batch, found = found, []
+                    try:
+                        await bulk_register_chat_members(chat_id, batch)
+                    except BaseException:
+                        # Пакет остается для следующей записи
+                        found[:0] = batch
+                        raise
+                    progress["registered"] += len(batch)
+
+        async def worker() -> None:
+            # Ограниченное число обработчиков берет кандидатов из общего итератора
+            for user_id in pending:
+                try:
+                    member = await send_queue.call(bot.get_chat_member, chat_id=chat_id, user_id=user_id)
+                    if member.status not in ("left", "kicked"):
+                        found.append((member.user.id, member.user.username, member.user.full_name, member.user.is_bot))
+                except (TelegramBadRequest, TelegramForbiddenError) as e:
+                    logger.debug(f"Пользователь {user_id} не найден в chat_id={chat_id}: {str(e)}")
+                progress["checked"] += 1
+                if progress["checked"] % MEMBER_SYNC_PROGRESS_EVERY == 0:
+                    logger.info(f"Синхронизация участников chat_id={chat_id}: {progress['checked']}/{progress['total']}")
+                await write_batch()
+
+        workers = [asyncio.create_task(worker()) for _ in range(MEMBER_SYNC_CONCURRENCY)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            # При ошибке одного обработчика остальные останавливаются вместе с синхронизацией
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        await write_batch(force=True)
+        progress["status"] = "done"
+        logger.info(
+            f"Синхронизация участников chat_id={chat_id} завершена: проверено {progress['checked']}, "
+            f"зарегистрировано {progress['registered']} за {time.time() - progress['started_at']:.1f} сек"
+        )
+    except asyncio.CancelledError:
+        progress["status"] = "cancelled"
+        raise
+    except Exception:
+        progress["status"] = "failed"
+        raise
+    finally:
+        progress["finished_at"] = time.time()
+    return dict(progress)
+
+def is_running(chat_id: int) -> bool:
+    """Проверяет, выполняется ли синхронизация участников чата."""
+    task = _tasks.get(chat_id)
+    return task is not None and not task.done()
+
+def start_sync(chat_id: int, bot: Bot, probe_all: bool = False) -> asyncio.Task:
+    """Запускает синхронизацию чата в фоне; если она уже идет, возвращает текущую задачу."""
+    task = _tasks.get(chat_id)
+    if task is None or task.done():
+        task = asyncio.create_task(sync_chat_members(chat_id, bot, probe_all))
+        _tasks[chat_id] = task
+        task.add_done_callback(lambda t: _on_sync_done(chat_id, t))
+    return task
+
+def _on_sync_done(chat_id: int, task: asyncio.Task) -> None:
+    if _tasks.get(chat_id) is task:
+        del _tasks[chat_id]
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Ошибка синхронизации участников chat_id={chat_id}: {str(task.exception())}")
+
+async def stop_all() -> None:
+    """Отменяет выполняющиеся синхронизации (при остановке бота)."""
+    tasks = list(_tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _tasks.clear()
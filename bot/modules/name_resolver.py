@@ -0,0 +1,84 @@
+# Путь файла: bot/modules/name_resolver.py
+
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+# Размер и время жизни кэша имен пользователей для вывода логов
+NAME_CACHE_SIZE = int(os.getenv("NAME_CACHE_SIZE", "2000"))
+NAME_CACHE_TTL = int(os.getenv("NAME_CACHE_TTL", "600"))
+
+class NameCache:
+    """LRU-кэш отображаемых имен: user_id -> имя, с ограничением размера и временем жизни записей."""
+
+    def __init__(self, max_size: int = NAME_CACHE_SIZE, ttl: float = NAME_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: "OrderedDict[int, Tuple[str, float]]" = OrderedDict()
+
+    def get(self, user_id: int) -> Optional[str]:
+        item = self._items.get(user_id)
+        if item is None:
+            return None
+        name, expires_at = item
+        if expires_at <= time.monotonic():
+            del self._items[user_id]
+            return None
+        self._items.move_to_end(user_id)
+        return name
+
+    def set(self, user_id: int, name: str) -> None:
+        self._items[user_id] = (name, time.monotonic() + self.ttl)
+        self._items.move_to_end(user_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+name_cache = NameCache()
+
+def display_name_of(user: Dict) -> str:
+    """Отображаемое имя из документа пользователя: display_name, @username или user_id."""
+    if user.get("display_name"):
+        return user["display_name"]
+    if user.get("username"):
+        return f"@{user['username']}"
+    return str(user["user_id"])
+
+async def _fetch_names(user_ids: Iterable[int]) -> Dict[int, str]:
+    """Загружает имена одним запросом $in с проекцией, без записи в базу."""
+    from .no_sql.user_db import get_user_collection
+    collection = await get_user_collection()
+    cursor = collection.find(
+        {"user_id": {"$in": list(user_ids)}}, {"_id": 0, "user_id": 1, "display_name": 1, "username": 1}
+    )
+    return {doc["user_id"]: display_name_of(doc) async for doc in cursor}
+
+async def resolve_display_names(user_ids: Iterable[int]) -> Dict[int, str]:
+    """
+    Возвращает отображаемые имена для набора user_id: из кэша, остальные — одним запросом к users.
+    Неизвестные пользователи отображаются по user_id (и не кэшируются).
+
+    Возвращает:
+        Dict[int, str]: user_id -> имя.
+    """
+    names: Dict[int, str] = {}
+    missing = set()
+    for user_id in set(user_ids):
+        name = name_cache.get(user_id)
+        if name is None:
+            missing.add(user_id)
+        else:
+            names[user_id] = name
+    if missing:
+        fetched = await _fetch_names(missing)
+        for user_id in missing:
+            if user_id in fetched:
+                name_cache.set(user_id, fetched[user_id])
+            names[user_id] = fetched.get(user_id, str(user_id))
+    return names
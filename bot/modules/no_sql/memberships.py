@@ -0,0 +1,300 @@
+# Путь файла: bot/modules/no_sql/memberships.py
+
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorCollection
+from loguru import logger
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+# Коллекция memberships хранит состояние пользователя в одном чате: один документ на (chat_id, user_id).
+# Документ: chat_id, user_id, username, display_name, is_bot, in_chat, joined_at, last_active,
+# activity, warnings (список), mute {is_muted, until, ...}, ban {is_banned, until, ...}.
+# Отсутствующие поля означают значения по умолчанию, как и в разреженной схеме users.
+# Истекшие муты и баны не переписываются: запросы учитывают поле until.
+
+MEMBERSHIPS_FLUSH_INTERVAL = 5
+
+# Отложенные обновления из горячего пути (сообщения): (chat_id, user_id) -> {"$set": ..., "$inc": ...}
+_pending: Dict[Tuple[int, int], Dict[str, Dict]] = {}
+_flush_task: Optional[asyncio.Task] = None
+
+async def get_memberships_collection() -> AsyncIOMotorCollection:
+    """Возвращает коллекцию memberships из базы данных."""
+    from .mongo_client import get_database
+    db = await get_database()
+    return db["memberships"]
+
+async def init_memberships_collection():
+    """Создает индексы коллекции memberships."""
+    collection = await get_memberships_collection()
+    try:
+        await collection.create_index([("chat_id", 1), ("user_id", 1)], unique=True)
+        await collection.create_index([("user_id", 1)])
+        await collection.create_index([("chat_id", 1), ("last_active", 1)])
+        await collection.create_index([("chat_id", 1), ("mute.is_muted", 1), ("mute.until", 1)])
+        await collection.create_index([("chat_id", 1), ("activity", -1)])
+        logger.info("Индексы для memberships созданы или уже существуют")
+    except Exception as e:
+        logger.error(f"Ошибка при инициализации коллекции memberships: {e}")
+        raise
+
+def record_activity(chat_id: int, user_id: int, username: Optional[str], display_name: Optional[str],
+                    is_bot: bool, last_active: float, activity: int = 0) -> None:
+    """
+    Откладывает обновление участия пользователя в чате (профиль, last_active, счетчик активности).
+    Обновления одного пользователя в чате объединяются и записываются пакетом в flush().
+    """
+    entry = _pending.setdefault((chat_id, user_id), {"$set": {}, "$inc": {}})
+    entry["$set"].update({
+        "username": username,
+        "display_name": display_name,
+        "is_bot": is_bot,
+        "in_chat": True,
+        "last_active": last_active
+    })
+    if activity:
+        entry["$inc"]["activity"] = entry["$inc"].get("activity", 0) + activity
+
+def add_activity(chat_id: int, user_id: int, delta: int) -> None:
+    """Откладывает изменение счетчика активности (например, откат для спама)."""
+    entry = _pending.setdefault((chat_id, user_id), {"$set": {}, "$inc": {}})
+    entry["$inc"]["activity"] = entry["$inc"].get("activity", 0) + delta
+
+def _requeue(items: List[Tuple[Tuple[int, int], Dict[str, Dict]]]) -> None:
+    """Возвращает незаписанные обновления в _pending, объединяя с пришедшими после них."""
+    for key, entry in items:
+        current = _pending.get(key)
+        if current is None:
+            _pending[key] = entry
+            continue
+        # Более новые значения $set важнее, приращения $inc складываются
+        current["$set"] = {**entry["$set"], **current["$set"]}
+        for field, delta in entry["$inc"].items():
+            current["$inc"][field] = current["$inc"].get(field, 0) + delta
+
+async def flush() -> int:
+    """
+    Записывает отложенные обновления memberships одним bulk_write.
+
+    Незаписанные обновления (ошибка или отмена) возвращаются в очередь и будут записаны
+    при следующем вызове; при частичной ошибке bulk_write повторяются только отклоненные операции.
+
+    Возвращает:
+        int: Количество записанных документов.
+    """
+    if not _pending:
+        return 0
+    items = list(_pending.items())
+    _pending.clear()
+    operations = []
+    for (chat_id, user_id), entry in items:
+        update = {"$setOnInsert": {"joined_at": time.time()}}
+        if entry["$set"]:
+            update["$set"] = entry["$set"]
+        if entry["$inc"]:
+            update["$inc"] = entry["$inc"]
+        operations.append(UpdateOne({"chat_id": chat_id, "user_id": user_id}, update, upsert=True))
+    try:
+        collection = await get_memberships_collection()
+        await collection.bulk_write(operations, ordered=False)
+        logger.debug(f"Записаны отложенные обновления memberships: {len(operations)}")
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        _requeue([items[error["index"]] for error in errors])
+        logger.error(f"Не удалось записать обновлений memberships: {len(errors)}, повтор при следующей записи")
+        return len(operations) - len(errors)
+    except Exception as e:
+        _requeue(items)
+        logger.error(f"Ошибка при записи отложенных обновлений memberships, повтор при следующей записи: {str(e)}")
+        return 0
+    except BaseException:
+        # Отмена во время записи: обновления остаются в очереди
+        _requeue(items)
+        raise
+    return len(operations)
+
+async def _flush_loop() -> None:
+    while True:
+        await asyncio.sleep(MEMBERSHIPS_FLUSH_INTERVAL)
+        await flush()
+
+def start() -> None:
+    """Запускает фоновую запись отложенных обновлений memberships."""
+    global _flush_task
+    if _flush_task is None or _flush_task.done():
+        _flush_task = asyncio.create_task(_flush_loop())
+
+async def stop() -> None:
+    """Останавливает фоновую запись и сбрасывает оставшиеся обновления."""
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        try:
+            await _flush_task
+        except asyncio.CancelledError:
+            pass
+        _flush_task = None
+    await flush()
+
+async def update_membership(chat_id: int, user_id: int, update: Dict) -> None:
+    """Сразу применяет обновление к документу участия (для редких действий модерации)."""
+    try:
+        collection = await get_memberships_collection()
+        update.setdefault("$setOnInsert", {})["joined_at"] = time.time()
+        await collection.update_one({"chat_id": chat_id, "user_id": user_id}, update, upsert=True)
+    except Exception as e:
+        logger.error(f"Ошибка при обновлении memberships для user_id={user_id} в chat_id={chat_id}: {str(e)}")
+
+async def leave_chat(chat_id: int, user_id: int) -> None:
+    """Отмечает, что пользователь покинул чат, и очищает его предупреждения, мут и бан."""
+    await update_membership(chat_id, user_id, {
+        "$set": {"in_chat": False},
+        "$unset": {"warnings": "", "mute": "", "ban": ""}
+    })
+
+async def leave_chat_many(chat_id: int, user_ids: List[int]) -> None:
+    """То же, что leave_chat, для нескольких пользователей одним запросом."""
+    if not user_ids:
+        return
+    collection = await get_memberships_collection()
+    await collection.update_many(
+        {"chat_id": chat_id, "user_id": {"$in": user_ids}},
+        {"$set": {"in_chat": False}, "$unset": {"warnings": "", "mute": "", "ban": ""}}
+    )
+
+async def delete_user_memberships(user_id: int) -> None:
+    """Удаляет все документы участия пользователя."""
+    try:
+        collection = await get_memberships_collection()
+        await collection.delete_many({"user_id": user_id})
+    except Exception as e:
+        logger.error(f"Ошибка при удалении memberships пользователя {user_id}: {str(e)}")
+
+async def get_chat_memberships(chat_id: int, projection: Optional[Dict] = None) -> List[Dict]:
+    """Возвращает документы участия пользователей, находящихся в чате."""
+    collection = await get_memberships_collection()
+    cursor = collection.find({"chat_id": chat_id, "in_chat": {"$ne": False}}, projection or {"_id": 0})
+    return [doc async for doc in cursor]
+
+def _active_flag(flag: str, until: str, now: float) -> Dict:
+    """Выражение агрегации: 1, если мут/бан действует (until не задан или 0 — бессрочно), иначе 0."""
+    return {"$cond": [
+        {"$and": [
+            {"$eq": [flag, True]},
+            {"$or": [{"$lte": [{"$ifNull": [until, 0]}, 0]}, {"$gt": [until, now]}]}
+        ]},
+        1, 0
+    ]}
+
+def _count_items(field: str) -> Dict:
+    """Выражение агрегации: длина списка или 0, если поля нет или это не список."""
+    return {"$cond": [{"$isArray": field}, {"$size": field}, 0]}
+
+def _stats_group() -> Dict:
+    return {"$group": {
+        "_id": None,
+        "users": {"$sum": 1},
+        "warnings": {"$sum": "$warnings"},
+        "mutes": {"$sum": "$mutes"},
+        "bans": {"$sum": "$bans"}
+    }}
+
+def stats_pipeline(chat_id: int, now: float) -> List[Dict]:
+    """
+    Агрегация статистики модерации чата по memberships: участники, предупреждения,
+    действующие муты и баны. Читаются только строки этого чата (индекс chat_id, user_id).
+    """
+    return [
+        {"$match": {"chat_id": chat_id, "in_chat": {"$ne": False}}},
+        {"$project": {
+            "_id": 0,
+            "warnings": _count_items("$warnings"),
+            "mutes": _active_flag("$mute.is_muted", "$mute.until", now),
+            "bans": _active_flag("$ban.is_banned", "$ban.until", now)
+        }},
+        _stats_group()
+    ]
+
+def users_stats_pipeline(chat_id: int, now: float) -> List[Dict]:
+    """То же по коллекции users (схема с картами по chat_id), пока memberships не заполнена."""
+    chat_key = str(chat_id)
+    return [
+        {"$match": {"group_ids": chat_id}},
+        {"$project": {
+            "_id": 0,
+            "warnings": _count_items(f"$warnings.{chat_key}"),
+            "mutes": _active_flag(f"$mutes.{chat_key}.is_muted", f"$mutes.{chat_key}.until", now),
+            "bans": _active_flag(f"$bans.{chat_key}.is_banned", f"$bans.{chat_key}.until", now)
+        }},
+        _stats_group()
+    ]
+
+def membership_from_user(user: Dict, chat_id: int) -> Dict:
+    """Строит документ участия из документа users (схема с картами по chat_id)."""
+    chat_key = str(chat_id)
+    membership = {
+        "chat_id": chat_id,
+        "user_id": user["user_id"],
+        "username": user.get("username"),
+        "display_name": user.get("display_name"),
+        "is_bot": user.get("is_bot", False),
+        "in_chat": True,
+        "last_active": user.get("last_active") or 0.0
+    }
+    for source, target in (("activity_count", "activity"), ("warnings", "warnings"), ("mutes", "mute"), ("bans", "ban")):
+        values = user.get(source)
+        if isinstance(values, dict) and chat_key in values:
+            membership[target] = values[chat_key]
+    return membership
+
+def _keep_or(field: str, value) -> Dict:
+    """Выражение: текущее значение поля, а если его нет — значение из users."""
+    return {"$ifNull": [f"${field}", {"$literal": value}]}
+
+def _merged_warnings(warnings: List[Dict]) -> Dict:
+    """
+    Выражение: предупреждения из users плюс записанные в memberships позже последнего из них
+    (двойная запись могла создать документ участия только с новыми предупреждениями).
+    """
+    last_issued = max((warning.get("issued_at") or 0 for warning in warnings if isinstance(warning, dict)), default=-1)
+    return {"$concatArrays": [
+        {"$literal": warnings},
+        {"$filter": {
+            "input": {"$ifNull": ["$warnings", []]},
+            "as": "warning",
+            "cond": {"$gt": [{"$ifNull": ["$$warning.issued_at", 0]}, last_issued]}
+        }}
+    ]}
+
+def backfill_operations(user: Dict) -> List[UpdateOne]:
+    """
+    Операции заполнения memberships из документа users (миграция с двойной записью).
+
+    Пока миграция идет, двойная запись уже создает документы участия только с новыми данными,
+    поэтому поля дополняются, а не перезаписываются: activity и last_active — максимумом,
+    предупреждения — объединением, мут, бан и профиль — только если их еще нет.
+    Повторный запуск миграции безопасен.
+    """
+    operations = []
+    now = time.time()
+    for chat_id in user.get("group_ids") or []:
+        membership = membership_from_user(user, chat_id)
+        fields: Dict = {
+            "username": _keep_or("username", membership["username"]),
+            "display_name": _keep_or("display_name", membership["display_name"]),
+            "is_bot": _keep_or("is_bot", membership["is_bot"]),
+            "in_chat": _keep_or("in_chat", True),
+            "joined_at": _keep_or("joined_at", now),
+            "last_active": {"$max": [{"$ifNull": ["$last_active", 0]}, membership["last_active"]]}
+        }
+        if "activity" in membership:
+            fields["activity"] = {"$max": [{"$ifNull": ["$activity", 0]}, membership["activity"]]}
+        if isinstance(membership.get("warnings"), list) and membership["warnings"]:
+            fields["warnings"] = _merged_warnings(membership["warnings"])
+        for field in ("mute", "ban"):
+            if field in membership:
+                fields[field] = _keep_or(field, membership[field])
+        operations.append(UpdateOne({"chat_id": chat_id, "user_id": user["user_id"]}, [{"$set": fields}], upsert=True))
+    return operations
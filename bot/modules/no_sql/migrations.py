@@ -0,0 +1,221 @@
+# Путь файла: bot/modules/no_sql/migrations.py
+
+import asyncio
+import os
+import time
+from typing import Callable, Dict, List, Optional, Set
+from motor.motor_asyncio import AsyncIOMotorCollection
+from loguru import logger
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from .user_db import get_user_collection, OWNER_BOT_ID, USER_SCHEMA_VERSION
+from . import memberships
+
+# Размер пакета и пауза между пакетами, чтобы миграция не мешала обработке сообщений
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "500"))
+MIGRATION_BATCH_PAUSE = float(os.getenv("MIGRATION_BATCH_PAUSE", "0.05"))
+# Аренда миграции: пока она не истекла, другой процесс не начнет ту же миграцию
+MIGRATION_LEASE_SECONDS = 60
+# Как часто проверять миграцию, которую выполняет другой процесс (секунды)
+MIGRATION_POLL_INTERVAL = 5
+
+# Имена завершенных миграций (заполняется check_schema_version и run_pending)
+_applied: Set[str] = set()
+
+async def get_migrations_collection() -> AsyncIOMotorCollection:
+    """Возвращает коллекцию migrations из базы данных."""
+    from .mongo_client import get_database
+    db = await get_database()
+    return db["migrations"]
+
+def _is_default_chat_entry(field: str, value) -> bool:
+    """Проверяет, совпадает ли запись чата в поддокументе со значением по умолчанию."""
+    if field == "activity_count":
+        return not value
+    if field == "warnings":
+        return value == []
+    if field == "bans":
+        return isinstance(value, dict) and not value.get("is_banned", False)
+    if field == "mutes":
+        return isinstance(value, dict) and not value.get("is_muted", False)
+    return False
+
+def _sparse_schema_operations(user: Dict) -> List[UpdateOne]:
+    """
+    Приводит документ к разреженной схеме: исправляет типы полей и удаляет записи чатов
+    со значениями по умолчанию (отсутствующий ключ чата означает значение по умолчанию).
+
+    Миграция идет параллельно с обработкой сообщений, поэтому каждое изменение применяется
+    только если поле все еще равно прочитанному значению: запись, обновленная после чтения,
+    не затирается.
+    """
+    operations = []
+    for field in ("warnings", "bans", "mutes", "activity_count"):
+        value = user.get(field)
+        if not isinstance(value, dict):
+            operations.append(UpdateOne({"_id": user["_id"], field: value}, {"$set": {field: {}}}))
+            continue
+        for chat_key, entry in value.items():
+            if _is_default_chat_entry(field, entry):
+                path = f"{field}.{chat_key}"
+                operations.append(UpdateOne({"_id": user["_id"], path: entry}, {"$unset": {path: ""}}))
+    if user.get("user_id") == OWNER_BOT_ID and user.get("role_level", 0) != 7:
+        operations.append(UpdateOne({"_id": user["_id"]}, {"$set": {"role_level": 7}}))
+    return operations
+
+# Миграции документов users по возрастанию версии. build возвращает операции для целевой коллекции
+# (target), после пакета документам users выставляется schema_version = version.
+MIGRATIONS: List[Dict] = [
+    {
+        "version": 1,
+        "name": "users_sparse_schema",
+        "target": "users",
+        "projection": {"user_id": 1, "role_level": 1, "warnings": 1, "bans": 1, "mutes": 1, "activity_count": 1},
+        "build": _sparse_schema_operations
+    },
+    {
+        "version": 2,
+        "name": "memberships_backfill",
+        "target": "memberships",
+        "projection": {"user_id": 1, "username": 1, "display_name": 1, "is_bot": 1, "last_active": 1,
+                       "group_ids": 1, "activity_count": 1, "warnings": 1, "mutes": 1, "bans": 1},
+        "build": memberships.backfill_operations
+    },
+]
+assert MIGRATIONS[-1]["version"] == USER_SCHEMA_VERSION, "USER_SCHEMA_VERSION должен совпадать с последней миграцией"
+
+def is_applied(name: str) -> bool:
+    """Проверяет, завершена ли миграция с указанным именем."""
+    return name in _applied
+
+async def check_schema_version() -> List[str]:
+    """
+    Проверяет версию схемы при запуске: читает только коллекцию migrations, документы не сканируются.
+
+    Возвращает:
+        List[str]: Имена ожидающих миграций.
+    """
+    collection = await get_migrations_collection()
+    async for doc in collection.find({"status": "done"}, {"_id": 1}):
+        _applied.add(doc["_id"])
+    pending = [migration["name"] for migration in MIGRATIONS if migration["name"] not in _applied]
+    current = max((m["version"] for m in MIGRATIONS if m["name"] in _applied), default=0)
+    if pending:
+        logger.info(f"Версия схемы users: {current}, ожидают миграции: {pending}")
+    else:
+        logger.info(f"Версия схемы users актуальна: {current}")
+    return pending
+
+async def _claim(migration: Dict) -> Optional[Dict]:
+    """Захватывает аренду миграции; возвращает ее документ или None, если она занята другим процессом."""
+    collection = await get_migrations_collection()
+    now = time.time()
+    try:
+        return await collection.find_one_and_update(
+            {
+                "_id": migration["name"],
+                "status": {"$ne": "done"},
+                "$or": [{"lease_until": {"$lt": now}}, {"lease_until": {"$exists": False}}]
+            },
+            {
+                "$set": {"status": "running", "version": migration["version"], "lease_until": now + MIGRATION_LEASE_SECONDS},
+                "$setOnInsert": {"started_at": now, "processed": 0}
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Документ существует, но миграция завершена или выполняется в другом процессе
+        return None
+
+async def _apply_batch(migration: Dict, batch: List[Dict], build: Callable[[Dict], List[UpdateOne]]) -> None:
+    operations = [operation for doc in batch for operation in build(doc)]
+    users = await get_user_collection()
+    if operations:
+        target = users if migration["target"] == "users" else await memberships.get_memberships_collection()
+        await target.bulk_write(operations, ordered=False)
+    ids = [doc["_id"] for doc in batch]
+    await users.update_many({"_id": {"$in": ids}}, {"$max": {"schema_version": migration["version"]}})
+    # Контрольная точка: после перезапуска миграция продолжится с последнего обработанного _id
+    collection = await get_migrations_collection()
+    await collection.update_one(
+        {"_id": migration["name"]},
+        {
+            "$set": {"last_id": ids[-1], "lease_until": time.time() + MIGRATION_LEASE_SECONDS},
+            "$inc": {"processed": len(batch)}
+        }
+    )
+
+async def run_migration(migration: Dict) -> bool:
+    """
+    Выполняет одну миграцию пакетами с контрольными точками.
+
+    Возвращает:
+        bool: True, если миграция завершена этим процессом; False — аренда у другого процесса
+        или миграция уже завершена (см. _wait_for_other_process).
+    """
+    name = migration["name"]
+    state = await _claim(migration)
+    if state is None:
+        logger.info(f"Миграция {name} уже завершена или выполняется другим процессом")
+        return False
+    users = await get_user_collection()
+    query: Dict = {"$or": [{"schema_version": {"$lt": migration["version"]}}, {"schema_version": {"$exists": False}}]}
+    if state.get("last_id") is not None:
+        query["_id"] = {"$gt": state["last_id"]}
+        logger.info(f"Миграция {name} продолжается с контрольной точки, обработано: {state.get('processed', 0)}")
+    else:
+        logger.info(f"Запуск миграции {name} (версия {migration['version']})")
+    batch: List[Dict] = []
+    async for doc in users.find(query, migration["projection"]).sort("_id", 1).batch_size(MIGRATION_BATCH_SIZE):
+        batch.append(doc)
+        if len(batch) >= MIGRATION_BATCH_SIZE:
+            await _apply_batch(migration, batch, migration["build"])
+            batch = []
+            await asyncio.sleep(MIGRATION_BATCH_PAUSE)
+    if batch:
+        await _apply_batch(migration, batch, migration["build"])
+    collection = await get_migrations_collection()
+    result = await collection.find_one_and_update(
+        {"_id": name},
+        {"$set": {"status": "done", "finished_at": time.time()}, "$unset": {"lease_until": ""}},
+        return_document=ReturnDocument.AFTER
+    )
+    _applied.add(name)
+    logger.info(f"Миграция {name} завершена, обработано документов: {result.get('processed', 0) if result else 0}")
+    return True
+
+async def _wait_for_other_process(migration: Dict) -> None:
+    """
+    Ждет, пока миграцию выполняет другой процесс (или держит аренду процесса, упавшего до перезапуска):
+    возвращается, когда миграция завершена (она отмечается в _applied) или аренда истекла.
+    """
+    collection = await get_migrations_collection()
+    while True:
+        state = await collection.find_one({"_id": migration["name"]}, {"status": 1, "lease_until": 1})
+        if state is not None and state.get("status") == "done":
+            _applied.add(migration["name"])
+            logger.info(f"Миграция {migration['name']} завершена другим процессом")
+            return
+        if state is None or state.get("lease_until", 0) < time.time():
+            return
+        await asyncio.sleep(MIGRATION_POLL_INTERVAL)
+
+async def run_pending() -> None:
+    """
+    Выполняет ожидающие миграции по порядку; следующая начинается только после завершения предыдущей.
+    Если миграцию выполняет другой процесс, дожидается ее завершения или истечения аренды.
+    """
+    for migration in MIGRATIONS:
+        while migration["name"] not in _applied:
+            try:
+                if await run_migration(migration):
+                    break
+            except asyncio.CancelledError:
+                logger.info(f"Миграция {migration['name']} остановлена, будет продолжена при следующем запуске")
+                raise
+            except Exception as e:
+                # Ошибка передается supervise: стадия повторяется, а после исчерпания попыток отмечается failed
+                logger.error(f"Ошибка при выполнении миграции {migration['name']}: {str(e)}")
+                raise
+            await _wait_for_other_process(migration)
@@ -0,0 +1,131 @@
+# Путь файла: bot/modules/no_sql/moderation_rollups.py
+
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+from motor.motor_asyncio import AsyncIOMotorCollection
+from loguru import logger
+from .user_db import get_moderation_logs_collection
+
+# Коллекция moderation_logs_daily хранит дневную сводку чата: один документ на (chat_id, day).
+# Документ: chat_id, day ("YYYY-MM-DD", UTC), date (начало дня, для TTL), actions {действие: количество},
+# total, users (число разных пользователей). Подробные записи moderation_logs удаляются TTL-индексом,
+# только если задан MODERATION_LOGS_RETENTION_DAYS; сводки — через MODERATION_ROLLUP_RETENTION_DAYS.
+# Сводки показывает /mod_logs summary.
+
+MODERATION_ROLLUP_RETENTION_DAYS = int(os.getenv("MODERATION_ROLLUP_RETENTION_DAYS", "730"))
+# Как часто проверять, есть ли завершившиеся дни без сводки (секунды)
+MODERATION_ROLLUP_INTERVAL = int(os.getenv("MODERATION_ROLLUP_INTERVAL", "3600"))
+
+async def get_daily_collection() -> AsyncIOMotorCollection:
+    """Возвращает коллекцию moderation_logs_daily из базы данных."""
+    from .mongo_client import get_database
+    db = await get_database()
+    return db["moderation_logs_daily"]
+
+async def init_rollups_collection():
+    """Создает индексы коллекции дневных сводок: уникальный (chat_id, day) и TTL по date."""
+    collection = await get_daily_collection()
+    try:
+        await collection.create_index([("chat_id", 1), ("day", -1)], unique=True)
+        await collection.create_index("date", expireAfterSeconds=MODERATION_ROLLUP_RETENTION_DAYS * 86400)
+        logger.info("Индексы для moderation_logs_daily созданы или уже существуют")
+    except Exception as e:
+        logger.error(f"Ошибка при инициализации коллекции moderation_logs_daily: {e}")
+        raise
+
+def _day_start(moment: datetime) -> datetime:
+    return moment.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+def rollup_pipeline(match: Dict) -> List[Dict]:
+    """
+    Агрегация записей moderation_logs, подходящих под match, в дневные сводки с записью через $merge.
+    Повторный запуск за тот же день заменяет сводку, поэтому пересчет безопасен.
+    """
+    # Записи без created_at (до появления TTL) группируются по issued_at
+    moment = {"$ifNull": ["$created_at", {"$toDate": {"$multiply": ["$issued_at", 1000]}}]}
+    return [
+        {"$match": match},
+        {"$project": {
+            "_id": 0, "chat_id": 1, "action": 1, "user_id": 1,
+            "day": {"$dateToString": {"format": "%Y-%m-%d", "date": moment}}
+        }},
+        {"$group": {
+            "_id": {"chat_id": "$chat_id", "day": "$day", "action": "$action"},
+            "count": {"$sum": 1},
+            "users": {"$addToSet": "$user_id"}
+        }},
+        {"$group": {
+            "_id": {"chat_id": "$_id.chat_id", "day": "$_id.day"},
+            "actions": {"$push": {"k": "$_id.action", "v": "$count"}},
+            "total": {"$sum": "$count"},
+            "users": {"$push": "$users"}
+        }},
+        {"$project": {
+            "_id": 0,
+            "chat_id": "$_id.chat_id",
+            "day": "$_id.day",
+            "date": {"$dateFromString": {"dateString": "$_id.day"}},
+            "actions": {"$arrayToObject": "$actions"},
+            "total": 1,
+            "users": {"$size": {"$reduce": {
+                "input": "$users", "initialValue": [], "in": {"$setUnion": ["$$value", "$$this"]}
+            }}}
+        }},
+        {"$merge": {
+            "into": "moderation_logs_daily", "on": ["chat_id", "day"],
+            "whenMatched": "replace", "whenNotMatched": "insert"
+        }}
+    ]
+
+async def _roll_up_legacy_logs() -> None:
+    """
+    Однократно сворачивает записи без created_at и проставляет им created_at по issued_at.
+    Сводка строится до проставления даты, потому что после него старые записи сразу удалит TTL.
+    """
+    logs = await get_moderation_logs_collection()
+    legacy = {"created_at": {"$exists": False}}
+    if not await logs.find_one(legacy, {"_id": 1}):
+        return
+    await logs.aggregate(rollup_pipeline(legacy)).to_list(length=None)
+    result = await logs.update_many(legacy, [{"$set": {"created_at": {"$toDate": {"$multiply": ["$issued_at", 1000]}}}}])
+    logger.info(f"Записям moderation_logs без даты проставлен created_at: {result.modified_count}")
+
+async def run_rollups() -> None:
+    """
+    Строит сводки за завершившиеся дни: от последнего дня со сводкой (пересчитывается целиком)
+    до вчерашнего включительно. Записи выбираются диапазоном по TTL-индексу created_at.
+    """
+    await _roll_up_legacy_logs()
+    logs = await get_moderation_logs_collection()
+    daily = await get_daily_collection()
+    today = _day_start(datetime.now(timezone.utc))
+    latest = await daily.find_one({}, {"_id": 0, "date": 1}, sort=[("date", -1)])
+    if latest is not None:
+        start = min(latest["date"].replace(tzinfo=timezone.utc), today)
+    else:
+        oldest = await logs.find_one({}, {"_id": 0, "created_at": 1}, sort=[("created_at", 1)])
+        if oldest is None:
+            return
+        start = _day_start(oldest["created_at"].replace(tzinfo=timezone.utc))
+    if start >= today:
+        return
+    await logs.aggregate(rollup_pipeline({"created_at": {"$gte": start, "$lt": today}})).to_list(length=None)
+    logger.info(f"Построены сводки moderation_logs за {(today - start).days} дн. с {start.date()}")
+
+async def run_forever() -> None:
+    """Фоновая стадия: периодически строит дневные сводки."""
+    while True:
+        try:
+            await run_rollups()
+        except Exception as e:
+            logger.error(f"Ошибка при построении сводок moderation_logs: {str(e)}")
+        await asyncio.sleep(MODERATION_ROLLUP_INTERVAL)
+
+async def get_daily_summaries(chat_id: int, days: int = 30) -> List[Dict]:
+    """Возвращает дневные сводки чата за последние days дней (новые первыми)."""
+    collection = await get_daily_collection()
+    since = (_day_start(datetime.now(timezone.utc)) - timedelta(days=days)).strftime("%Y-%m-%d")
+    cursor = collection.find({"chat_id": chat_id, "day": {"$gte": since}}, {"_id": 0}).sort("day", -1)
+    return [doc async for doc in cursor]
@@ -1,20 +1,21 @@
 # Путь файла: bot/modules/no_sql/redis_client.py
 
-import hashlib
 import os
 import asyncio
 import time
 from redis.asyncio import ConnectionPool, Redis
-from contextlib import asynccontextmanager
 from loguru import logger
 import json
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Tuple
 from datetime import datetime, timedelta
 from aiocache import cached, Cache
 from aiocache.serializers import PickleSerializer
 from ..no_sql.user_db import get_known_chats, get_user, register_chat_member, add_warning, mute_user, ban_user, \
-    kick_user
+    get_moderation_stats, bulk_kick_users
 from ..no_sql.mongo_client import get_database
+from ..no_sql.memberships import get_memberships_collection
+from ..spam_words import get_message_hash
+from .. import send_queue
 import aiogram
 from aiogram.types import Message, ChatMemberOwner
 
@@ -33,9 +34,53 @@ settings_cache = Cache(Cache.MEMORY, serializer=PickleSerializer(), ttl=3600)  #
 # Кэш для уведомлений для предотвращения спама
 notification_cache = Cache(Cache.MEMORY, serializer=PickleSerializer(), ttl=60)  # Кэш уведомлений на 1 минуту
 
+# Версии настроек в текущем процессе: увеличиваются при каждом сохранении
+settings_versions: Dict[str, int] = {}
+
+def get_settings_version(setting_type: str, chat_id) -> int:
+    """Возвращает локальную версию настроек чата (меняется при каждом save_settings)."""
+    return settings_versions.get(f"{setting_type}:{chat_id}", 0)
+
+async def _on_settings_saved(setting_type: str, chat_id, settings: Dict) -> None:
+    """Обновляет кэши и версию настроек после сохранения."""
+    key = f"{setting_type}:{chat_id}"
+    settings_versions[key] = settings_versions.get(key, 0) + 1
+    await settings_cache.set(key, settings, ttl=3600)
+    await get_settings.cache.set(key, settings, ttl=3600)
+
+# Исключение неактивных пользователей: одновременные запросы ban_chat_member (общий лимит
+# бота соблюдает send_queue) и размер пакета записи в MongoDB
+KICK_INACTIVE_CONCURRENCY = int(os.getenv("KICK_INACTIVE_CONCURRENCY", "5"))
+KICK_INACTIVE_BATCH_SIZE = 200
+# Выполняющиеся исключения неактивных по чатам
+_kick_tasks: Dict[int, asyncio.Task] = {}
+
+# Общий клиент Redis процесса; жизненным циклом управляет lifespan в bot/main.py
+_redis: Optional[Redis] = None
+_health_check_task: Optional[asyncio.Task] = None
+redis_healthy = False
+
+# Интервал фоновой проверки соединения с Redis (секунды)
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+
+def get_redis() -> Redis:
+    """
+    Возвращает общий клиент Redis процесса.
+
+    Вызов не выполняет сетевых запросов: соединения берутся из пула при выполнении команд,
+    а доступность Redis проверяется фоновой задачей.
+
+    Возвращает:
+        Redis: Асинхронный клиент Redis.
+    """
+    global _redis
+    if _redis is None:
+        _redis = Redis(connection_pool=redis_pool)
+    return _redis
+
 async def init_redis() -> Redis:
     """
-    Инициализирует и возвращает асинхронный Redis-клиент с использованием пула соединений.
+    Проверяет доступность Redis при запуске и возвращает общий клиент.
 
     Возвращает:
         Redis: Асинхронный клиент Redis.
@@ -43,10 +88,12 @@ async def init_redis() -> Redis:
     Raises:
         ConnectionError: Если не удалось установить соединение после 3 попыток.
     """
-    redis = Redis(connection_pool=redis_pool)
+    global redis_healthy
+    redis = get_redis()
     for attempt in range(3):
         try:
             if await redis.ping():
+                redis_healthy = True
                 logger.debug("Подключение к Redis успешно установлено")
                 return redis
         except Exception as e:
@@ -56,26 +103,49 @@ async def init_redis() -> Redis:
             await asyncio.sleep(1)
     return redis
 
-@asynccontextmanager
-async def redis_client():
-    """
-    Контекстный менеджер для подключения к Redis с использованием пула соединений.
-
-    Yields:
-        Redis: Асинхронный клиент Redis.
+async def _health_check_loop() -> None:
+    """Периодически проверяет соединение с Redis и логирует смену состояния."""
+    global redis_healthy
+    while True:
+        await asyncio.sleep(REDIS_HEALTH_CHECK_INTERVAL)
+        try:
+            healthy = bool(await get_redis().ping())
+        except Exception as e:
+            healthy = False
+            logger.debug(f"Проверка соединения с Redis не удалась: {str(e)}")
+        if healthy != redis_healthy:
+            if healthy:
+                logger.info("Соединение с Redis восстановлено")
+            else:
+                logger.error("Redis недоступен")
+        redis_healthy = healthy
 
-    Raises:
-        ConnectionError: Если не удалось установить соединение.
-    """
+async def start_redis() -> Redis:
+    """Инициализирует общий клиент Redis и запускает фоновую проверку соединения."""
+    global _health_check_task
     redis = await init_redis()
-    try:
-        yield redis
-    except Exception as e:
-        logger.error(f"Ошибка при работе с Redis: {str(e)}")
-        raise
-    finally:
-        await redis.aclose()
-        logger.debug("Соединение с Redis закрыто")
+    if _health_check_task is None or _health_check_task.done():
+        _health_check_task = asyncio.create_task(_health_check_loop())
+    logger.info("Redis-клиент инициализирован")
+    return redis
+
+async def close_redis() -> None:
+    """Останавливает фоновую проверку и закрывает соединения пула Redis."""
+    global _redis, _health_check_task, redis_healthy
+    if _health_check_task is not None:
+        _health_check_task.cancel()
+        try:
+            await _health_check_task
+        except asyncio.CancelledError:
+            pass
+        _health_check_task = None
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
+    _scripts.clear()
+    await redis_pool.disconnect()
+    redis_healthy = False
+    logger.debug("Соединения с Redis закрыты")
 
 async def ensure_user_exists(user_id: int, chat_id: int, username: Optional[str] = None,
                              display_name: Optional[str] = None, is_bot: bool = False) -> bool:
@@ -174,6 +244,9 @@ async def validate_settings(setting_type: str, settings: Dict) -> bool:
                         "duration"] <= 0:
                         logger.error(f"Недопустимое значение duration в {key}: {sub_settings.get('duration')}")
                         return False
+                if key == "flood" and sub_settings.get("mode", "fixed") not in FLOOD_MODES:
+                    logger.error(f"Недопустимый режим flood: {sub_settings.get('mode')}")
+                    return False
                 if key in ["repeated_words", "repeated_messages", "flood"]:
                     if "limit" not in sub_settings or not isinstance(sub_settings["limit"], int) or sub_settings[
                         "limit"] < 1:
@@ -185,6 +258,88 @@ async def validate_settings(setting_type: str, settings: Dict) -> bool:
         logger.error(f"Ошибка валидации настроек {setting_type}: {str(e)}")
         return False
 
+# Фиксированное окно: счетчик, TTL окна и флаг блокировки за один вызов
+# KEYS: счетчик, флаг блокировки; ARGV: лимит, окно (сек), длительность блокировки (сек)
+FLOOD_FIXED_WINDOW_SCRIPT = """
+local count = redis.call('INCR', KEYS[1])
+if count == 1 or redis.call('TTL', KEYS[1]) < 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+if count > tonumber(ARGV[1]) then
+    redis.call('SETEX', KEYS[2], ARGV[3], '1')
+    return {1, count, tonumber(ARGV[3])}
+end
+return {0, count, 0}
+"""
+
+# Скользящее окно на отсортированном множестве: метки времени сообщений за последние ARGV[2] мс
+# KEYS: множество, флаг блокировки; ARGV: лимит, окно (мс), длительность блокировки (сек), текущее время (мс), id сообщения
+FLOOD_SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[4])
+local window = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+redis.call('ZADD', KEYS[1], now, ARGV[5])
+redis.call('PEXPIRE', KEYS[1], window)
+local count = redis.call('ZCARD', KEYS[1])
+if count > tonumber(ARGV[1]) then
+    redis.call('SETEX', KEYS[2], ARGV[3], '1')
+    return {1, count, tonumber(ARGV[3])}
+end
+return {0, count, 0}
+"""
+
+FLOOD_MODES = ("fixed", "sliding")
+FLOOD_BLOCK_DURATION = 30  # 30 секунд блокировки по умолчанию
+
+# Скрипты, зарегистрированные на текущем клиенте Redis
+_scripts: Dict[str, object] = {}
+
+def _get_script(name: str):
+    if not _scripts:
+        redis = get_redis()
+        _scripts["fixed"] = redis.register_script(FLOOD_FIXED_WINDOW_SCRIPT)
+        _scripts["sliding"] = redis.register_script(FLOOD_SLIDING_WINDOW_SCRIPT)
+        _scripts["repeated_messages"] = redis.register_script(REPEATED_MESSAGES_SCRIPT)
+    return _scripts[name]
+
+async def check_flood(chat_id: int, user_id: int, limit: int = 5, seconds: int = 10, mode: str = "fixed",
+                      block_duration: int = FLOOD_BLOCK_DURATION) -> Tuple[bool, int]:
+    """
+    Проверяет флуд одним серверным скриптом: счетчик, окно, флаг блокировки и TTL за один запрос.
+
+    Args:
+        chat_id: ID чата.
+        user_id: ID пользователя.
+        limit: Максимальное количество сообщений за интервал (по умолчанию 5).
+        seconds: Интервал времени в секундах для проверки (по умолчанию 10).
+        mode: 'fixed' — фиксированное окно, 'sliding' — скользящее окно.
+        block_duration: Длительность блокировки в секундах.
+
+    Возвращает:
+        Tuple[bool, int]: (превышен ли лимит, оставшееся время блокировки в секундах).
+    """
+    try:
+        block_key = f"block:{chat_id}:{user_id}"
+        if mode == "sliding":
+            now_ms = int(time.time() * 1000)
+            flooding, count, ttl = await _get_script("sliding")(
+                keys=[f"spam:sliding:{chat_id}:{user_id}", block_key],
+                args=[limit, seconds * 1000, block_duration, now_ms, f"{now_ms}-{time.perf_counter_ns()}"]
+            )
+        else:
+            flooding, count, ttl = await _get_script("fixed")(
+                keys=[f"spam:{chat_id}:{user_id}", block_key],
+                args=[limit, seconds, block_duration]
+            )
+        if flooding:
+            logger.info(f"Пользователь {user_id} в chat_id={chat_id} помечен как спамер (сообщений: {count}, режим: {mode})")
+            return True, int(ttl)
+        logger.debug(f"Сообщение от user_id={user_id} в chat_id={chat_id}, счетчик: {count} (режим: {mode})")
+        return False, 0
+    except Exception as e:
+        logger.error(f"Ошибка при проверке спама для user_id={user_id} в chat_id={chat_id}: {str(e)}")
+        return False, 0
+
 async def is_spamming(chat_id: int, user_id: int, limit: int = 5, seconds: int = 10) -> bool:
     """
     Проверяет, превышает ли пользователь лимит сообщений за заданный интервал времени.
@@ -198,50 +353,23 @@ async def is_spamming(chat_id: int, user_id: int, limit: int = 5, seconds: int =
     Возвращает:
         bool: True, если пользователь спамит, иначе False.
     """
-    try:
-        async with redis_client() as redis:
-            key = f"spam:{chat_id}:{user_id}"
-            current_time = time.time()
-
-            # Увеличиваем счетчик сообщений
-            count = await redis.incr(key)
-            if count == 1:
-                # Устанавливаем TTL для нового счетчика
-                await redis.expire(key, seconds)
-                await redis.setex(f"last_message:{chat_id}:{user_id}", seconds, current_time)
-                logger.debug(f"Начало отслеживания сообщений для user_id={user_id} в chat_id={chat_id}")
-                return False
-
-            # Проверяем превышение лимита
-            if count > limit:
-                # Устанавливаем флаг блокировки
-                block_key = f"block:{chat_id}:{user_id}"
-                block_duration = 30  # 30 секунд блокировки по умолчанию
-                await redis.setex(block_key, block_duration, "1")
-                logger.info(f"Пользователь {user_id} в chat_id={chat_id} помечен как спамер (сообщений: {count})")
-                return True
-
-            # Обновляем timestamp последнего сообщения
-            await redis.setex(f"last_message:{chat_id}:{user_id}", seconds, current_time)
-            logger.debug(f"Сообщение от user_id={user_id} в chat_id={chat_id}, счетчик: {count}")
-            return False
-    except Exception as e:
-        logger.error(f"Ошибка при проверке спама для user_id={user_id} в chat_id={chat_id}: {str(e)}")
-        return False
+    flooding, _ = await check_flood(chat_id, user_id, limit, seconds)
+    return flooding
 
 async def reset_spam_state(chat_id: int, user_id: int) -> None:
     """
-    Сбрасывает состояние спама для пользователя в указанном чате (удаляет счетчик и timestamp).
+    Сбрасывает состояние спама для пользователя в указанном чате (счетчики флуда, блокировку и историю повторов).
 
     Args:
         chat_id: ID чата.
         user_id: ID пользователя.
     """
     try:
-        async with redis_client() as redis:
-            keys = [f"spam:{chat_id}:{user_id}", f"last_message:{chat_id}:{user_id}", f"repeated_messages:{chat_id}:{user_id}"]
-            await redis.delete(*keys)
-            logger.info(f"Состояние спама сброшено для user_id={user_id} в chat_id={chat_id}")
+        redis = get_redis()
+        keys = [f"spam:{chat_id}:{user_id}", f"spam:sliding:{chat_id}:{user_id}", f"block:{chat_id}:{user_id}",
+                f"antispam:{chat_id}:{user_id}:messages"]
+        await redis.delete(*keys)
+        logger.info(f"Состояние спама сброшено для user_id={user_id} в chat_id={chat_id}")
     except Exception as e:
         logger.error(f"Ошибка при сбросе состояния спама для user_id={user_id} в chat_id={chat_id}: {str(e)}")
 
@@ -257,14 +385,14 @@ async def get_ttl(chat_id: int, user_id: int) -> int:
         int: Оставшееся время в секундах до конца блокировки, или 0, если пользователь не заблокирован.
     """
     try:
-        async with redis_client() as redis:
-            block_key = f"block:{chat_id}:{user_id}"
-            ttl = await redis.ttl(block_key)
-            if ttl < 0:  # Ключ не существует или без TTL
-                logger.debug(f"Пользователь user_id={user_id} в chat_id={chat_id} не заблокирован")
-                return 0
-            logger.debug(f"Оставшееся время блокировки для user_id={user_id} в chat_id={chat_id}: {ttl} секунд")
-            return ttl
+        redis = get_redis()
+        block_key = f"block:{chat_id}:{user_id}"
+        ttl = await redis.ttl(block_key)
+        if ttl < 0:  # Ключ не существует или без TTL
+            logger.debug(f"Пользователь user_id={user_id} в chat_id={chat_id} не заблокирован")
+            return 0
+        logger.debug(f"Оставшееся время блокировки для user_id={user_id} в chat_id={chat_id}: {ttl} секунд")
+        return ttl
     except Exception as e:
         logger.error(f"Ошибка при получении TTL для user_id={user_id} в chat_id={chat_id}: {str(e)}")
         return 0
@@ -282,15 +410,15 @@ async def get_settings(setting_type: str, chat_id: int) -> Optional[Dict]:
         Optional[Dict]: Словарь настроек или None, если настройки не найдены.
     """
     try:
-        async with redis_client() as redis:
-            key = f"settings:{setting_type}:{chat_id}"
-            settings = await redis.get(key)
-            if settings:
-                parsed_settings = json.loads(settings)
-                logger.debug(f"Найдены настройки {setting_type} для chat_id={chat_id}: {parsed_settings}")
-                return parsed_settings
-            logger.debug(f"Настройки {setting_type} для chat_id={chat_id} не найдены")
-            return None
+        redis = get_redis()
+        key = f"settings:{setting_type}:{chat_id}"
+        settings = await redis.get(key)
+        if settings:
+            parsed_settings = json.loads(settings)
+            logger.debug(f"Найдены настройки {setting_type} для chat_id={chat_id}: {parsed_settings}")
+            return parsed_settings
+        logger.debug(f"Настройки {setting_type} для chat_id={chat_id} не найдены")
+        return None
     except Exception as e:
         logger.error(f"Ошибка при получении настроек {setting_type} для chat_id={chat_id}: {str(e)}")
         return None
@@ -312,12 +440,12 @@ async def save_settings(setting_type: str, chat_id: int, settings: Dict, ttl: Op
         if not await validate_settings(setting_type, settings):
             logger.error(f"Невалидные настройки {setting_type} для chat_id={chat_id}: {settings}")
             return False
-        async with redis_client() as redis:
-            key = f"settings:{setting_type}:{chat_id}"
-            await redis.set(key, json.dumps(settings), ex=ttl)
-            await settings_cache.set(f"{setting_type}:{chat_id}", settings, ttl=3600)
-            logger.info(f"Настройки {setting_type} сохранены для chat_id={chat_id} с TTL={ttl}s: {settings}")
-            return True
+        redis = get_redis()
+        key = f"settings:{setting_type}:{chat_id}"
+        await redis.set(key, json.dumps(settings), ex=ttl)
+        await _on_settings_saved(setting_type, chat_id, settings)
+        logger.info(f"Настройки {setting_type} сохранены для chat_id={chat_id} с TTL={ttl}s: {settings}")
+        return True
     except Exception as e:
         logger.error(f"Ошибка при сохранении настроек {setting_type} для chat_id={chat_id}: {str(e)}")
         return False
@@ -330,30 +458,30 @@ async def get_all_settings() -> Dict[int, Dict]:
         Dict[int, Dict]: Словарь с настройками для каждого чата.
     """
     try:
-        async with redis_client() as redis:
-            settings = {}
-            known_chats = await get_known_chats()
-            setting_types = ["antispam", "tlink"]
-            pipeline = redis.pipeline()
-            for chat_id in known_chats:
-                for setting_type in setting_types:
-                    pipeline.get(f"settings:{setting_type}:{chat_id}")
-            results = await pipeline.execute()
-
-            index = 0
-            for chat_id in known_chats:
-                chat_settings = {}
-                for setting_type in setting_types:
-                    data = results[index]
-                    index += 1
-                    if data:
-                        parsed_settings = json.loads(data)
-                        chat_settings[setting_type] = parsed_settings
-                        await settings_cache.set(f"{setting_type}:{chat_id}", parsed_settings, ttl=3600)
-                if chat_settings:
-                    settings[chat_id] = chat_settings
-            logger.info(f"Получены настройки для {len(settings)} чатов")
-            return settings
+        redis = get_redis()
+        settings = {}
+        known_chats = await get_known_chats()
+        setting_types = ["antispam", "tlink"]
+        pipeline = redis.pipeline()
+        for chat_id in known_chats:
+            for setting_type in setting_types:
+                pipeline.get(f"settings:{setting_type}:{chat_id}")
+        results = await pipeline.execute()
+
+        index = 0
+        for chat_id in known_chats:
+            chat_settings = {}
+            for setting_type in setting_types:
+                data = results[index]
+                index += 1
+                if data:
+                    parsed_settings = json.loads(data)
+                    chat_settings[setting_type] = parsed_settings
+                    await settings_cache.set(f"{setting_type}:{chat_id}", parsed_settings, ttl=3600)
+            if chat_settings:
+                settings[chat_id] = chat_settings
+        logger.info(f"Получены настройки для {len(settings)} чатов")
+        return settings
     except Exception as e:
         logger.error(f"Ошибка при получении всех настроек: {str(e)}")
         return {}
@@ -370,19 +498,19 @@ async def save_all_settings(settings: Dict[int, Dict], ttl: Optional[int] = 6048
         bool: True, если настройки сохранены, иначе False.
     """
     try:
-        async with redis_client() as redis:
-            pipeline = redis.pipeline()
-            for chat_id, chat_settings in settings.items():
-                for setting_type, setting_data in chat_settings.items():
-                    if not await validate_settings(setting_type, setting_data):
-                        logger.error(f"Невалидные настройки {setting_type} для chat_id={chat_id}: {setting_data}")
-                        continue
-                    key = f"settings:{setting_type}:{chat_id}"
-                    pipeline.set(key, json.dumps(setting_data), ex=ttl)
-                    await settings_cache.set(f"{setting_type}:{chat_id}", setting_data, ttl=3600)
-            await pipeline.execute()
-            logger.info(f"Настройки сохранены для {len(settings)} чатов с TTL={ttl}s")
-            return True
+        redis = get_redis()
+        pipeline = redis.pipeline()
+        for chat_id, chat_settings in settings.items():
+            for setting_type, setting_data in chat_settings.items():
+                if not await validate_settings(setting_type, setting_data):
+                    logger.error(f"Невалидные настройки {setting_type} для chat_id={chat_id}: {setting_data}")
+                    continue
+                key = f"settings:{setting_type}:{chat_id}"
+                pipeline.set(key, json.dumps(setting_data), ex=ttl)
+                await _on_settings_saved(setting_type, chat_id, setting_data)
+        await pipeline.execute()
+        logger.info(f"Настройки сохранены для {len(settings)} чатов с TTL={ttl}s")
+        return True
     except Exception as e:
         logger.error(f"Ошибка при сохранении всех настроек: {str(e)}")
         return False
@@ -395,49 +523,49 @@ async def preload_antispam_settings() -> bool:
         bool: True, если предзагрузка успешна, иначе False.
     """
     try:
-        async with redis_client() as redis:
-            known_chats = await get_known_chats()
-            default_antispam_settings = {
-                "enabled": False,
-                "repeated_words_limit": 3,
-                "case_sensitive": False,
-                "action": "warn",
-                "mute_duration": 3600,
-                "ban_duration": 86400,
-                "warning_threshold": 3,
-                "max_messages_per_minute": 10,
-                "ignored_words": [],
-                "auto_kick_inactive": False,
-                "telegram_links": {"enabled": False, "action": "delete", "duration": 0},
-                "repeated_words": {"enabled": False, "limit": 3, "action": "warn", "duration": 3600},
-                "repeated_messages": {"enabled": False, "limit": 3, "action": "warn", "duration": 1800},
-                "flood": {"enabled": False, "limit": 10, "action": "warn", "duration": 3600},
-                "external_links": {"enabled": False, "action": "delete", "duration": 0},
-                "media_filter": {"enabled": False, "action": "delete", "duration": 0}
-            }
-            pipeline = redis.pipeline()
-            for chat_id in known_chats:
-                key = f"settings:antispam:{chat_id}"
-                pipeline.get(key)
-            results = await pipeline.execute()
-
-            pipeline = redis.pipeline()
-            index = 0
-            for chat_id in known_chats:
-                settings = results[index]
-                index += 1
-                if not settings:
-                    pipeline.set(key, json.dumps(default_antispam_settings), ex=604800)
-                    await settings_cache.set(f"antispam:{chat_id}", default_antispam_settings, ttl=3600)
-                    logger.info(
-                        f"Установлены настройки антиспама по умолчанию для chat_id={chat_id}: {default_antispam_settings}")
-                else:
-                    parsed_settings = json.loads(settings)
-                    await settings_cache.set(f"antispam:{chat_id}", parsed_settings, ttl=3600)
-                    logger.debug(f"Настройки антиспама уже существуют для chat_id={chat_id}: {parsed_settings}")
-            await pipeline.execute()
-            logger.info(f"Предзагрузка настроек антиспама завершена для {len(known_chats)} чатов")
-            return True
+        redis = get_redis()
+        known_chats = await get_known_chats()
+        default_antispam_settings = {
+            "enabled": False,
+            "repeated_words_limit": 3,
+            "case_sensitive": False,
+            "action": "warn",
+            "mute_duration": 3600,
+            "ban_duration": 86400,
+            "warning_threshold": 3,
+            "max_messages_per_minute": 10,
+            "ignored_words": [],
+            "auto_kick_inactive": False,
+            "telegram_links": {"enabled": False, "action": "delete", "duration": 0},
+            "repeated_words": {"enabled": False, "limit": 3, "action": "warn", "duration": 3600},
+            "repeated_messages": {"enabled": False, "limit": 3, "action": "warn", "duration": 1800},
+            "flood": {"enabled": False, "limit": 10, "mode": "fixed", "action": "warn", "duration": 3600},
+            "external_links": {"enabled": False, "action": "delete", "duration": 0},
+            "media_filter": {"enabled": False, "action": "delete", "duration": 0}
+        }
+        pipeline = redis.pipeline()
+        for chat_id in known_chats:
+            key = f"settings:antispam:{chat_id}"
+            pipeline.get(key)
+        results = await pipeline.execute()
+
+        pipeline = redis.pipeline()
+        index = 0
+        for chat_id in known_chats:
+            settings = results[index]
+            index += 1
+            if not settings:
+                pipeline.set(key, json.dumps(default_antispam_settings), ex=604800)
+                await settings_cache.set(f"antispam:{chat_id}", default_antispam_settings, ttl=3600)
+                logger.info(
+                    f"Установлены настройки антиспама по умолчанию для chat_id={chat_id}: {default_antispam_settings}")
+            else:
+                parsed_settings = json.loads(settings)
+                await settings_cache.set(f"antispam:{chat_id}", parsed_settings, ttl=3600)
+                logger.debug(f"Настройки антиспама уже существуют для chat_id={chat_id}: {parsed_settings}")
+        await pipeline.execute()
+        logger.info(f"Предзагрузка настроек антиспама завершена для {len(known_chats)} чатов")
+        return True
     except Exception as e:
         logger.error(f"Ошибка при предзагрузке настроек антиспама: {str(e)}")
         return False
@@ -498,6 +626,56 @@ async def check_repeated_words(message: Message) -> bool:
         prev_word = current_word
     return False
 
+# Повторы сообщений: история хэшей (новые слева), обрезка, TTL и подсчет подряд идущих повторов за один вызов
+# KEYS: список хэшей; ARGV: хэш сообщения, лимит, TTL (сек)
+REPEATED_MESSAGES_SCRIPT = """
+local limit = tonumber(ARGV[2])
+redis.call('LPUSH', KEYS[1], ARGV[1])
+redis.call('LTRIM', KEYS[1], 0, limit - 1)
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+local repeats = 0
+for _, value in ipairs(redis.call('LRANGE', KEYS[1], 0, -1)) do
+    if value ~= ARGV[1] then
+        break
+    end
+    repeats = repeats + 1
+end
+if repeats >= limit then
+    redis.call('DEL', KEYS[1])
+end
+return repeats
+"""
+
+REPEATED_MESSAGES_TTL = 3600
+
+async def count_repeated_messages(chat_id: int, user_id: int, message_hash: str, limit: int,
+                                  ttl: int = REPEATED_MESSAGES_TTL) -> int:
+    """
+    Добавляет хэш сообщения в историю пользователя и возвращает число одинаковых сообщений подряд.
+
+    Выполняется одним серверным скриптом; при достижении лимита история очищается.
+
+    Args:
+        chat_id: ID чата.
+        user_id: ID пользователя.
+        message_hash: Хэш сообщения (get_message_hash).
+        limit: Количество повторов, при котором фиксируется нарушение.
+        ttl: Время жизни истории в секундах.
+
+    Возвращает:
+        int: Количество подряд идущих одинаковых сообщений (не больше limit).
+    """
+    try:
+        repeats = await _get_script("repeated_messages")(
+            keys=[f"antispam:{chat_id}:{user_id}:messages"],
+            args=[message_hash, limit, ttl]
+        )
+        logger.debug(f"Повторы сообщений от user_id={user_id} в chat_id={chat_id}: {repeats}/{limit}")
+        return int(repeats)
+    except Exception as e:
+        logger.error(f"Ошибка при проверке повторов для user_id={user_id} в chat_id={chat_id}: {str(e)}")
+        return 0
+
 async def check_repeated_messages(message: Message) -> bool:
     """
     Проверяет сообщение на повторение подряд и применяет антиспам-действия.
@@ -527,42 +705,12 @@ async def check_repeated_messages(message: Message) -> bool:
         logger.debug(f"Проверка повторяющихся сообщений отключена для chat_id={chat_id}")
         return False
 
-    async with redis_client() as redis:
-        message_key = f"repeated_messages:{chat_id}:{user_id}"
-        message_hash = hashlib.md5(text.encode('utf-8')).hexdigest()
-        count_key = f"repeated_messages_count:{chat_id}:{user_id}"
-
-        # Получаем текущий счетчик повторений
-        current_count = await redis.get(count_key)
-        current_count = int(current_count) if current_count else 0
-
-        # Получаем последнее сообщение
-        last_message = await redis.get(message_key)
-
-        if last_message and last_message == message_hash:
-            current_count += 1
-            await redis.set(count_key, current_count, ex=3600)
-            logger.debug(f"Повтор сообщения от user_id={user_id} в chat_id={chat_id}, счетчик: {current_count}")
-
-            # Проверка на нарушение
-            if current_count >= 3 and current_count < 6:
-                settings["repeated_messages"]["action"] = "warn"
-                settings["repeated_messages"]["duration"] = 3600
-                await message.delete()  # Удаляем сообщение
-                logger.info(f"Удалено повторяющееся сообщение от user_id={user_id} в chat_id={chat_id}, счетчик: {current_count}")
-                return await apply_antispam_action(user_id, chat_id, settings, message, "repeated_messages")
-            elif current_count >= 6:
-                settings["repeated_messages"]["action"] = "mute"
-                settings["repeated_messages"]["duration"] = 1800  # 30 минут
-                await message.delete()  # Удаляем сообщение
-                logger.info(f"Удалено повторяющееся сообщение от user_id={user_id} в chat_id={chat_id}, счетчик: {current_count}")
-                return await apply_antispam_action(user_id, chat_id, settings, message, "repeated_messages")
-        else:
-            # Сбрасываем счетчик, если сообщение новое
-            await redis.set(message_key, message_hash, ex=3600)
-            await redis.set(count_key, 1, ex=3600)
-            logger.debug(f"Новое сообщение от user_id={user_id} в chat_id={chat_id}, счетчик сброшен")
+    limit = settings["repeated_messages"].get("limit", 5)
+    if await count_repeated_messages(chat_id, user_id, get_message_hash(text), limit) < limit:
         return False
+    send_queue.enqueue(chat_id, message.delete, kind="action")  # Удаляем сообщение
+    logger.info(f"Удалено повторяющееся сообщение от user_id={user_id} в chat_id={chat_id}, повторов: {limit}")
+    return await apply_antispam_action(user_id, chat_id, settings, message, "repeated_messages")
 
 async def apply_antispam_action(user_id: int, chat_id: int, settings: Dict, message: Message,
                                 violation_type: str = None) -> bool:
@@ -608,21 +756,16 @@ async def apply_antispam_action(user_id: int, chat_id: int, settings: Dict, mess
         user_mention = f"@{user.username}" if user.username else user.display_name or f"User {user_id}"
 
         if action == "delete":
-            try:
-                await message.delete()
-                logger.info(f"Сообщение удалено для user_id={user_id} в chat_id={chat_id} за {punishment_record['reason']}")
-                return True
-            except Exception as e:
-                logger.error(f"Не удалось удалить сообщение для user_id={user_id} в chat_id={chat_id}: {str(e)}")
-                return False
+            send_queue.enqueue(chat_id, message.delete, kind="action")
+            logger.info(f"Удаление сообщения для user_id={user_id} в chat_id={chat_id} за {punishment_record['reason']} поставлено в очередь")
+            return True
 
         if action == "warn":
             if warning_count < settings["warning_threshold"]:
                 success = await add_warning(user_id, chat_id, punishment_record["reason"], message.bot.id)
                 if success:
-                    await asyncio.sleep(1)  # Задержка для предотвращения лимитов Telegram
-                    await message.reply(
-                        f"⚠️ Пользователь {user_mention} получил предупреждение за {punishment_record['reason']}.")
+                    # Ответ отправляется через очередь с учетом лимитов Telegram, без задержки обработчика
+                    send_queue.enqueue_reply(message.bot, chat_id, message, f"⚠️ Пользователь {user_mention} получил предупреждение за {punishment_record['reason']}.")
                     await notification_cache.set(notification_key, True, ttl=60)
                     logger.info(f"Выдано предупреждение пользователю {user_id} в chat_id={chat_id}")
                     return True
@@ -635,9 +778,8 @@ async def apply_antispam_action(user_id: int, chat_id: int, settings: Dict, mess
             duration = violation_settings.get("duration", settings.get("mute_duration", 3600))
             success = await mute_user(user_id, chat_id, duration, punishment_record["reason"], message.bot.id)
             if success:
-                await asyncio.sleep(1)  # Задержка для предотвращения лимитов Telegram
-                await message.reply(
-                    f"🔇 Пользователь {user_mention} замучен на {duration // 60} минут за {punishment_record['reason']}.")
+                # Ответ отправляется через очередь с учетом лимитов Telegram, без задержки обработчика
+                send_queue.enqueue_reply(message.bot, chat_id, message, f"🔇 Пользователь {user_mention} замучен на {duration // 60} минут за {punishment_record['reason']}.")
                 await notification_cache.set(notification_key, True, ttl=60)
                 logger.info(f"Пользователь {user_id} замучен в chat_id={chat_id}")
                 return True
@@ -646,9 +788,8 @@ async def apply_antispam_action(user_id: int, chat_id: int, settings: Dict, mess
             duration = violation_settings.get("duration", settings.get("ban_duration", 86400))
             success = await ban_user(user_id, chat_id, punishment_record["reason"], message.bot.id, duration)
             if success:
-                await asyncio.sleep(1)  # Задержка для предотвращения лимитов Telegram
-                await message.reply(
-                    f"🚫 Пользователь {user_mention} забанен на {duration // 3600} часов за {punishment_record['reason']}.")
+                # Ответ отправляется через очередь с учетом лимитов Telegram, без задержки обработчика
+                send_queue.enqueue_reply(message.bot, chat_id, message, f"🚫 Пользователь {user_mention} забанен на {duration // 3600} часов за {punishment_record['reason']}.")
                 await notification_cache.set(notification_key, True, ttl=60)
                 logger.info(f"Пользователь {user_id} забанен в chat_id={chat_id}")
                 return True
@@ -660,7 +801,7 @@ async def apply_antispam_action(user_id: int, chat_id: int, settings: Dict, mess
 
 async def get_antispam_stats(chat_id: int) -> Dict:
     """
-    Получает статистику антиспама для указанного чата.
+    Получает статистику антиспама для указанного чата (агрегация в MongoDB с кэшем, см. get_moderation_stats).
 
     Args:
         chat_id: ID чата.
@@ -669,70 +810,135 @@ async def get_antispam_stats(chat_id: int) -> Dict:
         Dict: Словарь со статистикой (warnings, mutes, bans, users).
     """
     try:
-        db = await get_database()
-        stats = {
-            "warnings": 0,
-            "mutes": 0,
-            "bans": 0,
-            "users": 0
-        }
-        async for user in db.users.find({"group_ids": chat_id}):
-            stats["users"] += 1
-            stats["warnings"] += len(user.get("warnings", {}).get(str(chat_id), []))
-            stats["mutes"] += 1 if user.get("mutes", {}).get(str(chat_id), {}).get("is_muted", False) else 0
-            stats["bans"] += 1 if user.get("bans", {}).get(str(chat_id), {}).get("is_banned", False) else 0
+        stats = await get_moderation_stats(chat_id)
         logger.info(f"Получена статистика антиспама для chat_id={chat_id}: {stats}")
         return stats
     except Exception as e:
         logger.error(f"Ошибка при получении статистики антиспама для chat_id={chat_id}: {str(e)}")
         return {}
 
-async def kick_inactive_users(chat_id: int, bot: aiogram.Bot, inactivity_days: int = 30) -> int:
+async def _inactive_user_ids(chat_id: int, threshold: float) -> List[int]:
+    """Участники чата, неактивные с threshold: индексный запрос, возвращающий только user_id."""
+    from .migrations import is_applied
+    # Отсутствующий last_active считается неактивностью
+    inactive = {"$not": {"$gte": threshold}}
+    if is_applied("memberships_backfill"):
+        collection = await get_memberships_collection()
+        cursor = collection.find(
+            {"chat_id": chat_id, "in_chat": {"$ne": False}, "last_active": inactive}, {"_id": 0, "user_id": 1}
+        )
+    else:
+        db = await get_database()
+        cursor = db.users.find({"group_ids": chat_id, "last_active": inactive}, {"_id": 0, "user_id": 1})
+    return [doc["user_id"] async for doc in cursor]
+
+async def kick_inactive_users(chat_id: int, bot: aiogram.Bot, inactivity_days: int = 30, dry_run: bool = False) -> int:
     """
     Удаляет неактивных пользователей из чата, если включена настройка auto_kick_inactive.
 
+    Кандидаты выбираются индексным запросом; запросы ban_chat_member выполняются
+    KICK_INACTIVE_CONCURRENCY обработчиками через send_queue (общий лимит бота), а изменения
+    в users/memberships и записи moderation_logs пишутся пакетами по KICK_INACTIVE_BATCH_SIZE.
+
     Args:
         chat_id: ID чата.
         bot: Экземпляр бота aiogram.
         inactivity_days: Количество дней неактивности для исключения (по умолчанию 30).
+        dry_run: Только посчитать кандидатов, никого не исключая.
 
     Возвращает:
-        int: Количество исключенных пользователей.
+        int: Количество исключенных пользователей (при dry_run — количество кандидатов).
     """
+    kicked_count = 0
     try:
         settings = await get_settings("antispam", chat_id)
         if not settings or not settings.get("auto_kick_inactive", False):
             logger.debug(f"Автокик неактивных пользователей отключен для chat_id={chat_id}")
             return 0
 
-        db = await get_database()
-        threshold = time.time() - (inactivity_days * 86400)
-        kicked_count = 0
-        async for user in db.users.find({"group_ids": chat_id}):
-            last_active = user.get("last_active", 0)
-            if last_active < threshold:
+        started_at = time.time()
+        threshold = started_at - (inactivity_days * 86400)
+        candidates = await _inactive_user_ids(chat_id, threshold)
+        if dry_run:
+            logger.info(f"Пробный запуск: к исключению из chat_id={chat_id} {len(candidates)} неактивных пользователей")
+            return len(candidates)
+
+        reason = f"Неактивность более {inactivity_days} дней"
+        pending = iter(candidates)
+        kicked: List[int] = []
+        failed_count = 0
+        write_lock = asyncio.Lock()
+
+        async def write_batch(force: bool = False) -> None:
+            nonlocal kicked, kicked_count
+            async with write_lock:
+                if kicked and (force or len(kicked) >= KICK_INACTIVE_BATCH_SIZE):
+                    batch, kicked = kicked, []
+                    try:
+                        kicked_count += await bulk_kick_users(chat_id, batch, reason, bot.id)
+                    except BaseException:
+                        # Пользователи уже исключены в Telegram: пакет остается для следующей записи
+                        kicked[:0] = batch
+                        raise
+                    logger.info(f"Исключение неактивных из chat_id={chat_id}: {kicked_count}/{len(candidates)}")
+
+        async def worker() -> None:
+            nonlocal failed_count
+            for user_id in pending:
                 try:
-                    await bot.ban_chat_member(chat_id, user["user_id"])
-                    await kick_user(user["user_id"], chat_id, f"Неактивность более {inactivity_days} дней", bot.id)
-                    await db.users.update_one(
-                        {"user_id": user["user_id"]},
-                        {
-                            "$pull": {"group_ids": chat_id},
-                            "$set": {
-                                f"warnings.{chat_id}": [],
-                                f"mutes.{chat_id}": {"is_muted": False, "until": 0.0, "reason": "", "issued_by": 0,
-                                                     "issued_at": 0.0},
-                                f"bans.{chat_id}": {"is_banned": False, "reason": "", "issued_by": 0, "issued_at": 0.0,
-                                                    "until": 0.0}
-                            }
-                        }
-                    )
-                    kicked_count += 1
-                    logger.info(f"Пользователь {user['user_id']} исключен из chat_id={chat_id} за неактивность")
+                    await send_queue.call(bot.ban_chat_member, chat_id, user_id)
+                    kicked.append(user_id)
                 except Exception as e:
-                    logger.error(f"Ошибка при исключении пользователя {user['user_id']} из chat_id={chat_id}: {str(e)}")
-        logger.info(f"Исключено {kicked_count} неактивных пользователей из chat_id={chat_id}")
+                    failed_count += 1
+                    logger.error(f"Ошибка при исключении пользователя {user_id} из chat_id={chat_id}: {str(e)}")
+                await write_batch()
+
+        workers = [asyncio.create_task(worker()) for _ in range(KICK_INACTIVE_CONCURRENCY)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            # При ошибке или отмене остальные обработчики останавливаются, чтобы не исключать
+            # пользователей после выхода из функции
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            # Уже исключенные в Telegram пользователи записываются и при ошибке или отмене
+            try:
+                await write_batch(force=True)
+            except Exception as e:
+                logger.error(f"Не записано исключение пользователей из chat_id={chat_id} {kicked}: {str(e)}")
+                raise
+        logger.info(
+            f"Исключено {kicked_count} неактивных пользователей из chat_id={chat_id} "
+            f"(кандидатов {len(candidates)}, ошибок {failed_count}) за {time.time() - started_at:.1f} сек"
+        )
         return kicked_count
     except Exception as e:
         logger.error(f"Ошибка при исключении неактивных пользователей для chat_id={chat_id}: {str(e)}")
-        return 0
\ No newline at end of file
+        # Возвращается число уже записанных исключений
+        return kicked_count
+
+def start_kick_inactive(chat_id: int, bot: aiogram.Bot, inactivity_days: int = 30) -> Tuple[asyncio.Task, bool]:
+    """
+    Запускает исключение неактивных пользователей в фоне, чтобы обработчик команды не занимал
+    очередь обновлений чата на время исключения.
+
+    Возвращает:
+        Tuple[asyncio.Task, bool]: Задача и признак того, что она только что запущена
+        (False — исключение в этом чате уже выполняется).
+    """
+    task = _kick_tasks.get(chat_id)
+    if task is not None and not task.done():
+        return task, False
+    task = asyncio.create_task(kick_inactive_users(chat_id, bot, inactivity_days))
+    _kick_tasks[chat_id] = task
+    task.add_done_callback(lambda t: _kick_tasks.pop(chat_id, None) if _kick_tasks.get(chat_id) is t else None)
+    return task, True
+
+async def stop_kick_inactive() -> None:
+    """Отменяет выполняющиеся исключения неактивных (при остановке бота)."""
+    tasks = list(_kick_tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _kick_tasks.clear()
@@ -1,16 +1,20 @@
 # Путь файла: bot/modules/no_sql/user_db.py
 
+import asyncio
 import time
 import os
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, Optional, List
+from typing import Any, Dict, Optional, List, Tuple
 from motor.motor_asyncio import AsyncIOMotorCollection
 from bson import ObjectId
 from loguru import logger
-from pymongo.errors import DuplicateKeyError
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from dotenv import load_dotenv
 import aiogram
-from aiocache import cached
+from aiocache import cached, Cache
+from . import memberships
 
 # Проверка версии aiogram
 assert aiogram.__version__ == "3.20.0.post0", f"Expected aiogram version 3.20.0.post0, but found {aiogram.__version__}"
@@ -52,6 +56,18 @@ except ValueError as e:
     logger.error(f"Ошибка при загрузке OWNER_BOT_ID: {str(e)}")
     raise
 
+# Версия схемы документов users; новые документы создаются сразу в актуальной версии (см. migrations.py)
+USER_SCHEMA_VERSION = 2
+
+# Время жизни кэша статистики модерации чата (секунды); кэш сбрасывается при действиях модерации
+MODERATION_STATS_TTL = int(os.getenv("MODERATION_STATS_TTL", "60"))
+moderation_stats_cache = Cache(Cache.MEMORY, ttl=MODERATION_STATS_TTL)
+
+# Срок хранения подробных логов модерации (дни). По умолчанию 0 — записи хранятся бессрочно;
+# заданный срок не меньше 2 дней, чтобы сводка за прошедший день успела построиться до удаления записей
+_retention_days = int(os.getenv("MODERATION_LOGS_RETENTION_DAYS", "0"))
+MODERATION_LOGS_RETENTION_DAYS = max(2, _retention_days) if _retention_days > 0 else 0
+
 # Допустимые действия модерации
 VALID_MODERATION_ACTIONS = {"warn", "ban", "mute", "unban", "unmute", "kick", "clear_warnings", "delete"}
 
@@ -85,6 +101,10 @@ async def get_moderation_logs_collection() -> AsyncIOMotorCollection:
     db = await get_database()
     return db["moderation_logs"]
 
+def _as_dict(value: Any) -> Dict:
+    """Возвращает value, если это словарь, иначе пустой словарь (для документов со старой схемой)."""
+    return value if isinstance(value, dict) else {}
+
 class User:
     """Класс для представления пользователя."""
     def __init__(self, user_id: int, username: str = None, display_name: str = None,
@@ -151,12 +171,12 @@ class User:
             last_active=data.get("last_active"),
             minutes_active=data.get("minutes_active", 0),
             is_banned=data.get("is_banned", False),
-            warnings=data.get("warnings", {}),
+            warnings=_as_dict(data.get("warnings")),
             role_level=data.get("role_level", 0),
             is_bot=data.get("is_bot", False),
-            activity_count=data.get("activity_count", {}),
-            bans=data.get("bans", {}),
-            mutes=data.get("mutes", {})
+            activity_count=_as_dict(data.get("activity_count")),
+            bans=_as_dict(data.get("bans")),
+            mutes=_as_dict(data.get("mutes"))
         )
 
     def get_role_for_chat(self, chat_id: int) -> str:
@@ -213,111 +233,163 @@ async def ensure_user_exists(
         raise ValueError("chat_id должен быть отрицательным целым числом")
 
     try:
-        # Проверяем, существует ли пользователь
-        user = await get_user(user_id, create_if_not_exists=False, chat_id=chat_id)
-        # Обновляем данные пользователя
-        updates = {
+        return await get_message_context(user_id, chat_id, username, display_name, is_bot, count_activity=False)
+    except Exception as e:
+        logger.error(f"Ошибка при создании/обновлении пользователя user_id={user_id} в chat_id={chat_id}: {str(e)}")
+        raise
+
+async def get_message_context(
+    user_id: int,
+    chat_id: int,
+    username: Optional[str] = None,
+    display_name: Optional[str] = None,
+    is_bot: bool = False,
+    count_activity: bool = True
+) -> User:
+    """
+    Загружает контекст пользователя для входящего сообщения за один запрос к MongoDB.
+
+    Одним атомарным upsert обновляет профиль, добавляет чат в group_ids, увеличивает
+    счетчик активности (кроме ботов) и возвращает обновленный документ. Полученный
+    объект User передается дальше по цепочке обработки, чтобы не читать его повторно.
+    """
+    if not isinstance(user_id, int) or user_id <= 0:
+        logger.error(f"Недействительный user_id: {user_id}")
+        raise ValueError("user_id должен быть положительным целым числом")
+    if not isinstance(chat_id, int) or chat_id >= 0:
+        logger.error(f"Недействительный chat_id: {chat_id}")
+        raise ValueError("chat_id должен быть отрицательным целым числом")
+
+    now = time.time()
+    update_doc = {
+        "$set": {
             "username": username,
             "display_name": display_name,
             "is_bot": is_bot,
-            "last_active": time.time()
+            "last_active": now
+        },
+        "$addToSet": {"group_ids": chat_id},
+        "$setOnInsert": {
+            "id": ObjectId(),
+            "channel_ids": [],
+            "server_owner_chat_ids": [],
+            "is_premium": False,
+            "created_at": now,
+            "minutes_active": 0,
+            "is_banned": False,
+            "warnings": {},
+            "bans": {},
+            "mutes": {},
+            "schema_version": USER_SCHEMA_VERSION
         }
-        if chat_id not in user.group_ids:
-            updates["group_ids"] = user.group_ids + [chat_id]
-        if user_id == OWNER_BOT_ID and user.role_level != 7:
-            updates["role_level"] = 7
-        await update_user(user_id, updates)
-        logger.info(f"Обновлен пользователь user_id={user_id} для chat_id={chat_id}")
-        return await get_user(user_id, chat_id=chat_id)
-    except ValueError:
-        # Пользователь не найден, создаем нового
-        role_level = 7 if user_id == OWNER_BOT_ID else 0
-        user = User(
-            user_id=user_id,
-            username=username,
-            display_name=display_name,
-            group_ids=[chat_id],
-            is_bot=is_bot,
-            role_level=role_level
+    }
+    if user_id == OWNER_BOT_ID:
+        update_doc["$set"]["role_level"] = 7
+    else:
+        update_doc["$setOnInsert"]["role_level"] = 0
+    if count_activity and not is_bot:
+        update_doc["$inc"] = {f"activity_count.{chat_id}": 1}
+    else:
+        update_doc["$setOnInsert"]["activity_count"] = {}
+
+    collection = await get_user_collection()
+    for attempt in range(2):
+        try:
+            user_data = await collection.find_one_and_update(
+                {"user_id": user_id},
+                update_doc,
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            user = User.from_dict(dict(user_data))
+            memberships.record_activity(
+                chat_id, user_id, username, display_name, is_bot, now,
+                activity=1 if "$inc" in update_doc else 0
+            )
+            logger.debug(
+                f"Контекст сообщения загружен для user_id={user_id} в chat_id={chat_id}, "
+                f"активность: {user.get_activity_count(chat_id)}"
+            )
+            return user
+        except DuplicateKeyError:
+            # Параллельный upsert уже создал документ, повторяем как обычное обновление
+            if attempt == 1:
+                raise
+            logger.debug(f"Параллельное создание пользователя user_id={user_id}, повтор upsert")
+
+async def rollback_activity_count(user_id: int, chat_id: int) -> bool:
+    """Отменяет увеличение счетчика активности, сделанное get_message_context (например, для спама)."""
+    if not isinstance(chat_id, int) or chat_id >= 0:
+        logger.error(f"Недействительный chat_id: {chat_id}")
+        raise ValueError("chat_id должен быть отрицательным целым числом")
+    try:
+        collection = await get_user_collection()
+        result = await collection.update_one(
+            {"user_id": user_id, f"activity_count.{chat_id}": {"$gt": 0}},
+            {"$inc": {f"activity_count.{chat_id}": -1}}
         )
-        logger.info(f"Создается новый пользователь user_id={user_id} для chat_id={chat_id}")
-        return await create_user(user, chat_id=chat_id)
+        if result.modified_count > 0:
+            memberships.add_activity(chat_id, user_id, -1)
+            return True
+        return False
     except Exception as e:
-        logger.error(f"Ошибка при создании/обновлении пользователя user_id={user_id} в chat_id={chat_id}: {str(e)}")
-        raise
+        logger.error(f"Ошибка при откате счетчика активности для user_id={user_id}, chat_id={chat_id}: {str(e)}")
+        return False
 
 async def init_moderation_logs_collection():
-    """Инициализирует коллекцию moderation_logs с индексами по chat_id и issued_at."""
+    """
+    Инициализирует коллекцию moderation_logs: индексы (chat_id[, action | user_id], issued_at, _id) для страниц логов
+    и, если задан MODERATION_LOGS_RETENTION_DAYS, TTL-индекс по created_at, удаляющий более старые записи.
+    История за пределами срока хранения остается в дневных сводках (moderation_rollups).
+    """
     collection = await get_moderation_logs_collection()
     try:
-        await collection.create_index([("chat_id", 1), ("issued_at", -1)])
-        logger.info("Индекс для moderation_logs (chat_id, issued_at) создан или уже существует")
+        # Индексы для пагинации по (issued_at, _id): все записи чата и фильтры по действию и пользователю
+        await collection.create_index([("chat_id", 1), ("issued_at", -1), ("_id", -1)])
+        await collection.create_index([("chat_id", 1), ("action", 1), ("issued_at", -1), ("_id", -1)])
+        await collection.create_index([("chat_id", 1), ("user_id", 1), ("issued_at", -1), ("_id", -1)])
+        indexes = await collection.index_information()
+        if "chat_id_1_issued_at_-1" in indexes:
+            # Прежний индекс покрывается префиксом (chat_id, issued_at, _id)
+            await collection.drop_index("chat_id_1_issued_at_-1")
+        expire_after = MODERATION_LOGS_RETENTION_DAYS * 86400
+        ttl_index = indexes.get("created_at_1")
+        if not MODERATION_LOGS_RETENTION_DAYS:
+            # Срок хранения не задан: TTL-индекс, созданный ранее, удаляется, записи хранятся бессрочно
+            if ttl_index is not None:
+                await collection.drop_index("created_at_1")
+            logger.info("Индексы для moderation_logs (chat_id+issued_at+_id) созданы, срок хранения не ограничен")
+            return
+        if ttl_index is not None and ttl_index.get("expireAfterSeconds") != expire_after:
+            # Срок хранения изменен в настройках: меняем TTL без пересоздания индекса
+            db = collection.database
+            await db.command("collMod", collection.name, index={"keyPattern": {"created_at": 1}, "expireAfterSeconds": expire_after})
+        else:
+            await collection.create_index("created_at", expireAfterSeconds=expire_after)
+        logger.info(f"Индексы для moderation_logs (chat_id+issued_at+_id, TTL {MODERATION_LOGS_RETENTION_DAYS} дн.) созданы или уже существуют")
     except Exception as e:
         logger.error(f"Ошибка при инициализации коллекции moderation_logs: {e}")
         raise
 
 async def init_user_collection():
-    """Инициализирует коллекцию users с индексом и выполняет миграцию данных."""
+    """
+    Инициализирует коллекцию users с индексами.
+
+    Миграции данных здесь не выполняются: ими управляет модуль migrations, который проверяет
+    версию схемы при запуске и выполняет ожидающие миграции в фоне после старта поллинга.
+    """
     collection = await get_user_collection()
     try:
         await collection.create_index("user_id", unique=True)
-        logger.info("Индекс для user_id создан или уже существует")
-
-        # Миграция данных: исправление некорректных типов и инициализация полей
-        async for user in collection.find({}):
-            updates = {}
-            if not isinstance(user.get("warnings"), dict):
-                updates["warnings"] = {}
-            if not isinstance(user.get("bans"), dict):
-                updates["bans"] = {}
-            if not isinstance(user.get("mutes"), dict):
-                updates["mutes"] = {}
-            if not isinstance(user.get("activity_count"), dict):
-                updates["activity_count"] = {}
-            if user.get("user_id") == OWNER_BOT_ID and user.get("role_level", 0) != 7:
-                updates["role_level"] = 7
-            known_chats = await get_known_chats()
-            for chat_id in known_chats:
-                chat_id_str = str(chat_id)
-                if chat_id_str not in user.get("activity_count", {}):
-                    updates[f"activity_count.{chat_id_str}"] = 0
-                if chat_id_str not in user.get("warnings", {}):
-                    updates[f"warnings.{chat_id_str}"] = []
-                if chat_id_str not in user.get("bans", {}):
-                    updates[f"bans.{chat_id_str}"] = {
-                        "is_banned": False, "reason": "", "issued_by": 0, "issued_at": 0.0, "until": 0.0
-                    }
-                if chat_id_str not in user.get("mutes", {}):
-                    updates[f"mutes.{chat_id_str}"] = {
-                        "is_muted": False, "until": 0.0, "reason": "", "issued_by": 0, "issued_at": 0.0
-                    }
-            if updates:
-                await collection.update_one(
-                    {"user_id": user["user_id"]},
-                    {"$set": updates}
-                )
-                logger.info(f"Миграция данных для user_id={user['user_id']}: исправлены поля {list(updates.keys())}")
+        await collection.create_index([("schema_version", 1), ("_id", 1)])
+        await collection.create_index("group_ids")
+        # Поиск неактивных участников чата (kick_inactive_users), пока memberships не заполнена
+        await collection.create_index([("group_ids", 1), ("last_active", 1)])
+        logger.info("Индексы для users (user_id, schema_version, group_ids, group_ids+last_active) созданы или уже существуют")
     except Exception as e:
         logger.error(f"Ошибка при инициализации коллекции пользователей: {e}")
         raise
 
-async def initialize_user_fields(user: User, chat_id: Optional[int] = None) -> User:
-    """Инициализирует поля пользователя для всех известных чатов."""
-    known_chats = await get_known_chats()
-    if chat_id and chat_id not in known_chats:
-        known_chats.append(chat_id)
-    for known_chat_id in known_chats:
-        chat_id_str = str(known_chat_id)
-        if chat_id_str not in user.activity_count:
-            user.activity_count[chat_id_str] = 0
-        if chat_id_str not in user.warnings:
-            user.warnings[chat_id_str] = []
-        if chat_id_str not in user.bans:
-            user.bans[chat_id_str] = {"is_banned": False, "reason": "", "issued_by": 0, "issued_at": 0.0, "until": 0.0}
-        if chat_id_str not in user.mutes:
-            user.mutes[chat_id_str] = {"is_muted": False, "until": 0.0, "reason": "", "issued_by": 0, "issued_at": 0.0}
-    return user
-
 async def create_user(user: User, chat_id: Optional[int] = None) -> User:
     """Создает нового пользователя в базе данных или обновляет существующего."""
     if not isinstance(user.user_id, int) or user.user_id <= 0:
@@ -332,10 +404,9 @@ async def create_user(user: User, chat_id: Optional[int] = None) -> User:
         user.role_level = 7
         logger.info(f"Пользователь {user.user_id} определен как владелец бота, присвоен role_level: 7")
 
-    user = await initialize_user_fields(user, chat_id)
     collection = await get_user_collection()
     try:
-        result = await collection.insert_one(user.to_dict())
+        result = await collection.insert_one({**user.to_dict(), "schema_version": USER_SCHEMA_VERSION})
         user.id = str(result.inserted_id)
         logger.info(f"Создан пользователь: {user.user_id}, роль: {user.get_role_for_chat(chat_id)}, id: {user.id}, chat_id={chat_id}")
         return user
@@ -354,40 +425,121 @@ async def create_user(user: User, chat_id: Optional[int] = None) -> User:
         logger.info(f"Обновлен пользователь: {user.user_id}, роль: {ROLE_NAMES.get(updates.get('role_level', 0), 'Неизвестная роль')}, chat_id={chat_id}")
         return await get_user(user.user_id, create_if_not_exists=False, chat_id=chat_id)
 
+# Отложенные исправления документов пользователей, найденные при чтении: ключ -> операция UpdateOne
+_pending_user_repairs: Dict[Tuple, UpdateOne] = {}
+_user_repairs_task: Optional[asyncio.Task] = None
+USER_REPAIRS_FLUSH_INTERVAL = 5
+
+def _schedule_user_repair(key: Tuple, operation: UpdateOne) -> None:
+    """Ставит исправление документа в очередь фонового пакетного обновления."""
+    _pending_user_repairs[key] = operation
+
+def _schedule_repairs_for(user_data: Dict, user: User, chat_id: Optional[int]) -> None:
+    """Находит в прочитанном документе то, что раньше исправлялось прямо при чтении, и откладывает запись."""
+    user_id = user.user_id
+    schema_fixes = {
+        field: {} for field in ("warnings", "bans", "mutes", "activity_count")
+        if field in user_data and not isinstance(user_data[field], dict)
+    }
+    if user_id == OWNER_BOT_ID and user_data.get("role_level", 0) != 7:
+        schema_fixes["role_level"] = 7
+        user.role_level = 7
+    if schema_fixes:
+        _schedule_user_repair((user_id, "schema"), UpdateOne({"user_id": user_id}, {"$set": schema_fixes}))
+    if chat_id is None:
+        return
+    if chat_id not in user.group_ids:
+        user.group_ids.append(chat_id)
+        _schedule_user_repair((user_id, "group", chat_id), UpdateOne({"user_id": user_id}, {"$addToSet": {"group_ids": chat_id}}))
+    now = time.time()
+    chat_key = str(chat_id)
+    ban_info = user.bans.get(chat_key, {})
+    if ban_info.get("is_banned", False) and 0.0 < ban_info.get("until", 0.0) <= now:
+        # Условие по until защищает от перезаписи бана, выданного после чтения
+        _schedule_user_repair((user_id, "ban", chat_id), UpdateOne(
+            {"user_id": user_id, f"bans.{chat_key}.until": {"$gt": 0.0, "$lte": now}},
+            {"$unset": {f"bans.{chat_key}": ""}}
+        ))
+    mute_info = user.mutes.get(chat_key, {})
+    if mute_info.get("is_muted", False) and mute_info.get("until", 0.0) <= now:
+        _schedule_user_repair((user_id, "mute", chat_id), UpdateOne(
+            {"user_id": user_id, f"mutes.{chat_key}.until": {"$lte": now}},
+            {"$unset": {f"mutes.{chat_key}": ""}}
+        ))
+
+async def flush_user_repairs() -> int:
+    """
+    Записывает отложенные исправления пользователей одним bulk_write.
+
+    Возвращает:
+        int: Количество отправленных операций.
+    """
+    if not _pending_user_repairs:
+        return 0
+    operations = list(_pending_user_repairs.values())
+    _pending_user_repairs.clear()
+    try:
+        collection = await get_user_collection()
+        result = await collection.bulk_write(operations, ordered=False)
+        logger.debug(f"Применены отложенные исправления пользователей: {len(operations)}, изменено: {result.modified_count}")
+    except Exception as e:
+        logger.error(f"Ошибка при записи отложенных исправлений пользователей: {str(e)}")
+    return len(operations)
+
+async def _user_repairs_loop() -> None:
+    while True:
+        await asyncio.sleep(USER_REPAIRS_FLUSH_INTERVAL)
+        await flush_user_repairs()
+
+def start_user_repairs() -> None:
+    """Запускает фоновую запись отложенных исправлений пользователей."""
+    global _user_repairs_task
+    if _user_repairs_task is None or _user_repairs_task.done():
+        _user_repairs_task = asyncio.create_task(_user_repairs_loop())
+
+async def stop_user_repairs() -> None:
+    """Останавливает фоновую запись и сбрасывает оставшиеся исправления."""
+    global _user_repairs_task
+    if _user_repairs_task is not None:
+        _user_repairs_task.cancel()
+        try:
+            await _user_repairs_task
+        except asyncio.CancelledError:
+            pass
+        _user_repairs_task = None
+    await flush_user_repairs()
+
+def _user_projection(chat_id: Optional[int]) -> Dict:
+    """Проекция документа пользователя: без _id, а при указанном чате — только его поддокументы."""
+    if chat_id is None:
+        return {"_id": 0}
+    chat_key = str(chat_id)
+    return {
+        "_id": 0, "id": 1, "user_id": 1, "username": 1, "display_name": 1, "group_ids": 1,
+        "channel_ids": 1, "server_owner_chat_ids": 1, "is_premium": 1, "created_at": 1,
+        "last_active": 1, "minutes_active": 1, "is_banned": 1, "role_level": 1, "is_bot": 1,
+        f"warnings.{chat_key}": 1, f"activity_count.{chat_key}": 1,
+        f"bans.{chat_key}": 1, f"mutes.{chat_key}": 1
+    }
+
 async def get_user(user_id: int, create_if_not_exists: bool = False, chat_id: Optional[int] = None) -> User:
-    """Получает информацию о пользователе по user_id или создает нового, если указано."""
+    """
+    Получает информацию о пользователе по user_id или создает нового, если указано.
+
+    Чтение выполняется одним find_one с проекцией (при указанном chat_id загружаются только данные
+    этого чата) и ничего не записывает: исправления схемы, истекшие муты/баны и отсутствующий чат
+    в group_ids откладываются в фоновое пакетное обновление, а last_active обновляется путями записи.
+    """
     if not isinstance(user_id, int) or user_id <= 0:
         logger.error(f"Недействительный user_id: {user_id}")
         raise ValueError("user_id должен быть положительным целым числом")
 
     collection = await get_user_collection()
-    user_data = await collection.find_one({"user_id": user_id})
+    user_data = await collection.find_one({"user_id": user_id}, _user_projection(chat_id))
     if user_data:
-        updates = {"last_active": time.time()}
-        if not isinstance(user_data.get("warnings"), dict):
-            updates["warnings"] = {}
-        if not isinstance(user_data.get("bans"), dict):
-            updates["bans"] = {}
-        if not isinstance(user_data.get("mutes"), dict):
-            updates["mutes"] = {}
-        if not isinstance(user_data.get("activity_count"), dict):
-            updates["activity_count"] = {}
-        if user_id == OWNER_BOT_ID and user_data.get("role_level", 0) != 7:
-            updates["role_level"] = 7
-        if chat_id and chat_id not in user_data.get("group_ids", []):
-            updates["group_ids"] = user_data.get("group_ids", []) + [chat_id]
-        user = User.from_dict(dict(user_data))
-        user = await initialize_user_fields(user, chat_id)
-        if updates:
-            await collection.update_one({"user_id": user_id}, {"$set": updates})
-            user_data = await collection.find_one({"user_id": user_id})
-            user = User.from_dict(dict(user_data))
-        logger.info(f"Найден пользователь: {user_id}, роль: {user.get_role_for_chat(chat_id)}, chat_id={chat_id}")
-        if user.is_banned_in_chat(chat_id) or user.is_muted_in_chat(chat_id):
-            await update_user(user_id, {
-                "bans": user.bans,
-                "mutes": user.mutes
-            })
+        user = User.from_dict(user_data)
+        _schedule_repairs_for(user_data, user, chat_id)
+        logger.debug(f"Найден пользователь: {user_id}, роль: {user.get_role_for_chat(chat_id)}, chat_id={chat_id}")
         return user
 
     if create_if_not_exists:
@@ -403,24 +555,49 @@ async def get_user(user_id: int, create_if_not_exists: bool = False, chat_id: Op
     raise ValueError(f"Пользователь с user_id {user_id} не найден")
 
 async def get_users_by_chat_id(chat_id: int) -> List[User]:
-    """Получает список пользователей, связанных с указанным chat_id."""
+    """
+    Получает список пользователей, связанных с указанным chat_id.
+
+    Состояние в чате читается из memberships (только строки этого чата), профили — из users
+    одним запросом по $in без карт warnings/bans/mutes/activity_count других чатов.
+    """
     if not isinstance(chat_id, int) or chat_id >= 0:
         logger.error(f"Недействительный chat_id: {chat_id}")
         raise ValueError("chat_id должен быть отрицательным целым числом")
+    from .migrations import is_applied
     collection = await get_user_collection()
+    if not is_applied("memberships_backfill"):
+        # Пока memberships заполняется в фоне, читаем старую схему
+        cursor = collection.find({
+            "$or": [
+                {"group_ids": chat_id},
+                {"server_owner_chat_ids": chat_id}
+            ]
+        }, _user_projection(chat_id))
+        users = [User.from_dict(user_data) async for user_data in cursor]
+        logger.info(f"Найдено {len(users)} пользователей для chat_id={chat_id} (схема users)")
+        return users
+    chat_members = {doc["user_id"]: doc for doc in await memberships.get_chat_memberships(chat_id)}
     cursor = collection.find({
         "$or": [
-            {"group_ids": chat_id},
+            {"user_id": {"$in": list(chat_members)}},
             {"server_owner_chat_ids": chat_id}
         ]
-    })
-    users = [User.from_dict(dict(user_data)) async for user_data in cursor]
-    for user in users:
-        if user.is_banned_in_chat(chat_id) or user.is_muted_in_chat(chat_id):
-            await update_user(user.user_id, {
-                "bans": user.bans,
-                "mutes": user.mutes
-            })
+    }, {"_id": 0, "warnings": 0, "bans": 0, "mutes": 0, "activity_count": 0})
+    chat_key = str(chat_id)
+    users = []
+    async for user_data in cursor:
+        user = User.from_dict(user_data)
+        membership = chat_members.get(user.user_id, {})
+        if "activity" in membership:
+            user.activity_count[chat_key] = membership["activity"]
+        if "warnings" in membership:
+            user.warnings[chat_key] = membership["warnings"]
+        if "mute" in membership:
+            user.mutes[chat_key] = membership["mute"]
+        if "ban" in membership:
+            user.bans[chat_key] = membership["ban"]
+        users.append(user)
     logger.info(f"Найдено {len(users)} пользователей для chat_id={chat_id}")
     return users
 
@@ -433,6 +610,16 @@ async def get_all_user_ids() -> List[int]:
     logger.info(f"Найдено {len(user_ids)} user_id в базе данных")
     return user_ids
 
+# Соответствие карт по chat_id в users полям документа memberships
+_MEMBERSHIP_FIELDS = {"activity_count": "activity", "warnings": "warnings", "bans": "ban", "mutes": "mute"}
+
+async def _mirror_chat_updates(user_id: int, updates: Dict) -> None:
+    """Дублирует в memberships изменения вида 'warnings.<chat_id>', переданные в update_user."""
+    for key, value in updates.items():
+        field, _, chat_key = key.partition(".")
+        if field in _MEMBERSHIP_FIELDS and chat_key:
+            await memberships.update_membership(int(chat_key), user_id, {"$set": {_MEMBERSHIP_FIELDS[field]: value}})
+
 async def update_user(user_id: int, updates: Dict) -> bool:
     """Обновляет информацию о пользователе."""
     if "role_level" in updates and updates["role_level"] not in ROLE_NAMES:
@@ -455,6 +642,7 @@ async def update_user(user_id: int, updates: Dict) -> bool:
 
     try:
         result = await collection.update_one({"user_id": user_id}, update_doc)
+        await _mirror_chat_updates(user_id, updates)
         if result.modified_count > 0:
             logger.info(f"Обновлен пользователь: {user_id}, обновления: {update_doc}")
             return True
@@ -471,23 +659,17 @@ async def increment_activity_count(user_id: int, chat_id: int) -> bool:
         raise ValueError("chat_id должен быть отрицательным целым числом")
     try:
         collection = await get_user_collection()
-        user = await collection.find_one({"user_id": user_id})
-        if not user:
-            logger.error(f"Пользователь {user_id} не найден для увеличения активности в chat_id={chat_id}")
-            return False
-        if user.get("is_bot", False):
-            logger.debug(f"Пропущено увеличение активности для бота: user_id={user_id}, chat_id={chat_id}")
-            return False
+        # Боты отсекаются фильтром, поэтому предварительное чтение документа не нужно
         result = await collection.update_one(
-            {"user_id": user_id},
+            {"user_id": user_id, "is_bot": {"$ne": True}},
             {
                 "$inc": {f"activity_count.{chat_id}": 1},
                 "$set": {"last_active": time.time()}
             }
         )
         if result.modified_count > 0:
-            updated_user = await get_user(user_id, chat_id=chat_id)
-            logger.info(f"Счетчик активности увеличен для user_id={user_id} в chat_id={chat_id}, новый счет: {updated_user.get_activity_count(chat_id)}")
+            memberships.add_activity(chat_id, user_id, 1)
+            logger.info(f"Счетчик активности увеличен для user_id={user_id} в chat_id={chat_id}")
             return True
         logger.warning(f"Не удалось увеличить счетчик активности для user_id={user_id} в chat_id={chat_id}")
         return False
@@ -505,10 +687,12 @@ async def reset_activity_count(user_id: int, chat_id: int) -> bool:
         result = await collection.update_one(
             {"user_id": user_id},
             {
-                "$set": {f"activity_count.{chat_id}": 0, "last_active": time.time()}
+                "$unset": {f"activity_count.{chat_id}": ""},
+                "$set": {"last_active": time.time()}
             }
         )
         if result.modified_count > 0:
+            await memberships.update_membership(chat_id, user_id, {"$unset": {"activity": ""}})
             logger.info(f"Счетчик активности сброшен для user_id={user_id} в chat_id={chat_id}")
             return True
         logger.warning(f"Не удалось сбросить счетчик активности для user_id={user_id} в chat_id={chat_id}")
@@ -541,6 +725,7 @@ async def add_warning(user_id: int, chat_id: int, reason: str, issued_by: int) -
             }
         )
         if result.modified_count > 0:
+            await memberships.update_membership(chat_id, user_id, {"$push": {"warnings": warning}})
             await log_moderation_action(user_id, chat_id, "warn", reason, issued_by)
             logger.info(f"Добавлено предупреждение пользователю {user_id} в chat_id={chat_id}, причина: {reason}, выдано: {issued_by}")
             return True
@@ -564,10 +749,12 @@ async def clear_warnings(user_id: int, chat_id: int, issued_by: int) -> bool:
         result = await collection.update_one(
             {"user_id": user_id},
             {
-                "$set": {f"warnings.{chat_id}": [], "last_active": time.time()}
+                "$unset": {f"warnings.{chat_id}": ""},
+                "$set": {"last_active": time.time()}
             }
         )
         if result.modified_count > 0:
+            await memberships.update_membership(chat_id, user_id, {"$unset": {"warnings": ""}})
             await log_moderation_action(user_id, chat_id, "clear_warnings", "Предупреждения очищены", issued_by)
             logger.info(f"Предупреждения очищены для пользователя {user_id} в chat_id={chat_id}, выдано: {issued_by}")
             return True
@@ -602,6 +789,7 @@ async def ban_user(user_id: int, chat_id: int, reason: str, issued_by: int, dura
             }
         )
         if result.modified_count > 0:
+            await memberships.update_membership(chat_id, user_id, {"$set": {"ban": ban_info}})
             await log_moderation_action(user_id, chat_id, "ban", reason, issued_by, duration=duration, until_date=ban_info["until"])
             logger.info(f"Пользователь {user_id} забанен в chat_id={chat_id}, причина: {reason}, выдано: {issued_by}")
             return True
@@ -622,20 +810,15 @@ async def unban_user(user_id: int, chat_id: int, issued_by: int) -> bool:
         if not user:
             logger.error(f"Пользователь {user_id} не найден для разбана в chat_id={chat_id}")
             return False
-        ban_info = {
-            "is_banned": False,
-            "reason": "",
-            "issued_by": 0,
-            "issued_at": 0.0,
-            "until": 0.0
-        }
         result = await collection.update_one(
             {"user_id": user_id},
             {
-                "$set": {f"bans.{chat_id}": ban_info, "last_active": time.time()}
+                "$unset": {f"bans.{chat_id}": ""},
+                "$set": {"last_active": time.time()}
             }
         )
         if result.modified_count > 0:
+            await memberships.update_membership(chat_id, user_id, {"$unset": {"ban": ""}})
             await log_moderation_action(user_id, chat_id, "unban", "Бан снят", issued_by)
             logger.info(f"Пользователь {user_id} разбанен в chat_id={chat_id}")
             return True
@@ -670,6 +853,7 @@ async def mute_user(user_id: int, chat_id: int, duration: float, reason: str, is
             }
         )
         if result.modified_count > 0:
+            await memberships.update_membership(chat_id, user_id, {"$set": {"mute": mute_info}})
             await log_moderation_action(user_id, chat_id, "mute", reason, issued_by, duration=duration, until_date=mute_info["until"])
             logger.info(f"Пользователь {user_id} замучен в chat_id={chat_id} до {mute_info['until']}, причина: {reason}, выдано: {issued_by}")
             return True
@@ -690,20 +874,15 @@ async def unmute_user(user_id: int, chat_id: int, issued_by: int) -> bool:
         if not user:
             logger.error(f"Пользователь {user_id} не найден для снятия мута в chat_id={chat_id}")
             return False
-        mute_info = {
-            "is_muted": False,
-            "until": 0.0,
-            "reason": "",
-            "issued_by": 0,
-            "issued_at": 0.0
-        }
         result = await collection.update_one(
             {"user_id": user_id},
             {
-                "$set": {f"mutes.{chat_id}": mute_info, "last_active": time.time()}
+                "$unset": {f"mutes.{chat_id}": ""},
+                "$set": {"last_active": time.time()}
             }
         )
         if result.modified_count > 0:
+            await memberships.update_membership(chat_id, user_id, {"$unset": {"mute": ""}})
             await log_moderation_action(user_id, chat_id, "unmute", "Мут снят", issued_by)
             logger.info(f"Мут снят с пользователя {user_id} в chat_id={chat_id}")
             return True
@@ -726,47 +905,270 @@ async def kick_user(user_id: int, chat_id: int, reason: str, issued_by: int) ->
         logger.error(f"Ошибка при логировании исключения пользователя {user_id} в chat_id={chat_id}: {str(e)}")
         return False
 
+async def bulk_kick_users(chat_id: int, user_ids: List[int], reason: str, issued_by: int) -> int:
+    """
+    Отмечает исключение нескольких пользователей из чата пакетно: один update_many в users,
+    один в memberships и один insert_many в moderation_logs.
+
+    Возвращает:
+        int: Количество обработанных пользователей.
+    """
+    if not isinstance(chat_id, int) or chat_id >= 0:
+        logger.error(f"Недействительный chat_id: {chat_id}")
+        raise ValueError("chat_id должен быть отрицательным целым числом")
+    if not user_ids:
+        return 0
+    collection = await get_user_collection()
+    await collection.update_many(
+        {"user_id": {"$in": user_ids}},
+        {
+            "$pull": {"group_ids": chat_id},
+            "$unset": {
+                f"warnings.{chat_id}": "",
+                f"mutes.{chat_id}": "",
+                f"bans.{chat_id}": ""
+            }
+        }
+    )
+    await memberships.leave_chat_many(chat_id, user_ids)
+    now = time.time()
+    created_at = datetime.fromtimestamp(now, timezone.utc)
+    logs_collection = await get_moderation_logs_collection()
+    await logs_collection.insert_many([
+        {
+            "user_id": user_id,
+            "chat_id": chat_id,
+            "action": "kick",
+            "reason": reason,
+            "issued_by": issued_by,
+            "issued_at": now,
+            "created_at": created_at,
+            "duration": None,
+            "until_date": None
+        }
+        for user_id in user_ids
+    ], ordered=False)
+    await moderation_stats_cache.delete(chat_id)
+    logger.info(f"Пакетно исключено пользователей из chat_id={chat_id}: {len(user_ids)}, причина: {reason}")
+    return len(user_ids)
+
+# Буфер записей moderation_logs (write-behind): записи пишутся пакетами insert_many
+MODERATION_LOGS_FLUSH_INTERVAL = float(os.getenv("MODERATION_LOGS_FLUSH_INTERVAL", "2"))
+MODERATION_LOGS_BATCH_SIZE = int(os.getenv("MODERATION_LOGS_BATCH_SIZE", "500"))
+# Предел буфера, если MongoDB долго недоступна: старые записи отбрасываются
+MODERATION_LOGS_MAX_PENDING = 50_000
+_pending_moderation_logs: List[Dict] = []
+_moderation_logs_task: Optional[asyncio.Task] = None
+_moderation_logs_full: Optional[asyncio.Event] = None
+# Признак остановки: фоновая задача делает последнюю запись и завершается сама
+_moderation_logs_stopping = False
+
 async def log_moderation_action(user_id: int, chat_id: int, action: str, reason: str, issued_by: int, duration: float = None, until_date: float = None) -> bool:
-    """Логирует действие модерации в коллекцию moderation_logs."""
+    """
+    Логирует действие модерации в коллекцию moderation_logs.
+
+    Запись ставится в буфер и пишется фоновой задачей пакетом insert_many (по времени или при
+    заполнении MODERATION_LOGS_BATCH_SIZE); при остановке бота буфер сбрасывается.
+    """
     if not isinstance(chat_id, int) or chat_id >= 0:
         logger.error(f"Недействительный chat_id: {chat_id}")
         raise ValueError("chat_id должен быть отрицательным целым числом")
     if action not in VALID_MODERATION_ACTIONS:
         logger.error(f"Недействительное действие модерации: {action}")
         raise ValueError(f"Действие модерации должно быть одним из: {VALID_MODERATION_ACTIONS}")
+    _pending_moderation_logs.append({
+        "user_id": user_id,
+        "chat_id": chat_id,
+        "action": action,
+        "reason": reason,
+        "issued_by": issued_by,
+        "issued_at": time.time(),
+        "created_at": datetime.now(timezone.utc),  # Дата для TTL-индекса
+        "duration": duration,
+        "until_date": until_date
+    })
+    if len(_pending_moderation_logs) > MODERATION_LOGS_MAX_PENDING:
+        del _pending_moderation_logs[:len(_pending_moderation_logs) - MODERATION_LOGS_MAX_PENDING]
+        logger.warning(f"Буфер moderation_logs переполнен, старые записи отброшены (предел {MODERATION_LOGS_MAX_PENDING})")
+    if len(_pending_moderation_logs) >= MODERATION_LOGS_BATCH_SIZE and _moderation_logs_full is not None:
+        _moderation_logs_full.set()
+    # Все действия модерации проходят через журнал, поэтому статистика чата сбрасывается здесь
+    await moderation_stats_cache.delete(chat_id)
+    logger.info(f"Лог модерации поставлен в очередь для user_id={user_id}, chat_id={chat_id}, action={action}")
+    return True
+
+async def flush_moderation_logs() -> int:
+    """
+    Записывает буфер moderation_logs одним insert_many.
+
+    При ошибке или отмене записи возвращаются в начало буфера и будут записаны повторно.
+    _id назначается драйвером при первой попытке, поэтому уже вставленные записи при повторе
+    отклоняются как дубликаты и не задваиваются.
+
+    Возвращает:
+        int: Количество записанных записей.
+    """
+    if not _pending_moderation_logs:
+        return 0
+    entries = _pending_moderation_logs[:]
+    _pending_moderation_logs.clear()
     try:
         collection = await get_moderation_logs_collection()
-        log_entry = {
-            "user_id": user_id,
-            "chat_id": chat_id,
-            "action": action,
-            "reason": reason,
-            "issued_by": issued_by,
-            "issued_at": time.time(),
-            "duration": duration,
-            "until_date": until_date
-        }
-        result = await collection.insert_one(log_entry)
-        logger.info(f"Лог модерации создан для user_id={user_id}, chat_id={chat_id}, action={action}, id={result.inserted_id}")
-        return True
+        await collection.insert_many(entries, ordered=False)
+        logger.debug(f"Записано логов модерации: {len(entries)}")
+        return len(entries)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        failed = [entries[error["index"]] for error in errors if error.get("code") != 11000]
+        _pending_moderation_logs[:0] = failed
+        if failed:
+            logger.error(f"Не удалось записать логов модерации: {len(failed)}, повтор при следующей записи")
+        return len(entries) - len(errors)
     except Exception as e:
-        logger.error(f"Ошибка при логировании действия {action} для user_id={user_id}, chat_id={chat_id}: {str(e)}")
-        return False
+        _pending_moderation_logs[:0] = entries
+        logger.error(f"Ошибка при записи логов модерации ({len(entries)}), повтор при следующей записи: {str(e)}")
+        return 0
+    except BaseException:
+        # Отмена во время insert_many: результат неизвестен, записи остаются в буфере
+        _pending_moderation_logs[:0] = entries
+        raise
 
-async def get_moderation_logs(chat_id: int, limit: int = 10) -> List[Dict]:
-    """Получает последние логи модерации для указанного чата."""
+async def _moderation_logs_loop() -> None:
+    while True:
+        try:
+            await asyncio.wait_for(_moderation_logs_full.wait(), timeout=MODERATION_LOGS_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _moderation_logs_full.clear()
+        await flush_moderation_logs()
+        if _moderation_logs_stopping:
+            return
+
+def start_moderation_logs() -> None:
+    """Запускает фоновую запись буфера moderation_logs."""
+    global _moderation_logs_task, _moderation_logs_full, _moderation_logs_stopping
+    if _moderation_logs_task is None or _moderation_logs_task.done():
+        _moderation_logs_stopping = False
+        _moderation_logs_full = asyncio.Event()
+        _moderation_logs_task = asyncio.create_task(_moderation_logs_loop())
+
+async def stop_moderation_logs() -> None:
+    """
+    Останавливает фоновую запись и сбрасывает оставшиеся записи moderation_logs.
+    Задача не отменяется, а будится и завершается после своей последней записи,
+    чтобы не прервать insert_many на середине.
+    """
+    global _moderation_logs_task, _moderation_logs_full, _moderation_logs_stopping
+    if _moderation_logs_task is not None:
+        _moderation_logs_stopping = True
+        _moderation_logs_full.set()
+        try:
+            await _moderation_logs_task
+        except Exception as e:
+            logger.error(f"Ошибка фоновой записи moderation_logs при остановке: {str(e)}")
+        _moderation_logs_task = None
+        _moderation_logs_full = None
+    await flush_moderation_logs()
+    if _pending_moderation_logs:
+        logger.error(f"При остановке не удалось записать логов модерации: {len(_pending_moderation_logs)}")
+
+async def get_moderation_stats(chat_id: int) -> Dict:
+    """
+    Получает статистику модерации чата одной агрегацией в MongoDB.
+
+    Результат кэшируется на MODERATION_STATS_TTL секунд; кэш чата сбрасывается при каждом
+    действии модерации (log_moderation_action).
+
+    Возвращает:
+        Dict: Словарь со статистикой (warnings, mutes, bans, users).
+    """
+    if not isinstance(chat_id, int) or chat_id >= 0:
+        logger.error(f"Недействительный chat_id: {chat_id}")
+        raise ValueError("chat_id должен быть отрицательным целым числом")
+    stats = await moderation_stats_cache.get(chat_id)
+    if stats is not None:
+        return dict(stats)
+    from .migrations import is_applied
+    now = time.time()
+    if is_applied("memberships_backfill"):
+        collection = await memberships.get_memberships_collection()
+        pipeline = memberships.stats_pipeline(chat_id, now)
+    else:
+        collection = await get_user_collection()
+        pipeline = memberships.users_stats_pipeline(chat_id, now)
+    result = await collection.aggregate(pipeline).to_list(length=1)
+    stats = {"warnings": 0, "mutes": 0, "bans": 0, "users": 0}
+    if result:
+        stats.update({key: result[0][key] for key in stats})
+    await moderation_stats_cache.set(chat_id, stats)
+    return dict(stats)
+
+async def get_moderation_logs_page(chat_id: int, limit: int = 10, cursor: Optional[ObjectId] = None,
+                                   direction: str = "older", action: Optional[str] = None,
+                                   user_id: Optional[int] = None) -> Tuple[List[Dict], bool, bool]:
+    """
+    Получает страницу логов модерации чата с пагинацией по ключу (issued_at, _id).
+
+    Страница читается диапазоном по индексу (chat_id[, action | user_id], issued_at, _id) от записи
+    cursor без skip, поэтому стоимость не зависит от глубины листания.
+
+    Args:
+        chat_id: ID чата.
+        limit: Размер страницы.
+        cursor: _id записи, от которой листать (None — последние записи).
+        direction: 'older' — записи старше cursor, 'newer' — новее.
+        action: Фильтр по типу действия.
+        user_id: Фильтр по пользователю, к которому применено действие.
+
+    Возвращает:
+        Tuple[List[Dict], bool, bool]: Записи (новые первыми) и признаки, есть ли записи старше и новее
+        страницы. Если запись-курсор уже удалена, возвращается первая страница и записей новее нет.
+    """
     if not isinstance(chat_id, int) or chat_id >= 0:
         logger.error(f"Недействительный chat_id: {chat_id}")
         raise ValueError("chat_id должен быть отрицательным целым числом")
     try:
+        # Записи из буфера должны попасть в выборку сразу после действия
+        await flush_moderation_logs()
         collection = await get_moderation_logs_collection()
-        cursor = collection.find({"chat_id": chat_id}).sort("issued_at", -1).limit(limit)
-        logs = [log async for log in cursor]
-        logger.info(f"Получено {len(logs)} логов модерации для chat_id={chat_id}")
-        return logs
+        query: Dict[str, Any] = {"chat_id": chat_id}
+        if action:
+            query["action"] = action
+        if user_id:
+            query["user_id"] = user_id
+        anchor = None
+        first_page = True
+        if cursor is not None:
+            anchor = await collection.find_one({"_id": cursor, "chat_id": chat_id}, {"_id": 1, "issued_at": 1})
+        if anchor is None:
+            # Первая страница или запись-курсор уже удалена по сроку хранения
+            direction = "older"
+        else:
+            first_page = False
+            strict, inclusive = ("$lt", "$lte") if direction == "older" else ("$gt", "$gte")
+            # Граница по issued_at задает диапазон индекса, условие по _id различает записи с одним issued_at
+            query["issued_at"] = {inclusive: anchor["issued_at"]}
+            query["$or"] = [{"issued_at": {strict: anchor["issued_at"]}}, {"_id": {strict: anchor["_id"]}}]
+        order = -1 if direction == "older" else 1
+        found = collection.find(query).sort([("issued_at", order), ("_id", order)]).limit(limit + 1)
+        logs = [log async for log in found]
+        has_more = len(logs) > limit
+        logs = logs[:limit]
+        if direction == "newer":
+            logs.reverse()
+            has_older, has_newer = True, has_more
+        else:
+            has_older, has_newer = has_more, not first_page
+        logger.info(f"Получено {len(logs)} логов модерации для chat_id={chat_id} (action={action}, user_id={user_id})")
+        return logs, has_older, has_newer
     except Exception as e:
         logger.error(f"Ошибка при получении логов модерации для chat_id={chat_id}: {str(e)}")
-        return []
+        return [], False, False
+
+async def get_moderation_logs(chat_id: int, limit: int = 10) -> List[Dict]:
+    """Получает последние логи модерации для указанного чата."""
+    logs, _, _ = await get_moderation_logs_page(chat_id, limit)
+    return logs
 
 async def set_server_owner(user_id: int, chat_id: int) -> bool:
     """Назначает пользователя владельцем сервера для указанного чата."""
@@ -822,34 +1224,69 @@ async def register_chat_member(user_id: int, username: str, display_name: str, c
     if not isinstance(chat_id, int) or chat_id >= 0:
         logger.error(f"Недействительный chat_id: {chat_id}")
         raise ValueError("chat_id должен быть отрицательным целым числом")
-    try:
-        user = await get_user(user_id, create_if_not_exists=False, chat_id=chat_id)
-        updates = {
-            "username": username,
-            "display_name": display_name,
-            "is_bot": is_bot,
-            "group_ids": user.group_ids + [chat_id] if chat_id not in user.group_ids else user.group_ids
+    user = await get_message_context(user_id, chat_id, username, display_name, is_bot, count_activity=False)
+    logger.info(f"Зарегистрирован пользователь {user_id} для chat_id={chat_id}, is_bot={is_bot}")
+    return user
+
+async def bulk_register_chat_members(chat_id: int, members: List[Tuple[int, Optional[str], Optional[str], bool]]) -> int:
+    """
+    Регистрирует участников чата одним bulk_write (upsert) в users и memberships.
+
+    В отличие от register_chat_member, last_active не обновляется: синхронизация участников
+    не является активностью пользователя.
+
+    Args:
+        chat_id: ID чата.
+        members: Список (user_id, username, display_name, is_bot).
+
+    Возвращает:
+        int: Количество новых пользователей.
+    """
+    if not isinstance(chat_id, int) or chat_id >= 0:
+        logger.error(f"Недействительный chat_id: {chat_id}")
+        raise ValueError("chat_id должен быть отрицательным целым числом")
+    if not members:
+        return 0
+    now = time.time()
+    user_operations = []
+    membership_operations = []
+    for user_id, username, display_name, is_bot in members:
+        profile = {"username": username, "display_name": display_name, "is_bot": is_bot}
+        on_insert = {
+            "id": ObjectId(), "channel_ids": [], "server_owner_chat_ids": [], "is_premium": False,
+            "created_at": now, "last_active": now, "minutes_active": 0, "is_banned": False,
+            "warnings": {}, "bans": {}, "mutes": {}, "activity_count": {}, "schema_version": USER_SCHEMA_VERSION
         }
-        await update_user(user_id, updates)
-        logger.info(f"Обновлен пользователь {user_id} для chat_id={chat_id}, is_bot={is_bot}")
-        return await get_user(user_id, chat_id=chat_id)
-    except ValueError:
-        role_level = 7 if user_id == OWNER_BOT_ID else 0
-        user = User(
-            user_id=user_id,
-            username=username,
-            display_name=display_name,
-            group_ids=[chat_id],
-            role_level=role_level,
-            is_bot=is_bot
-        )
-        return await create_user(user, chat_id=chat_id)
+        if user_id == OWNER_BOT_ID:
+            profile["role_level"] = 7
+        else:
+            on_insert["role_level"] = 0
+        user_operations.append(UpdateOne(
+            {"user_id": user_id},
+            {"$set": profile, "$addToSet": {"group_ids": chat_id}, "$setOnInsert": on_insert},
+            upsert=True
+        ))
+        membership_operations.append(UpdateOne(
+            {"chat_id": chat_id, "user_id": user_id},
+            {
+                "$set": {"username": username, "display_name": display_name, "is_bot": is_bot, "in_chat": True},
+                "$setOnInsert": {"joined_at": now, "last_active": now}
+            },
+            upsert=True
+        ))
+    collection = await get_user_collection()
+    result = await collection.bulk_write(user_operations, ordered=False)
+    memberships_collection = await memberships.get_memberships_collection()
+    await memberships_collection.bulk_write(membership_operations, ordered=False)
+    logger.info(f"Пакетная регистрация в chat_id={chat_id}: участников {len(members)}, новых {result.upserted_count}")
+    return result.upserted_count
 
 async def delete_user(user_id: int) -> bool:
     """Удаляет пользователя из базы данных."""
     try:
         collection = await get_user_collection()
         result = await collection.delete_one({"user_id": user_id})
+        await memberships.delete_user_memberships(user_id)
         if result.deleted_count > 0:
             logger.info(f"Удален пользователь: {user_id}")
             return True
@@ -860,7 +1297,7 @@ async def delete_user(user_id: int) -> bool:
         return False
 
 async def save_chat(chat_id: int, chat_title: str = None) -> bool:
-    """Сохраняет chat_id в коллекцию chats."""
+    """Сохраняет chat_id в коллекцию chats (O(1), без изменения документов пользователей)."""
     if not isinstance(chat_id, int) or chat_id >= 0:
         logger.error(f"Недействительный chat_id: {chat_id}")
         raise ValueError("chat_id должен быть отрицательным целым числом")
@@ -871,20 +1308,10 @@ async def save_chat(chat_id: int, chat_title: str = None) -> bool:
             {"$set": {"chat_title": chat_title, "last_updated": time.time()}},
             upsert=True
         )
-        if result.modified_count > 0 or result.upserted_id:
-            logger.info(f"Сохранен чат: chat_id={chat_id}, chat_title={chat_title}")
-            await collection.database.users.update_many(
-                {},
-                {
-                    "$set": {
-                        f"activity_count.{chat_id}": 0,
-                        f"warnings.{chat_id}": [],
-                        f"bans.{chat_id}": {"is_banned": False, "reason": "", "issued_by": 0, "issued_at": 0.0, "until": 0.0},
-                        f"mutes.{chat_id}": {"is_muted": False, "until": 0.0, "reason": "", "issued_by": 0, "issued_at": 0.0}
-                    }
-                }
-            )
-            logger.info(f"Инициализированы данные для всех пользователей в chat_id={chat_id}")
+        if result.upserted_id:
+            # Данные пользователей для нового чата не создаются: отсутствующий ключ чата означает значения по умолчанию
+            await get_known_chats.cache.clear()
+            logger.info(f"Сохранен новый чат: chat_id={chat_id}, chat_title={chat_title}")
             return True
         logger.debug(f"Чат уже существует: chat_id={chat_id}")
         return True
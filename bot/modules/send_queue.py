@@ -0,0 +1,248 @@
+# Путь файла: bot/modules/send_queue.py
+
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+from loguru import logger
+
+# Лимиты Bot API: ~30 сообщений в секунду на бота, ~20 сообщений в минуту в одну группу, ~1 в секунду в личный чат
+GLOBAL_RATE = float(os.getenv("SEND_QUEUE_GLOBAL_RATE", "30"))
+GROUP_RATE = float(os.getenv("SEND_QUEUE_GROUP_RATE_PER_MINUTE", "20")) / 60
+PRIVATE_RATE = float(os.getenv("SEND_QUEUE_PRIVATE_RATE", "1"))
+# Максимум задач в очереди одного чата; лишние сообщения отбрасываются, действия (мут, бан, удаление) — нет
+SEND_QUEUE_CHAT_LIMIT = int(os.getenv("SEND_QUEUE_CHAT_LIMIT", "100"))
+SEND_QUEUE_MAX_RETRIES = 3
+# Сколько секунд простаивает обработчик очереди чата перед завершением
+WORKER_IDLE_TIMEOUT = 30
+
+class TokenBucket:
+    """Простое ведро токенов: rate токенов в секунду, не больше capacity."""
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Забирает токен и возвращает, сколько секунд нужно подождать до его появления."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+class _Job:
+    __slots__ = ("func", "args", "kwargs", "kind", "fallback", "future")
+
+    def __init__(self, func, args, kwargs, kind, fallback, future):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.kind = kind
+        self.fallback = fallback
+        self.future = future
+
+_global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_RATE)
+_global_lock = asyncio.Lock()
+_global_paused_until = 0.0
+# Очереди и обработчики по (чат, полоса); chat_id None — запросы без привязки к чату.
+# У каждого чата две полосы: "message" (ответы, под лимитом чата) и "action" (удаление, мут, бан),
+# чтобы действия модерации не ждали за ответами, задержанными лимитом отправки в чат
+_queues: Dict[Tuple[Optional[int], str], asyncio.Queue] = {}
+_workers: Dict[Tuple[Optional[int], str], asyncio.Task] = {}
+_chat_buckets: Dict[Optional[int], TokenBucket] = {}
+
+def set_global_rate(rate: float) -> None:
+    """Задает глобальный лимит отправки (например, долю общего лимита для одного из рабочих процессов)."""
+    global GLOBAL_RATE, _global_bucket
+    GLOBAL_RATE = rate
+    _global_bucket = TokenBucket(rate, max(rate, 1))
+
+def _chat_bucket(chat_id: Optional[int]) -> Optional[TokenBucket]:
+    if chat_id is None:
+        return None
+    bucket = _chat_buckets.get(chat_id)
+    if bucket is None:
+        rate = GROUP_RATE if chat_id < 0 else PRIVATE_RATE
+        # Небольшой запас для коротких всплесков
+        bucket = _chat_buckets[chat_id] = TokenBucket(rate, 3)
+    return bucket
+
+async def _wait_global() -> None:
+    async with _global_lock:
+        delay = max(_global_bucket.reserve(), _global_paused_until - time.monotonic())
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+async def _execute(chat_id: Optional[int], job: _Job) -> Any:
+    """Выполняет запрос с учетом лимитов; TelegramRetryAfter обрабатывается здесь, а не в обработчиках."""
+    global _global_paused_until
+    last_error: Optional[TelegramRetryAfter] = None
+    for attempt in range(SEND_QUEUE_MAX_RETRIES):
+        if job.kind == "message":
+            bucket = _chat_bucket(chat_id)
+            if bucket is not None:
+                delay = bucket.reserve()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+        await _wait_global()
+        try:
+            return await job.func(*job.args, **job.kwargs)
+        except TelegramRetryAfter as e:
+            last_error = e
+            logger.warning(f"TooManyRequests для chat_id={chat_id}: повтор через {e.retry_after} секунд, попытка {attempt + 1}/{SEND_QUEUE_MAX_RETRIES}")
+            if chat_id is None:
+                _global_paused_until = max(_global_paused_until, time.monotonic() + e.retry_after)
+            else:
+                # Ожидание блокирует только очередь этого чата
+                await asyncio.sleep(e.retry_after)
+        except TelegramBadRequest as e:
+            if job.fallback is not None and "message to be replied to is not found" in str(e):
+                logger.warning(f"Сообщение для ответа не найдено в chat_id={chat_id}, отправка без ответа")
+                job.func, job.args, job.kwargs, job.fallback = job.fallback[0], job.fallback[1], job.fallback[2], None
+                continue
+            raise
+    logger.error(f"Достигнуто максимальное количество попыток ({SEND_QUEUE_MAX_RETRIES}) для chat_id={chat_id}")
+    raise last_error
+
+def _lane(kind: str) -> str:
+    return "action" if kind == "action" else "message"
+
+async def _worker(key: Tuple[Optional[int], str]) -> None:
+    chat_id, lane = key
+    queue = _queues[key]
+    try:
+        while True:
+            try:
+                job = await asyncio.wait_for(queue.get(), timeout=WORKER_IDLE_TIMEOUT)
+            except asyncio.TimeoutError:
+                if queue.empty():
+                    break
+                continue
+            try:
+                result = await _execute(chat_id, job)
+                if not job.future.done():
+                    job.future.set_result(result)
+            except Exception as e:
+                name = getattr(job.func, "__name__", str(job.func))
+                logger.error(f"Ошибка при выполнении {name} для chat_id={chat_id}: {str(e)}")
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                queue.task_done()
+    finally:
+        _workers.pop(key, None)
+        if queue.empty():
+            _queues.pop(key, None)
+            if lane == "message":
+                _chat_buckets.pop(chat_id, None)
+
+def enqueue(chat_id: Optional[int], func: Callable[..., Awaitable[Any]], *args, kind: str = "message",
+            fallback: Optional[Tuple[Callable[..., Awaitable[Any]], tuple, dict]] = None, **kwargs) -> asyncio.Future:
+    """
+    Ставит запрос к Telegram в очередь чата и сразу возвращает Future с результатом.
+
+    Запросы одного чата выполняются по порядку; сообщения ограничиваются лимитом чата
+    и глобальным лимитом бота, действия (kind='action': удаление, мут, бан) — только глобальным
+    и идут отдельной очередью чата, не дожидаясь отправки ответов.
+    Ошибки логируются в очереди; если результат не нужен, Future можно не ожидать.
+
+    Args:
+        chat_id: ID чата (None — запрос без лимита чата).
+        func: Метод бота или сообщения, например message.reply.
+        kind: 'message' или 'action'.
+        fallback: (func, args, kwargs) — запасной вызов, если исходное сообщение для ответа удалено.
+
+    Возвращает:
+        asyncio.Future: Результат вызова.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    # Исключение из неожидаемого Future не должно попадать в лог как "never retrieved"
+    future.add_done_callback(lambda f: f.cancelled() or f.exception())
+    key = (chat_id, _lane(kind))
+    queue = _queues.get(key)
+    if queue is None:
+        queue = _queues[key] = asyncio.Queue()
+    if kind == "message" and queue.qsize() >= SEND_QUEUE_CHAT_LIMIT:
+        logger.warning(f"Очередь отправки chat_id={chat_id} переполнена, сообщение отброшено")
+        future.set_result(None)
+        return future
+    queue.put_nowait(_Job(func, args, kwargs, kind, fallback, future))
+    if key not in _workers:
+        _workers[key] = asyncio.create_task(_worker(key))
+    return future
+
+def enqueue_reply(bot: Bot, chat_id: int, message: Optional[Message], text: str, **kwargs) -> asyncio.Future:
+    """Ставит в очередь ответ на сообщение; если сообщения нет или оно удалено, текст отправляется в чат."""
+    if message is None:
+        return enqueue(chat_id, bot.send_message, chat_id, text, **kwargs)
+    return enqueue(chat_id, message.reply, text, fallback=(bot.send_message, (chat_id, text), kwargs), **kwargs)
+
+def _chat_of(func: Callable[..., Awaitable[Any]], args: tuple, kwargs: dict) -> Optional[int]:
+    """
+    Определяет чат запроса: чат сообщения, у которого вызывается метод (message.reply,
+    message.edit_text), или аргумент chat_id метода бота (именованный или первый позиционный).
+    """
+    chat = getattr(getattr(func, "__self__", None), "chat", None)
+    if chat is not None:
+        return getattr(chat, "id", None)
+    value = kwargs.get("chat_id", args[0] if args else None)
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def enqueue_call(func: Callable[..., Awaitable[Any]], *args, **kwargs) -> asyncio.Future:
+    """
+    Ставит запрос в очередь его чата (см. _chat_of) и сразу возвращает Future.
+
+    Для ответов и правок меню, результат которых обработчику не нужен: ожидание после RetryAfter
+    идет в очереди чата, а не в обработчике, который держит очередь обновлений чата.
+    """
+    return enqueue(_chat_of(func, args, kwargs), func, *args, **kwargs)
+
+async def call(func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+    """
+    Выполняет запрос сразу в текущей задаче с учетом глобального лимита.
+
+    Используется там, где нужен результат, — в фоновых задачах (синхронизация участников,
+    исключение неактивных): после RetryAfter ждет текущая задача. Обработчикам обновлений
+    для ответов следует использовать enqueue_call или enqueue_reply. Если чат запроса
+    известен (см. _chat_of), ожидание не затрагивает другие чаты; общая пауза бота
+    выставляется лишь для запросов без чата.
+    """
+    loop = asyncio.get_running_loop()
+    chat_id = _chat_of(func, args, kwargs)
+    return await _execute(chat_id, _Job(func, args, kwargs, "action", None, loop.create_future()))
+
+def pending() -> int:
+    """Возвращает количество запросов, ожидающих отправки."""
+    return sum(queue.qsize() for queue in _queues.values())
+
+async def drain(timeout: float = 10) -> None:
+    """Дожидается отправки очереди при остановке бота, затем отменяет оставшиеся задачи."""
+    queues = list(_queues.values())
+    if queues:
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in queues)), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Очередь отправки не опустела за {timeout} сек, осталось запросов: {pending()}")
+    global _global_lock
+    workers = list(_workers.values())
+    for task in workers:
+        task.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+    _workers.clear()
+    _queues.clear()
+    _chat_buckets.clear()
+    # Блокировка привязывается к циклу событий; после остановки создается заново
+    _global_lock = asyncio.Lock()
@@ -0,0 +1,166 @@
+# Путь файла: bot/modules/sharding.py
+
+import asyncio
+import multiprocessing
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+from loguru import logger
+
+# Количество рабочих процессов; 1 — обычный режим в одном процессе
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
+# Сколько обновлений может ждать в очереди одного рабочего процесса
+SHARD_QUEUE_SIZE = int(os.getenv("SHARD_QUEUE_SIZE", "10000"))
+# Сколько обновлений рабочий процесс обрабатывает одновременно (порядок внутри чата
+# сохраняет ChatSerializerMiddleware)
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "50"))
+
+# Номер текущего рабочего процесса и их общее количество (задаются в рабочем процессе)
+WORKER_INDEX: Optional[int] = None
+WORKER_COUNT = 1
+
+# Типы обновлений, у которых чат лежит в поле chat
+_CHAT_UPDATES = ("message", "edited_message", "channel_post", "edited_channel_post", "my_chat_member",
+                 "chat_member", "chat_join_request", "message_reaction", "message_reaction_count", "chat_boost",
+                 "removed_chat_boost")
+
+def extract_chat_id(update: Dict[str, Any]) -> Optional[int]:
+    """Возвращает chat_id обновления (сырой JSON от Telegram) или None, если чата нет."""
+    for key in _CHAT_UPDATES:
+        payload = update.get(key)
+        if payload:
+            chat = payload.get("chat")
+            return chat.get("id") if chat else None
+    callback = update.get("callback_query")
+    if callback and callback.get("message"):
+        return callback["message"]["chat"]["id"]
+    return None
+
+def shard_for(chat_id: Optional[int], workers: int) -> int:
+    """Номер рабочего процесса для чата; обновления без чата идут в процесс 0."""
+    if chat_id is None or workers <= 1:
+        return 0
+    return chat_id % workers
+
+def set_worker(index: int, count: int) -> None:
+    """Отмечает текущий процесс как рабочий процесс index из count."""
+    global WORKER_INDEX, WORKER_COUNT
+    WORKER_INDEX = index
+    WORKER_COUNT = count
+
+def owns_chat(chat_id: int) -> bool:
+    """Проверяет, обрабатывает ли текущий процесс указанный чат (в обычном режиме — всегда)."""
+    return WORKER_INDEX is None or shard_for(chat_id, WORKER_COUNT) == WORKER_INDEX
+
+class ShardRouter:
+    """
+    Распределяет сырые обновления по рабочим процессам по chat_id.
+
+    У каждого процесса своя очередь multiprocessing; обновления одного чата всегда попадают
+    в одну очередь и читаются из нее по порядку, поэтому порядок внутри чата сохраняется,
+    а состояние чата (счетчики флуда, кэш настроек) остается в памяти одного процесса.
+    """
+
+    def __init__(self, workers: int, queue_size: int = SHARD_QUEUE_SIZE):
+        self.workers = workers
+        self._context = multiprocessing.get_context("spawn")
+        self.queues = [self._context.Queue(maxsize=queue_size) for _ in range(workers)]
+        self.processes: List[multiprocessing.Process] = []
+        self.dispatched = [0] * workers
+
+    def start(self, target: Callable[..., None], *args: Any) -> None:
+        """Запускает рабочие процессы: target(index, queue, workers, *args)."""
+        for index, queue in enumerate(self.queues):
+            process = self._context.Process(
+                target=target, args=(index, queue, self.workers, *args), name=f"bot-worker-{index}", daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+        logger.info(f"Запущено рабочих процессов: {self.workers}")
+
+    def dispatch(self, update: Dict[str, Any]) -> int:
+        """Ставит обновление в очередь его рабочего процесса и возвращает номер процесса."""
+        index = shard_for(extract_chat_id(update), self.workers)
+        self.queues[index].put(update)
+        self.dispatched[index] += 1
+        return index
+
+    async def dispatch_async(self, update: Dict[str, Any]) -> int:
+        """То же, что dispatch, но не блокирует цикл событий, если очередь процесса заполнена."""
+        index = shard_for(extract_chat_id(update), self.workers)
+        queue = self.queues[index]
+        try:
+            queue.put_nowait(update)
+        except Exception:
+            # Очередь заполнена: ждем в пуле потоков, создавая обратное давление на прием обновлений
+            await asyncio.get_running_loop().run_in_executor(None, queue.put, update)
+        self.dispatched[index] += 1
+        return index
+
+    def stop(self, timeout: float = 30) -> None:
+        """Отправляет процессам сигнал остановки и дожидается, пока они дообработают очереди."""
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"Рабочий процесс {process.name} не завершился за {timeout} сек, принудительная остановка")
+                process.terminate()
+        logger.info(f"Рабочие процессы остановлены, распределено обновлений: {self.dispatched}")
+
+class ForwardingMiddleware(BaseMiddleware):
+    """
+    Внешний middleware обновлений во фронтальном процессе: передает обновление рабочему
+    процессу вместо обработки на месте.
+    """
+
+    def __init__(self, router: ShardRouter):
+        self.router = router
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        if isinstance(event, Update):
+            await self.router.dispatch_async(event.model_dump(mode="json", by_alias=True, exclude_none=True))
+        return None
+
+async def consume(queue, handle: Callable[[Dict[str, Any]], Awaitable[Any]], max_in_flight: int = 1) -> int:
+    """
+    Читает обновления из очереди рабочего процесса и передает их handle до сигнала остановки (None).
+
+    При max_in_flight > 1 одновременно обрабатывается до max_in_flight обновлений; задачи
+    создаются в порядке очереди, поэтому middleware, упорядочивающий обновления чата, видит их
+    в том же порядке. Перед возвратом дожидается всех начатых обработок.
+
+    Возвращает:
+        int: Количество обработанных обновлений.
+    """
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(max(1, max_in_flight))
+    in_flight = set()
+    handled = 0
+
+    async def process(update: Dict[str, Any]) -> None:
+        nonlocal handled
+        try:
+            await handle(update)
+        except Exception as e:
+            logger.error(f"Ошибка при обработке обновления {update.get('update_id')} в рабочем процессе: {str(e)}")
+        finally:
+            handled += 1
+            slots.release()
+
+    while True:
+        update = await loop.run_in_executor(None, queue.get)
+        if update is None:
+            break
+        await slots.acquire()
+        if max_in_flight <= 1:
+            await process(update)
+            continue
+        task = asyncio.create_task(process(update))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+    if in_flight:
+        await asyncio.gather(*in_flight)
+    return handled
@@ -0,0 +1,108 @@
+# Путь файла: bot/modules/spam_words.py
+
+import hashlib
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Tuple
+
+def normalize_text(text: str, case_sensitive: bool = False) -> str:
+    """Нормализует текст для сравнения: NFKC и (по умолчанию) casefold."""
+    normalized = unicodedata.normalize("NFKC", text)
+    return normalized if case_sensitive else normalized.casefold()
+
+def get_message_hash(text: str) -> str:
+    """Генерирует хэш сообщения для сравнения (NFKC + casefold)."""
+    return hashlib.md5(normalize_text(text.strip()).encode()).hexdigest()
+
+class SpamWordsMatcher:
+    """
+    Автомат Ахо–Корасик для поиска запрещенных слов.
+
+    Строится один раз на список слов; поиск выполняется за один проход по тексту,
+    поэтому время проверки не зависит от размера словаря. Слова и текст нормализуются
+    так же, как в get_message_hash (NFKC + casefold), а найденные совпадения
+    возвращаются в исходном написании из настроек.
+    """
+
+    __slots__ = ("case_sensitive", "words", "_goto", "_fail", "_output")
+
+    def __init__(self, words: Iterable[str], case_sensitive: bool = False):
+        self.case_sensitive = case_sensitive
+        self.words: List[str] = []
+        # Узел 0 — корень; _output хранит индексы слов, заканчивающихся в узле (с учетом суффиксных ссылок)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Tuple[int, ...]] = [()]
+        seen = set()
+        for word in words:
+            pattern = normalize_text(str(word).strip(), case_sensitive)
+            if not pattern or pattern in seen:
+                continue
+            seen.add(pattern)
+            self._add(pattern, len(self.words))
+            self.words.append(str(word).strip())
+        self._build()
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def _add(self, pattern: str, index: int) -> None:
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            node = next_node
+        self._output[node] = (index,)
+
+    def _build(self) -> None:
+        """Вычисляет суффиксные ссылки обходом в ширину."""
+        goto, fail, output = self._goto, self._fail, self._output
+        queue = list(goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for char, child in goto[node].items():
+                queue.append(child)
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                target = goto[state].get(char, 0)
+                fail[child] = target if target != child else 0
+                if output[fail[child]]:
+                    output[child] = output[child] + output[fail[child]]
+
+    def _scan(self, text: str, first_only: bool) -> List[int]:
+        goto, fail, output = self._goto, self._fail, self._output
+        found: List[int] = []
+        seen = set()
+        node = 0
+        for char in normalize_text(text, self.case_sensitive):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                for index in output[node]:
+                    if index not in seen:
+                        seen.add(index)
+                        found.append(index)
+                if first_only:
+                    break
+        return found
+
+    def search(self, text: str) -> Optional[str]:
+        """Возвращает первое найденное запрещенное слово или None."""
+        if not self.words:
+            return None
+        found = self._scan(text, first_only=True)
+        return self.words[found[0]] if found else None
+
+    def find_all(self, text: str) -> List[str]:
+        """Возвращает все различные запрещенные слова в порядке первого появления в тексте."""
+        if not self.words:
+            return []
+        return [self.words[index] for index in self._scan(text, first_only=False)]
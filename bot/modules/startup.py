@@ -0,0 +1,136 @@
+# Путь файла: bot/modules/startup.py
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from loguru import logger
+
+# Момент запуска процесса; bot/main.py передает время, записанное до импорта зависимостей
+PROCESS_STARTED_AT = time.monotonic()
+# Повторы фоновой стадии после ошибки
+STAGE_RETRIES = 3
+STAGE_RETRY_DELAY = 5.0
+
+# Стадии запуска: имя -> {"status", "started_at", "finished_at", "attempts", "error"}
+_stages: Dict[str, Dict] = {}
+_tasks: Dict[str, asyncio.Task] = {}
+_ready_at: Optional[float] = None
+_first_update_at: Optional[float] = None
+
+def set_process_start(moment: float) -> None:
+    """Задает момент запуска процесса (time.monotonic()), от которого отсчитываются метрики запуска."""
+    global PROCESS_STARTED_AT
+    PROCESS_STARTED_AT = moment
+
+def _since_start(moment: Optional[float]) -> Optional[float]:
+    return None if moment is None else round(moment - PROCESS_STARTED_AT, 3)
+
+async def run_stage(name: str, func: Callable[[], Awaitable[Any]]) -> Any:
+    """Выполняет обязательную стадию запуска в текущей задаче и записывает ее длительность."""
+    stage = _stages[name] = {"status": "running", "started_at": time.monotonic(), "finished_at": None, "attempts": 1, "error": None}
+    try:
+        result = await func()
+    except Exception as e:
+        stage["status"] = "failed"
+        stage["error"] = str(e)
+        raise
+    finally:
+        stage["finished_at"] = time.monotonic()
+    stage["status"] = "done"
+    logger.info(f"Стадия запуска {name} завершена за {stage['finished_at'] - stage['started_at']:.3f} сек")
+    return result
+
+def supervise(name: str, func: Callable[[], Awaitable[Any]], retries: int = STAGE_RETRIES,
+              retry_delay: float = STAGE_RETRY_DELAY) -> asyncio.Task:
+    """
+    Запускает фоновую стадию под наблюдением: состояние и ошибки записываются в get_state(),
+    после ошибки стадия перезапускается до retries раз с паузой retry_delay.
+    """
+    stage = _stages[name] = {"status": "pending", "started_at": None, "finished_at": None, "attempts": 0, "error": None}
+
+    async def runner() -> None:
+        stage["started_at"] = time.monotonic()
+        while True:
+            stage["attempts"] += 1
+            stage["status"] = "running"
+            try:
+                await func()
+            except asyncio.CancelledError:
+                stage["status"] = "cancelled"
+                raise
+            except Exception as e:
+                stage["error"] = str(e)
+                logger.error(f"Фоновая стадия {name} завершилась с ошибкой (попытка {stage['attempts']}): {str(e)}")
+                if stage["attempts"] > retries:
+                    stage["status"] = "failed"
+                    stage["finished_at"] = time.monotonic()
+                    return
+                stage["status"] = "retrying"
+                await asyncio.sleep(retry_delay)
+                continue
+            stage["status"] = "done"
+            stage["finished_at"] = time.monotonic()
+            logger.info(f"Фоновая стадия {name} завершена за {stage['finished_at'] - stage['started_at']:.1f} сек")
+            return
+
+    task = _tasks[name] = asyncio.create_task(runner())
+    return task
+
+def mark_ready() -> None:
+    """Отмечает готовность принимать обновления (обязательные стадии пройдены)."""
+    global _ready_at
+    _ready_at = time.monotonic()
+    logger.info(f"Бот готов принимать обновления через {_since_start(_ready_at)} сек после запуска процесса")
+
+def is_ready() -> bool:
+    """Проверяет, пройдены ли обязательные стадии запуска."""
+    return _ready_at is not None
+
+def record_first_update() -> None:
+    """Записывает момент обработки первого обновления (метрика времени до первого обновления)."""
+    global _first_update_at
+    if _first_update_at is None:
+        _first_update_at = time.monotonic()
+        logger.info(f"Первое обновление обработано через {_since_start(_first_update_at)} сек после запуска процесса")
+
+def get_state() -> Dict:
+    """
+    Возвращает состояние запуска: готовность, время до готовности и до первого обновления (секунды
+    от старта процесса) и состояние стадий.
+    """
+    stages = {}
+    for name, stage in _stages.items():
+        started, finished = stage["started_at"], stage["finished_at"]
+        stages[name] = {
+            "status": stage["status"],
+            "attempts": stage["attempts"],
+            "error": stage["error"],
+            "duration": None if started is None else round((finished or time.monotonic()) - started, 3)
+        }
+    return {
+        "ready": is_ready(),
+        "ready_after": _since_start(_ready_at),
+        "first_update_after": _since_start(_first_update_at),
+        "stages": stages
+    }
+
+async def stop() -> None:
+    """Отменяет незавершенные фоновые стадии."""
+    tasks = [task for task in _tasks.values() if not task.done()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _tasks.clear()
+
+class FirstUpdateMiddleware(BaseMiddleware):
+    """Внешний middleware обновлений: фиксирует время обработки первого обновления."""
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        try:
+            return await handler(event, data)
+        finally:
+            if _first_update_at is None:
+                record_first_update()
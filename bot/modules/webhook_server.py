@@ -0,0 +1,147 @@
+# Путь файла: bot/modules/webhook_server.py
+
+import asyncio
+import os
+import signal
+from typing import Any, Dict, Optional
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+from loguru import logger
+from . import startup
+
+# Адрес для setWebhook; если не задан, сервер работает локально без регистрации в Telegram
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+# Сколько обновлений обрабатывается одновременно и сколько может ждать обработки
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", "50"))
+WEBHOOK_MAX_PENDING = int(os.getenv("WEBHOOK_MAX_PENDING", "1000"))
+# Сколько секунд при остановке ждать завершения обрабатываемых обновлений
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "10"))
+
+class ConcurrentRequestHandler(SimpleRequestHandler):
+    """
+    Обработчик вебхука с ограниченной параллельностью.
+
+    Принимает одно обновление или список обновлений (пакет, например записанные обновления
+    для локального воспроизведения), сразу отвечает и обрабатывает их в фоне не более чем
+    concurrency одновременно. Если в обработке уже max_pending обновлений, запрос отклоняется
+    с 503, и Telegram повторит доставку позже. При остановке новые обновления не принимаются,
+    а начатые дорабатываются.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, concurrency: int = WEBHOOK_CONCURRENCY,
+                 max_pending: int = WEBHOOK_MAX_PENDING, secret_token: Optional[str] = WEBHOOK_SECRET, **data: Any):
+        super().__init__(dispatcher, bot, handle_in_background=True, secret_token=secret_token, **data)
+        self.max_pending = max_pending
+        self.accepting = True
+        self.handled = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    def pending(self) -> int:
+        """Количество принятых, но еще не обработанных обновлений."""
+        return len(self._background_feed_update_tasks)
+
+    async def _background_feed_update(self, bot: Bot, update: Dict[str, Any]) -> None:
+        async with self._semaphore:
+            try:
+                await super()._background_feed_update(bot, update)
+            except Exception as e:
+                logger.error(f"Ошибка при обработке обновления {update.get('update_id')}: {str(e)}")
+            finally:
+                self.handled += 1
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        if not self.accepting:
+            return web.json_response({"ok": False, "description": "shutting down"}, status=503)
+        payload = await request.json(loads=bot.session.json_loads)
+        updates = payload if isinstance(payload, list) else [payload]
+        if self.pending() + len(updates) > self.max_pending:
+            logger.warning(f"Вебхук перегружен: в обработке {self.pending()} обновлений, запрос отклонен")
+            return web.json_response({"ok": False, "description": "too many pending updates"}, status=503)
+        for update in updates:
+            task = asyncio.create_task(self._background_feed_update(bot=bot, update=update))
+            self._background_feed_update_tasks.add(task)
+            task.add_done_callback(self._background_feed_update_tasks.discard)
+        return web.json_response({"ok": True, "accepted": len(updates)}, dumps=bot.session.json_dumps)
+
+    async def drain(self, timeout: float = WEBHOOK_DRAIN_TIMEOUT) -> None:
+        """Прекращает прием обновлений и дожидается обработки принятых; по таймауту отменяет оставшиеся."""
+        self.accepting = False
+        tasks = list(self._background_feed_update_tasks)
+        if not tasks:
+            return
+        logger.info(f"Ожидание обработки {len(tasks)} обновлений перед остановкой вебхука")
+        done, not_done = await asyncio.wait(tasks, timeout=timeout)
+        for task in not_done:
+            task.cancel()
+        if not_done:
+            await asyncio.gather(*not_done, return_exceptions=True)
+            logger.warning(f"Не дождались обработки {len(not_done)} обновлений за {timeout} сек")
+
+    async def close(self) -> None:
+        # Сессию бота закрывает lifespan в bot/main.py после остальных остановок
+        await self.drain()
+
+# Ключ приложения, под которым хранится обработчик вебхука
+WEBHOOK_HANDLER_KEY = web.AppKey("webhook_handler", ConcurrentRequestHandler)
+
+async def _health(request: web.Request) -> web.Response:
+    state = startup.get_state()
+    return web.json_response(state, status=200 if state["ready"] else 503)
+
+def build_app(dispatcher: Dispatcher, bot: Bot, path: str = WEBHOOK_PATH, **handler_kwargs: Any) -> web.Application:
+    """Создает aiohttp-приложение с вебхуком и проверкой готовности GET /healthz."""
+    app = web.Application()
+    handler = ConcurrentRequestHandler(dispatcher, bot, **handler_kwargs)
+    handler.register(app, path=path)
+    app[WEBHOOK_HANDLER_KEY] = handler
+    app.router.add_get("/healthz", _health)
+    setup_application(app, dispatcher, bot=bot)
+    return app
+
+async def run_webhook(dispatcher: Dispatcher, bot: Bot, host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT,
+                      path: str = WEBHOOK_PATH) -> None:
+    """
+    Запускает локальный сервер вебхука и работает до SIGINT/SIGTERM или отмены задачи.
+    Если задан WEBHOOK_URL, регистрирует вебхук в Telegram; без него сервер принимает
+    обновления только локально. Сигналы обрабатываются так же, как в start_polling aiogram.
+    """
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    signals = []
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+            signals.append(sig)
+        except (NotImplementedError, RuntimeError):  # Windows или не главный поток
+            pass
+    app = build_app(dispatcher, bot, path=path)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info(f"Сервер вебхука запущен на {host}:{port}{path}")
+    try:
+        if WEBHOOK_URL:
+            await bot.set_webhook(
+                WEBHOOK_URL.rstrip("/") + path,
+                secret_token=WEBHOOK_SECRET,
+                max_connections=min(WEBHOOK_CONCURRENCY, 100),
+                allowed_updates=dispatcher.resolve_used_update_types(),
+                drop_pending_updates=False
+            )
+            logger.info(f"Вебхук зарегистрирован: {WEBHOOK_URL.rstrip('/') + path}")
+        else:
+            logger.info("WEBHOOK_URL не задан, вебхук в Telegram не регистрируется")
+        await stop.wait()
+        logger.info("Получен сигнал остановки вебхука")
+    finally:
+        for sig in signals:
+            loop.remove_signal_handler(sig)
+        # cleanup вызывает on_shutdown: обработчик перестает принимать обновления и дорабатывает начатые
+        await runner.cleanup()
+        logger.info("Сервер вебхука остановлен")
@@ -0,0 +1,97 @@
+# scripts/bench_antispam_stats.py
+
+"""
+Сравнение способов подсчета статистики антиспама чата (get_antispam_stats) на 100 тыс. участников:
+- прежний: db.users.find({"group_ids": chat_id}) и подсчет в Python по полным документам;
+- агрегация по users с проекцией только поддокументов чата (пока memberships не заполнена);
+- агрегация по memberships (строки только этого чата).
+
+Данные создаются во временной базе и удаляются после замера. Нужен запущенный MongoDB.
+
+Запуск: python -m scripts.bench_antispam_stats [--uri mongodb://localhost:27017] [--members 100000]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from motor.motor_asyncio import AsyncIOMotorClient
+from bot.modules.no_sql import memberships
+
+CHAT_ID = -1001000000000
+BENCH_DB = "kumi_pulse_bench_stats"
+
+def make_user(rng: random.Random, user_id: int, other_chats: int, now: float):
+    """Пользователь чата CHAT_ID, состоящий еще в other_chats чатах с предупреждениями и мутами."""
+    chats = [CHAT_ID] + [CHAT_ID - index for index in range(1, other_chats + 1)]
+    warnings, mutes, bans = {}, {}, {}
+    for chat_id in chats:
+        if rng.random() < 0.3:
+            warnings[str(chat_id)] = [
+                {"reason": "Спам", "issued_by": 1, "issued_at": now} for _ in range(rng.randint(1, 3))
+            ]
+        if rng.random() < 0.05:
+            mutes[str(chat_id)] = {"is_muted": True, "until": now + rng.choice((-3600, 3600)), "reason": "Флуд"}
+        if rng.random() < 0.02:
+            bans[str(chat_id)] = {"is_banned": True, "until": 0.0, "reason": "Реклама"}
+    user = {
+        "user_id": user_id, "username": f"user{user_id}", "display_name": f"Пользователь {user_id}",
+        "group_ids": chats, "last_active": now, "warnings": warnings, "mutes": mutes, "bans": bans,
+        "activity_count": {str(chat_id): rng.randint(0, 500) for chat_id in chats}
+    }
+    return user, memberships.membership_from_user(user, CHAT_ID)
+
+async def python_scan(db):
+    stats = {"warnings": 0, "mutes": 0, "bans": 0, "users": 0}
+    async for user in db.users.find({"group_ids": CHAT_ID}):
+        stats["users"] += 1
+        stats["warnings"] += len(user.get("warnings", {}).get(str(CHAT_ID), []))
+        stats["mutes"] += 1 if user.get("mutes", {}).get(str(CHAT_ID), {}).get("is_muted", False) else 0
+        stats["bans"] += 1 if user.get("bans", {}).get(str(CHAT_ID), {}).get("is_banned", False) else 0
+    return stats
+
+async def aggregate(collection, pipeline):
+    result = await collection.aggregate(pipeline).to_list(length=1)
+    return {key: result[0][key] for key in ("warnings", "mutes", "bans", "users")} if result else {}
+
+async def measure(name: str, func, repeats: int) -> None:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        stats = await func()
+        timings.append(time.perf_counter() - start)
+    print(f"{name:34s} | лучшее: {min(timings) * 1000:9.1f} мс | среднее: {sum(timings) / repeats * 1000:9.1f} мс | {stats}")
+
+async def run(uri: str, members: int, other_chats: int, repeats: int) -> None:
+    client = AsyncIOMotorClient(uri)
+    db = client[BENCH_DB]
+    await client.drop_database(BENCH_DB)
+    try:
+        rng = random.Random(1)
+        now = time.time()
+        await db.users.create_index("group_ids")
+        await db.memberships.create_index([("chat_id", 1), ("user_id", 1)], unique=True)
+        for offset in range(0, members, 5000):
+            batch = [make_user(rng, user_id, other_chats, now) for user_id in range(offset + 1, min(offset + 5000, members) + 1)]
+            await db.users.insert_many([user for user, _ in batch], ordered=False)
+            await db.memberships.insert_many([membership for _, membership in batch], ordered=False)
+        print(f"Участников: {members}, других чатов у пользователя: {other_chats}, повторов: {repeats}")
+        # Прежний способ считал флаги is_muted/is_banned без учета until, поэтому муты могут различаться
+        await measure("Python: полные документы users", lambda: python_scan(db), repeats)
+        await measure("Агрегация по users (проекция)", lambda: aggregate(db.users, memberships.users_stats_pipeline(CHAT_ID, now)), repeats)
+        await measure("Агрегация по memberships", lambda: aggregate(db.memberships, memberships.stats_pipeline(CHAT_ID, now)), repeats)
+    finally:
+        await client.drop_database(BENCH_DB)
+        client.close()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--members", type=int, default=100_000)
+    parser.add_argument("--other-chats", type=int, default=10)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.uri, args.members, args.other_chats, args.repeats))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# scripts/bench_spam_words.py
+
+"""
+Сравнение поиска запрещенных слов: регулярное выражение (как в прежнем check_spam)
+против автомата Ахо–Корасик из bot/modules/spam_words.py.
+
+Запуск: python -m scripts.bench_spam_words [--messages 2000]
+"""
+
+import argparse
+import random
+import re
+import string
+import time
+from bot.modules.spam_words import SpamWordsMatcher
+
+SIZES = (10, 1_000, 50_000)
+ALPHABET = string.ascii_lowercase + "абвгдеёжзийклмнопрстуфхцчшщъыьэюя"
+
+def random_word(rng: random.Random) -> str:
+    return "".join(rng.choice(ALPHABET) for _ in range(rng.randint(5, 12)))
+
+def make_messages(rng: random.Random, words, count: int):
+    """Генерирует сообщения: ~10% содержат запрещенное слово."""
+    messages = []
+    for _ in range(count):
+        parts = [random_word(rng) for _ in range(rng.randint(5, 40))]
+        if rng.random() < 0.1:
+            parts.insert(rng.randrange(len(parts)), rng.choice(words).upper())
+        messages.append(" ".join(parts))
+    return messages
+
+def bench(size: int, message_count: int) -> None:
+    rng = random.Random(size)
+    words = [random_word(rng) for _ in range(size)]
+    messages = make_messages(rng, words, message_count)
+
+    start = time.perf_counter()
+    pattern = re.compile("|".join(re.escape(word) for word in words), re.IGNORECASE)
+    regex_build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matcher = SpamWordsMatcher(words)
+    ac_build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    regex_hits = sum(1 for text in messages if pattern.search(text))
+    regex_search = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ac_hits = sum(1 for text in messages if matcher.find_all(text))
+    ac_search = time.perf_counter() - start
+
+    print(
+        f"{size:>6} слов | regex: сборка {regex_build * 1000:8.1f} мс, "
+        f"поиск {regex_search / message_count * 1e6:8.1f} мкс/сообщ., совпадений {regex_hits:>5} | "
+        f"Ахо–Корасик: сборка {ac_build * 1000:8.1f} мс, "
+        f"поиск {ac_search / message_count * 1e6:8.1f} мкс/сообщ., совпадений {ac_hits:>5}"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=2000, help="Количество сообщений на замер")
+    args = parser.parse_args()
+    for size in SIZES:
+        bench(size, args.messages)
+
+if __name__ == "__main__":
+    main()
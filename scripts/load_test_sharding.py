@@ -0,0 +1,94 @@
+# scripts/load_test_sharding.py
+
+"""
+Нагрузочный тест распределения обновлений по рабочим процессам (bot/modules/sharding.py).
+
+Синтетические обновления из многих чатов проигрываются через ShardRouter сначала на 1 рабочий
+процесс, затем на N. Обработчик в рабочем процессе имитирует работу антиспама (поиск запрещенных
+слов Ахо–Корасик и хэш сообщения) и проверяет, что обновления каждого чата приходят по порядку.
+
+Запуск: python -m scripts.load_test_sharding [--updates 20000] [--chats 200] [--workers 4]
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import time
+from bot.modules import sharding
+from bot.modules.spam_words import SpamWordsMatcher, get_message_hash
+
+def make_updates(count: int, chats: int, seed: int = 1):
+    rng = random.Random(seed)
+    chat_ids = [-1001000000000 - index for index in range(chats)]
+    sequence = {chat_id: 0 for chat_id in chat_ids}
+    updates = []
+    for update_id in range(1, count + 1):
+        chat_id = rng.choice(chat_ids)
+        sequence[chat_id] += 1
+        text = " ".join(f"слово{rng.randint(0, 5000)}" for _ in range(rng.randint(5, 40)))
+        updates.append({
+            "update_id": update_id,
+            "message": {
+                "message_id": sequence[chat_id],
+                "date": 0,
+                "chat": {"id": chat_id, "type": "supergroup"},
+                "from": {"id": rng.randint(1, 10_000), "is_bot": False, "first_name": "Тест"},
+                "text": text
+            }
+        })
+    return updates
+
+def worker(index: int, queue, workers: int, results) -> None:
+    """Рабочий процесс: обрабатывает обновления и отправляет итог (количество, нарушения порядка)."""
+    matcher = SpamWordsMatcher([f"спам{number}" for number in range(2000)])
+    last_seen = {}
+    violations = 0
+
+    async def handle(update):
+        nonlocal violations
+        message = update["message"]
+        chat_id = message["chat"]["id"]
+        if message["message_id"] <= last_seen.get(chat_id, 0):
+            violations += 1
+        last_seen[chat_id] = message["message_id"]
+        for _ in range(20):
+            matcher.find_all(message["text"])
+            get_message_hash(message["text"])
+
+    handled = asyncio.run(sharding.consume(queue, handle))
+    results.put((index, handled, violations))
+
+def run(updates, workers: int) -> None:
+    router = sharding.ShardRouter(workers)
+    results = multiprocessing.get_context("spawn").Queue()
+    router.start(worker, results)
+    start = time.perf_counter()
+    for update in updates:
+        router.dispatch(update)
+    router.stop(timeout=600)
+    elapsed = time.perf_counter() - start
+    totals = [results.get() for _ in range(workers)]
+    handled = sum(item[1] for item in totals)
+    violations = sum(item[2] for item in totals)
+    per_worker = ", ".join(str(item[1]) for item in sorted(totals))
+    print(
+        f"Процессов: {workers:2d} | обработано: {handled} за {elapsed:6.2f} сек | "
+        f"{handled / elapsed:8.0f} обновл./сек | по процессам: {per_worker} | нарушений порядка: {violations}"
+    )
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--updates", type=int, default=20_000)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    args = parser.parse_args()
+    updates = make_updates(args.updates, args.chats)
+    print(f"Обновлений: {args.updates}, чатов: {args.chats}, ядер: {os.cpu_count()}")
+    run(updates, 1)
+    if args.workers > 1:
+        run(updates, args.workers)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+# scripts/replay_updates.py
+
+"""
+Воспроизведение записанных обновлений Telegram на локальном сервере вебхука (BOT_MODE=webhook)
+без подключения к Telegram.
+
+Файл: JSON Lines, по одному объекту Update на строку.
+Запуск: python -m scripts.replay_updates updates.jsonl [--url http://127.0.0.1:8080/webhook] [--batch 50] [--secret ...]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import aiohttp
+
+async def replay(path: str, url: str, batch: int, secret: str) -> None:
+    with open(path, encoding="utf-8") as file:
+        updates = [json.loads(line) for line in file if line.strip()]
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+    accepted = rejected = 0
+    start = time.perf_counter()
+    async with aiohttp.ClientSession(headers=headers) as session:
+        for offset in range(0, len(updates), batch):
+            chunk = updates[offset:offset + batch]
+            # Пакет отправляется списком; одиночное обновление — как его присылает Telegram
+            async with session.post(url, json=chunk if batch > 1 else chunk[0]) as response:
+                if response.status == 200:
+                    accepted += len(chunk)
+                else:
+                    rejected += len(chunk)
+                    print(f"Отклонено {len(chunk)} обновлений: HTTP {response.status} {await response.text()}")
+    elapsed = time.perf_counter() - start
+    print(f"Отправлено {len(updates)} обновлений за {elapsed:.2f} сек: принято {accepted}, отклонено {rejected}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("path")
+    parser.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    parser.add_argument("--batch", type=int, default=50)
+    parser.add_argument("--secret", default="")
+    args = parser.parse_args()
+    asyncio.run(replay(args.path, args.url, args.batch, args.secret))
+
+if __name__ == "__main__":
+    main()
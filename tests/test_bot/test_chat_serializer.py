@@ -0,0 +1,86 @@
+# Путь файла: tests/test_bot/test_chat_serializer.py
+
+import asyncio
+import pytest
+from aiogram.types import Chat, Update
+from bot.modules.chat_serializer import ChatSerializerMiddleware
+
+def make_update(update_id: int, user_id: int = 1, text: str = None) -> Update:
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "chat": {"id": -100, "type": "supergroup"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Тест"}, "text": text or f"сообщение {update_id}"
+        }
+    })
+
+@pytest.mark.asyncio
+async def test_same_chat_is_serialized_other_chats_run_in_parallel():
+    middleware = ChatSerializerMiddleware(queue_limit=100)
+    running = {}
+    overlaps = []
+    order = []
+
+    async def handler(event, data):
+        chat_id = data["event_chat"].id
+        running[chat_id] = running.get(chat_id, 0) + 1
+        if running[chat_id] > 1:
+            overlaps.append(chat_id)
+        await asyncio.sleep(0.01)
+        order.append((chat_id, event.update_id))
+        running[chat_id] -= 1
+
+    chats = [Chat(id=-100 - index, type="supergroup") for index in range(5)]
+    start = asyncio.get_running_loop().time()
+    await asyncio.gather(*(
+        middleware(handler, make_update(update_id), {"event_chat": chats[update_id % 5]})
+        for update_id in range(50)
+    ))
+    elapsed = asyncio.get_running_loop().time() - start
+    assert overlaps == []
+    for chat in chats:
+        ids = [update_id for chat_id, update_id in order if chat_id == chat.id]
+        assert ids == sorted(ids)
+    # 10 обновлений на чат по 10 мс: чаты идут параллельно, а не 50 подряд
+    assert elapsed < 0.4
+
+@pytest.mark.asyncio
+async def test_overflow_keeps_latest_message_per_sender():
+    async def is_privileged(chat_id, user_id):
+        return user_id == 9
+
+    overflow = []
+
+    async def overflow_handler(message, data):
+        overflow.append(message.message_id)
+
+    middleware = ChatSerializerMiddleware(queue_limit=2, overflow_handler=overflow_handler, is_privileged=is_privileged)
+    chat = Chat(id=-100, type="supergroup")
+    handled = []
+    release = asyncio.Event()
+
+    async def handler(event, data):
+        if not handled:
+            await release.wait()
+        handled.append(event.update_id)
+
+    callback = Update.model_validate({"update_id": 8, "callback_query": {
+        "id": "1", "chat_instance": "1", "from": {"id": 5, "is_bot": False, "first_name": "Тест"}, "data": "x"
+    }})
+    updates = [
+        make_update(1), make_update(2, user_id=2), make_update(3, user_id=3),
+        # Очередь заполнена: от отправителя 4 полностью обработается только последнее сообщение
+        make_update(4, user_id=4), make_update(5, user_id=4), make_update(6, user_id=4),
+        # Команды, обновления без сообщения и сообщения администрации не объединяются
+        make_update(7, user_id=4, text="/warn"), callback, make_update(9, user_id=9), make_update(10, user_id=9)
+    ]
+    tasks = []
+    for update in updates:
+        tasks.append(asyncio.create_task(middleware(handler, update, {"event_chat": chat})))
+        await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(*tasks)
+    assert handled == [1, 2, 3, 6, 7, 8, 9, 10]
+    assert overflow == [4, 5]
+    assert middleware.stats["merged"] == 2
+    assert middleware.backlog() == {}
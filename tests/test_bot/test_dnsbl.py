@@ -0,0 +1,53 @@
+# Путь файла: tests/test_bot/test_dnsbl.py
+
+import asyncio
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from bot.modules import dnsbl
+
+LISTED = {"spam.example"}
+
+@pytest_asyncio.fixture
+async def stub_dnsbl(monkeypatch):
+    """Локальный стаб DNSBL: 200 для доменов из LISTED, 404 для остальных, 'slow.example' отвечает с задержкой."""
+    requests = []
+
+    async def handler(request: web.Request) -> web.Response:
+        domain = request.query["domain"]
+        requests.append(domain)
+        if domain == "slow.example":
+            await asyncio.sleep(0.5)
+        return web.Response(status=200 if domain in LISTED else 404)
+
+    app = web.Application()
+    app.router.add_get("/query/dnsbl", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    monkeypatch.setattr(dnsbl, "DNSBL_URL", f"http://127.0.0.1:{port}/query/dnsbl")
+    monkeypatch.setattr(dnsbl, "DNSBL_REDIS_CACHE", False)
+    dnsbl.clear_cache()
+    yield requests
+    await dnsbl.close_session()
+    await runner.cleanup()
+
+@pytest.mark.asyncio
+async def test_listed_domain_found_and_cached(stub_dnsbl):
+    assert await dnsbl.find_listed_domain(["ok.example", "SPAM.example"], budget=2) == "spam.example"
+    assert await dnsbl.find_listed_domain(["ok.example", "spam.example"], budget=2) == "spam.example"
+    # Положительный и отрицательный вердикты взяты из кэша, повторных запросов нет
+    assert sorted(stub_dnsbl) == ["ok.example", "spam.example"]
+
+@pytest.mark.asyncio
+async def test_slow_lookup_fails_open_and_fills_cache(stub_dnsbl):
+    LISTED.add("slow.example")
+    try:
+        assert await dnsbl.find_listed_domain(["slow.example"], budget=0.05) is None
+        assert await dnsbl.check_domain("slow.example") is True
+        assert await dnsbl.find_listed_domain(["slow.example"], budget=0.05) == "slow.example"
+        assert stub_dnsbl.count("slow.example") == 1
+    finally:
+        LISTED.discard("slow.example")
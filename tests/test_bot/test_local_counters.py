@@ -0,0 +1,95 @@
+# Путь файла: tests/test_bot/test_local_counters.py
+
+from types import SimpleNamespace
+import pytest
+from bot.modules import local_counters
+
+class RecordingPipeline:
+    """Конвейер Redis, который записывает команды; execute может завершаться ошибкой."""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args))
+
+    async def execute(self):
+        self.redis.executed.append(self.commands)
+        if self.redis.fail:
+            raise ConnectionError("Redis недоступен")
+        # Для _load_state: пустое состояние в Redis
+        return [None, -2, [], -2, []]
+
+@pytest.fixture
+def redis(monkeypatch):
+    """Поддельный Redis и управляемые часы вместо time.time()."""
+    fake = SimpleNamespace(executed=[], fail=False, clock=1000.0)
+    fake.get_redis = lambda: SimpleNamespace(pipeline=lambda transaction=False: RecordingPipeline(fake))
+    monkeypatch.setattr(local_counters, "_redis_client", lambda: SimpleNamespace(
+        get_redis=fake.get_redis, FLOOD_BLOCK_DURATION=30, REPEATED_MESSAGES_TTL=3600
+    ))
+    monkeypatch.setattr(local_counters, "time", SimpleNamespace(time=lambda: fake.clock))
+    local_counters._states.clear()
+    yield fake
+    local_counters._states.clear()
+
+@pytest.mark.asyncio
+async def test_fixed_window_blocks_and_resets(redis):
+    results = [await local_counters.check_flood(-100, 1, limit=2, seconds=10) for _ in range(3)]
+    assert results == [(False, 0), (False, 0), (True, 30)]
+    state = local_counters._states[(-100, 1)]
+    assert state.block_until == 1030.0
+    # После окончания окна счет начинается заново
+    redis.clock += 10
+    assert await local_counters.check_flood(-100, 1, limit=2, seconds=10) == (False, 0)
+    assert state.count == 1
+
+@pytest.mark.asyncio
+async def test_sliding_window_counts_only_recent_messages(redis):
+    for _ in range(2):
+        assert await local_counters.check_flood(-100, 1, limit=2, seconds=10, mode="sliding") == (False, 0)
+        redis.clock += 4
+    # Три сообщения за 8 секунд — больше лимита
+    assert (await local_counters.check_flood(-100, 1, limit=2, seconds=10, mode="sliding"))[0] is True
+    redis.clock += 20
+    assert await local_counters.check_flood(-100, 1, limit=2, seconds=10, mode="sliding") == (False, 0)
+    assert len(local_counters._states[(-100, 1)].timestamps) == 1
+
+@pytest.mark.asyncio
+async def test_repeated_messages_trigger_and_clear_history(redis):
+    assert await local_counters.check_repeated_message(-100, 1, "a", limit=3) is False
+    assert await local_counters.check_repeated_message(-100, 1, "a", limit=3) is False
+    assert await local_counters.check_repeated_message(-100, 1, "a", limit=3) is True
+    assert not local_counters._states[(-100, 1)].hashes
+
+@pytest.mark.asyncio
+async def test_flush_writes_dirty_states_in_one_pipeline(redis):
+    await local_counters.check_flood(-100, 1, limit=5, seconds=10)
+    await local_counters.check_repeated_message(-100, 2, "a", limit=3)
+    local_counters._states[(-100, 3)] = local_counters._CounterState()
+    loads = len(redis.executed)
+    redis.fail = True
+    # Ошибка Redis: состояния остаются измененными до следующей попытки
+    assert await local_counters.flush() == 0
+    assert local_counters._states[(-100, 1)].dirty and local_counters._states[(-100, 2)].dirty
+    redis.fail = False
+    assert await local_counters.flush() == 2
+    assert len(redis.executed) == loads + 2
+    commands = redis.executed[-1]
+    assert ("set", ("spam:-100:1", 1)) in commands
+    assert ("lpush", ("antispam:-100:2:messages", "a")) in commands
+    # Неизмененное состояние не записывается, повторный сброс ничего не делает
+    assert not any("-100:3" in str(args) for _, args in commands)
+    assert await local_counters.flush() == 0
+
+@pytest.mark.asyncio
+async def test_evict_idle_keeps_dirty_states(redis):
+    await local_counters.check_flood(-100, 1, limit=5, seconds=10)
+    await local_counters.check_flood(-100, 2, limit=5, seconds=10)
+    await local_counters.flush()
+    await local_counters.check_flood(-100, 2, limit=5, seconds=10)
+    redis.clock += local_counters.LOCAL_COUNTERS_IDLE_TTL + 1
+    # Состояние 1 сброшено и простаивает, состояние 2 еще не записано в Redis
+    assert local_counters.evict_idle() == 1
+    assert list(local_counters._states) == [(-100, 2)]
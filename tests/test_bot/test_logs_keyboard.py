@@ -0,0 +1,26 @@
+# Путь файла: tests/test_bot/test_logs_keyboard.py
+
+from bot.keyboards.logs import pack_logs_callback, unpack_logs_callback, parse_log_filters, get_logs_pagination_menu
+
+def test_callback_fits_telegram_limit_and_round_trips():
+    data = pack_logs_callback("m", "o", "65f0c0ffee0123456789abcd", "clear_warnings", 9_999_999_999_999)
+    assert len(data.encode()) <= 64
+    assert unpack_logs_callback(data) == {
+        "view": "m", "direction": "older", "cursor": "65f0c0ffee0123456789abcd",
+        "action": "clear_warnings", "user_id": 9_999_999_999_999
+    }
+    assert unpack_logs_callback(pack_logs_callback("s", "n", "65f0c0ffee0123456789abcd"))["user_id"] is None
+    assert unpack_logs_callback("mlog:m:o:65f0c0ffee0123456789abcd:drop_table:-") is None
+    assert unpack_logs_callback("mod_logs") is None
+
+def test_filters_and_navigation_buttons():
+    assert parse_log_filters(["Mute", "12345"]) == ("mute", 12345)
+    assert parse_log_filters([]) == (None, None)
+    logs = [{"_id": "65f0c0ffee0123456789abc1"}, {"_id": "65f0c0ffee0123456789abc2"}]
+    first_page = get_logs_pagination_menu("m", logs, has_older=True, has_newer=False)
+    assert [button.text for button in first_page.inline_keyboard[0]] == ["Старше ➡️"]
+    assert unpack_logs_callback(first_page.inline_keyboard[0][0].callback_data)["cursor"] == "65f0c0ffee0123456789abc2"
+    middle_page = get_logs_pagination_menu("m", logs, has_older=True, has_newer=True, action="ban")
+    newer = unpack_logs_callback(middle_page.inline_keyboard[0][0].callback_data)
+    assert (newer["direction"], newer["cursor"], newer["action"]) == ("newer", "65f0c0ffee0123456789abc1", "ban")
+    assert get_logs_pagination_menu("m", logs, has_older=False, has_newer=False) is None
@@ -0,0 +1,47 @@
+# Путь файла: tests/test_bot/test_memberships.py
+
+import pytest
+from bot.modules.no_sql import memberships
+
+def test_backfill_fills_in_without_overwriting_live_fields():
+    user = {
+        "user_id": 7, "username": "anna", "display_name": "Анна", "last_active": 100.0, "group_ids": [-100, -200],
+        "activity_count": {"-100": 42}, "warnings": {"-100": [{"reason": "Спам", "issued_at": 50.0}]},
+        "mutes": {"-100": {"is_muted": True, "until": 500.0}}
+    }
+    operations = memberships.backfill_operations(user)
+    assert [operation._filter for operation in operations] == [{"chat_id": -100, "user_id": 7}, {"chat_id": -200, "user_id": 7}]
+    assert all(operation._upsert for operation in operations)
+    fields = operations[0]._doc[0]["$set"]
+    # Счетчик и время активности дополняются максимумом, а не перезаписываются снимком users
+    assert fields["activity"] == {"$max": [{"$ifNull": ["$activity", 0]}, 42]}
+    assert fields["last_active"] == {"$max": [{"$ifNull": ["$last_active", 0]}, 100.0]}
+    # Мут из users записывается, только если в memberships его еще нет
+    assert fields["mute"] == {"$ifNull": ["$mute", {"$literal": {"is_muted": True, "until": 500.0}}]}
+    # К предупреждениям из users добавляются только записанные в memberships позже
+    history, live = fields["warnings"]["$concatArrays"]
+    assert history == {"$literal": [{"reason": "Спам", "issued_at": 50.0}]}
+    assert live["$filter"]["cond"]["$gt"][1] == 50.0
+    other_chat = operations[1]._doc[0]["$set"]
+    assert "activity" not in other_chat and "warnings" not in other_chat and "mute" not in other_chat
+
+@pytest.mark.asyncio
+async def test_failed_flush_is_merged_back_into_pending(monkeypatch):
+    memberships._pending.clear()
+
+    class FailingCollection:
+        async def bulk_write(self, operations, ordered):
+            # Пока шла запись, пришло новое сообщение того же пользователя
+            memberships.record_activity(-100, 7, "anna", "Анна", False, 200.0, activity=1)
+            raise ConnectionError("MongoDB недоступна")
+
+    async def get_collection():
+        return FailingCollection()
+
+    monkeypatch.setattr(memberships, "get_memberships_collection", get_collection)
+    memberships.record_activity(-100, 7, "anna", "Анна", False, 100.0, activity=2)
+    assert await memberships.flush() == 0
+    entry = memberships._pending[(-100, 7)]
+    assert entry["$inc"] == {"activity": 3}
+    assert entry["$set"]["last_active"] == 200.0
+    memberships._pending.clear()
@@ -0,0 +1,37 @@
+# Путь файла: tests/test_bot/test_name_resolver.py
+
+import pytest
+from bot.modules import name_resolver
+from bot.modules.name_resolver import NameCache
+
+def test_cache_evicts_least_recently_used_and_expires():
+    cache = NameCache(max_size=2, ttl=60)
+    cache.set(1, "Первый")
+    cache.set(2, "Второй")
+    assert cache.get(1) == "Первый"
+    cache.set(3, "Третий")
+    assert cache.get(2) is None
+    assert cache.get(1) == "Первый"
+    assert len(cache) == 2
+    expired = NameCache(max_size=2, ttl=0)
+    expired.set(1, "Первый")
+    assert expired.get(1) is None
+
+@pytest.mark.asyncio
+async def test_names_are_loaded_in_one_query_and_cached(monkeypatch):
+    name_resolver.name_cache.clear()
+    queries = []
+
+    async def fake_fetch(user_ids):
+        queries.append(set(user_ids))
+        users = {1: {"user_id": 1, "display_name": "Анна"}, 2: {"user_id": 2, "username": "boris"}}
+        return {user_id: name_resolver.display_name_of(users[user_id]) for user_id in user_ids if user_id in users}
+
+    monkeypatch.setattr(name_resolver, "_fetch_names", fake_fetch)
+    names = await name_resolver.resolve_display_names([1, 2, 3, 1, 2])
+    assert names == {1: "Анна", 2: "@boris", 3: "3"}
+    assert queries == [{1, 2, 3}]
+    await name_resolver.resolve_display_names([1, 2, 3])
+    # Известные имена берутся из кэша, повторно запрашивается только неизвестный пользователь
+    assert queries[1:] == [{3}]
+    name_resolver.name_cache.clear()
@@ -0,0 +1,94 @@
+# Путь файла: tests/test_bot/test_send_queue.py
+
+import asyncio
+import time
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from bot.modules import send_queue
+
+@pytest.mark.asyncio
+async def test_burst_is_enqueued_without_blocking(monkeypatch):
+    monkeypatch.setattr(send_queue, "GROUP_RATE", 1000)
+    monkeypatch.setattr(send_queue, "_global_bucket", send_queue.TokenBucket(1000, 1000))
+    monkeypatch.setattr(send_queue, "SEND_QUEUE_CHAT_LIMIT", 500)
+    sent = []
+
+    async def reply(text):
+        sent.append(text)
+        return text
+
+    start = time.monotonic()
+    futures = [send_queue.enqueue(-100123, reply, f"msg {index}") for index in range(200)]
+    # Постановка 200 ответов не ждет ни сети, ни лимитов
+    assert time.monotonic() - start < 0.1
+    await asyncio.gather(*futures)
+    # Порядок внутри чата сохраняется
+    assert sent == [f"msg {index}" for index in range(200)]
+    await send_queue.drain()
+
+@pytest.mark.asyncio
+async def test_retry_after_is_handled_in_queue():
+    calls = []
+
+    async def restrict():
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise TelegramRetryAfter(method=None, message="Flood control exceeded", retry_after=0)
+        return True
+
+    assert await send_queue.enqueue(-100456, restrict, kind="action") is True
+    assert len(calls) == 2
+    await send_queue.drain()
+
+@pytest.mark.asyncio
+async def test_actions_do_not_wait_behind_replies(monkeypatch):
+    monkeypatch.setattr(send_queue, "GROUP_RATE", 1000)
+    release = asyncio.Event()
+
+    async def slow_reply(text):
+        await release.wait()
+        return text
+
+    async def delete():
+        return "deleted"
+
+    replies = [send_queue.enqueue(-100789, slow_reply, f"msg {index}") for index in range(5)]
+    # Удаление выполняется сразу, хотя ответы этого чата еще ждут отправки
+    assert await asyncio.wait_for(send_queue.enqueue(-100789, delete, kind="action"), timeout=1) == "deleted"
+    release.set()
+    assert await asyncio.gather(*replies) == [f"msg {index}" for index in range(5)]
+    await send_queue.drain()
+
+@pytest.mark.asyncio
+async def test_call_retry_after_waits_only_for_its_chat():
+    calls = []
+
+    async def ban_chat_member(chat_id, user_id):
+        calls.append(chat_id)
+        if len(calls) == 1:
+            raise TelegramRetryAfter(method=None, message="Flood control exceeded", retry_after=0)
+        return True
+
+    assert await send_queue.call(ban_chat_member, -100321, 7) is True
+    assert calls == [-100321, -100321]
+    # RetryAfter в конкретном чате не ставит на паузу весь бот
+    assert send_queue._global_paused_until <= time.monotonic()
+
+@pytest.mark.asyncio
+async def test_enqueue_call_does_not_wait_for_retry_after():
+    calls = []
+
+    async def send_message(chat_id, text):
+        calls.append(text)
+        if len(calls) == 1:
+            raise TelegramRetryAfter(method=None, message="Flood control exceeded", retry_after=0.2)
+        return text
+
+    start = time.monotonic()
+    future = send_queue.enqueue_call(send_message, -100654, "меню")
+    # Вызывающий обработчик не ждет ни отправки, ни паузы после RetryAfter
+    assert time.monotonic() - start < 0.05
+    assert not future.done()
+    assert await future == "меню"
+    assert calls == ["меню", "меню"]
+    await send_queue.drain()
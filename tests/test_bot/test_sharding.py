@@ -0,0 +1,39 @@
+# Путь файла: tests/test_bot/test_sharding.py
+
+import asyncio
+import queue as queue_module
+import pytest
+from bot.modules import sharding
+
+def test_chat_id_is_extracted_from_updates():
+    assert sharding.extract_chat_id({"update_id": 1, "message": {"chat": {"id": -100}}}) == -100
+    assert sharding.extract_chat_id({"update_id": 2, "callback_query": {"message": {"chat": {"id": -200}}}}) == -200
+    assert sharding.extract_chat_id({"update_id": 3, "my_chat_member": {"chat": {"id": -300}}}) == -300
+    assert sharding.extract_chat_id({"update_id": 4, "inline_query": {"id": "1"}}) is None
+
+def test_chat_always_maps_to_the_same_worker():
+    chats = [-1001000000000 - index for index in range(1000)]
+    shards = [sharding.shard_for(chat_id, 4) for chat_id in chats]
+    assert shards == [sharding.shard_for(chat_id, 4) for chat_id in chats]
+    assert set(shards) == {0, 1, 2, 3}
+    assert sharding.shard_for(None, 4) == 0
+
+@pytest.mark.asyncio
+async def test_consume_runs_updates_concurrently_and_waits_for_all():
+    queue = queue_module.Queue()
+    for update_id in range(10):
+        queue.put({"update_id": update_id})
+    queue.put(None)
+    running = 0
+    peak = 0
+
+    async def handle(update):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    assert await sharding.consume(queue, handle, max_in_flight=4) == 10
+    assert peak == 4
+    assert running == 0
@@ -0,0 +1,19 @@
+# Путь файла: tests/test_bot/test_spam_words.py
+
+from bot.modules.spam_words import SpamWordsMatcher
+
+def test_find_all_reports_every_matched_word():
+    matcher = SpamWordsMatcher(["казино", "he", "she", "hers"])
+    assert matcher.find_all("Лучшее КАЗИНО: ushers") == ["казино", "she", "he", "hers"]
+
+def test_nfkc_and_casefold_normalization():
+    matcher = SpamWordsMatcher(["strasse", "crypto"])
+    # Полноширинные символы приводятся NFKC, "ß" раскрывается casefold
+    assert matcher.find_all("ＣＲＹＰＴＯ и Straße") == ["crypto", "strasse"]
+
+def test_case_sensitive_and_empty_words():
+    matcher = SpamWordsMatcher(["Spam", "", "  "], case_sensitive=True)
+    assert len(matcher) == 1
+    assert matcher.search("spam") is None
+    assert matcher.search("Spam!") == "Spam"
+    assert SpamWordsMatcher([]).find_all("anything") == []
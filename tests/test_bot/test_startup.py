@@ -0,0 +1,53 @@
+# Путь файла: tests/test_bot/test_startup.py
+
+import time
+import pytest
+from bot.modules import startup
+
+@pytest.mark.asyncio
+async def test_supervised_stage_is_retried():
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise RuntimeError("Временная ошибка")
+
+    await startup.supervise("flaky", flaky, retries=2, retry_delay=0)
+    stage = startup.get_state()["stages"]["flaky"]
+    assert stage["status"] == "done"
+    assert stage["attempts"] == 2
+    await startup.stop()
+
+@pytest.mark.asyncio
+async def test_first_update_is_recorded(monkeypatch):
+    monkeypatch.setattr(startup, "_first_update_at", None)
+
+    async def handler(event, data):
+        return "ok"
+
+    middleware = startup.FirstUpdateMiddleware()
+    assert await middleware(handler, object(), {}) == "ok"
+    first = startup.get_state()["first_update_after"]
+    assert first is not None and first >= 0
+    await middleware(handler, object(), {})
+    assert startup.get_state()["first_update_after"] == first
+
+@pytest.mark.asyncio
+async def test_failing_stage_is_marked_failed_after_retries():
+    async def broken():
+        raise RuntimeError("Не удалось синхронизировать участников 1 чатов")
+
+    await startup.supervise("broken", broken, retries=1, retry_delay=0)
+    stage = startup.get_state()["stages"]["broken"]
+    assert stage["status"] == "failed"
+    assert stage["attempts"] == 2
+    assert "синхронизировать" in stage["error"]
+    await startup.stop()
+
+def test_metrics_count_from_process_start(monkeypatch):
+    monkeypatch.setattr(startup, "_ready_at", None)
+    monkeypatch.setattr(startup, "PROCESS_STARTED_AT", startup.PROCESS_STARTED_AT)
+    startup.set_process_start(time.monotonic() - 10)
+    startup.mark_ready()
+    assert startup.get_state()["ready_after"] >= 10
@@ -0,0 +1,81 @@
+# Путь файла: tests/test_bot/test_webhook_server.py
+
+import asyncio
+import os
+import signal
+import aiohttp
+import pytest
+import pytest_asyncio
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message
+from aiohttp import web
+from bot.modules import webhook_server
+
+def make_update(update_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": -100123, "type": "supergroup", "title": "Тест"},
+            "from": {"id": 42, "is_bot": False, "first_name": "Тест"},
+            "text": f"сообщение {update_id}"
+        }
+    }
+
+@pytest_asyncio.fixture
+async def webhook():
+    """Локальный сервер вебхука с диспетчером, который записывает обработанные сообщения."""
+    handled = []
+    router = Router()
+
+    @router.message()
+    async def record(message: Message):
+        await asyncio.sleep(0.05)
+        handled.append(message.text)
+
+    dispatcher = Dispatcher()
+    dispatcher.include_router(router)
+    bot = Bot(token="42:TEST")
+    app = webhook_server.build_app(dispatcher, bot, path="/webhook", concurrency=4, max_pending=10, secret_token="secret")
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    url = f"http://127.0.0.1:{runner.addresses[0][1]}/webhook"
+    yield url, app[webhook_server.WEBHOOK_HANDLER_KEY], handled, runner
+    await runner.cleanup()
+    await bot.session.close()
+
+@pytest.mark.asyncio
+async def test_batch_is_handled_and_drained(webhook):
+    url, handler, handled, runner = webhook
+    async with aiohttp.ClientSession(headers={"X-Telegram-Bot-Api-Secret-Token": "secret"}) as session:
+        async with session.post(url, json=[make_update(index) for index in range(1, 9)]) as response:
+            assert response.status == 200
+            assert (await response.json())["accepted"] == 8
+        # Больше max_pending — запрос отклоняется
+        async with session.post(url, json=[make_update(index) for index in range(10, 15)]) as response:
+            assert response.status == 503
+    # Остановка дорабатывает уже принятые обновления
+    await runner.cleanup()
+    assert sorted(handled) == sorted(f"сообщение {index}" for index in range(1, 9))
+    assert handler.pending() == 0
+
+@pytest.mark.asyncio
+async def test_wrong_secret_is_rejected(webhook):
+    url, _, handled, _ = webhook
+    async with aiohttp.ClientSession() as session:
+        async with session.post(url, json=make_update(1)) as response:
+            assert response.status == 401
+    assert handled == []
+
+@pytest.mark.asyncio
+async def test_run_webhook_stops_on_sigterm(monkeypatch):
+    monkeypatch.setattr(webhook_server, "WEBHOOK_URL", "")
+    bot = Bot(token="42:TEST")
+    task = asyncio.create_task(webhook_server.run_webhook(Dispatcher(), bot, host="127.0.0.1", port=0))
+    await asyncio.sleep(0.1)
+    os.kill(os.getpid(), signal.SIGTERM)
+    await asyncio.wait_for(task, timeout=5)
+    await bot.session.close()